@@ -0,0 +1,37 @@
+"""Add ScanProgress model
+
+Revision ID: 5b1f0c7e2a94
+Revises: d4df1e6dc149
+Create Date: 2026-10-17 10:12:41.302215-04:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import btrfs_recon.persistence.fields
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7e2a94'
+down_revision = 'd4df1e6dc149'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scan_progress',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('device_id', sa.Integer(), nullable=False),
+        sa.Column('alignment', btrfs_recon.persistence.fields.uint8(), nullable=False),
+        sa.Column('start', btrfs_recon.persistence.fields.uint8(), nullable=False),
+        sa.Column('end', btrfs_recon.persistence.fields.uint8(), nullable=False),
+        sa.ForeignKeyConstraint(['device_id'], ['device.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('scan_progress_lookup_device', 'scan_progress', ['device_id', 'alignment'], unique=False)
+
+
+def downgrade():
+    op.drop_index('scan_progress_lookup_device', table_name='scan_progress')
+    op.drop_table('scan_progress')
@@ -0,0 +1,53 @@
+"""Compare the speed of compiled and interpreted (Construct) struct parsing
+
+Compiled parsing is timed both regular, and raw (skipping display wrappers).
+
+Run from the repository root with:
+
+    python -m benchmarks.compiled_parsers [-n NUMBER] [-r REPEAT]
+
+(as with everything importing btrfs_recon, DATABASE_URL must be set, though the
+DB is never touched.) The sample structs are those of the structure tests.
+"""
+import argparse
+import timeit
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.structure import compile_parser
+from tests.btrfs_recon.structure.samples import SAMPLES
+
+BASE = 0x1d_4000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--number', type=int, default=2_000,
+                        help='Number of parses per timing run')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of timing runs, of which the best is reported')
+    args = parser.parse_args()
+
+    print(f'{"struct":<22} {"construct":>12} {"compiled":>12} {"speedup":>9} {"raw":>12} {"speedup":>9}')
+    for name, (struct_cls, data) in SAMPLES.items():
+        compiled = compile_parser(struct_cls)
+        assert compiled.parse(data, BASE, BASE) == parse_bytes_at(data, BASE, BASE, struct_cls)
+        raw = compile_parser(struct_cls, raw=True)
+
+        timings = {}
+        for mode, func in {
+            'construct': lambda: parse_bytes_at(data, BASE, BASE, struct_cls),
+            'compiled': lambda: compiled.parse(data, BASE, BASE),
+            'raw': lambda: raw.parse(data, BASE, BASE),
+        }.items():
+            best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+            timings[mode] = best / args.number * 1e6
+
+        print(
+            f'{name:<22} {timings["construct"]:>10.1f}us {timings["compiled"]:>10.2f}us'
+            f' {timings["construct"] / timings["compiled"]:>8.1f}x'
+            f' {timings["raw"]:>10.2f}us {timings["construct"] / timings["raw"]:>8.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
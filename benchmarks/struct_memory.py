@@ -0,0 +1,64 @@
+"""Measure the memory held by parsed tree nodes, as during a large tree walk
+
+Run from the repository root with:
+
+    python -m benchmarks.struct_memory [-n NUMBER] [--construct]
+
+(as with everything importing btrfs_recon, DATABASE_URL must be set, though the
+DB is never touched.) NUMBER copies of each of the leaf and internal sample nodes of
+the structure tests are parsed and kept alive, and the peak memory traced during
+parsing, along with the memory retained afterward, is reported.
+"""
+import argparse
+import dataclasses
+import gc
+import tracemalloc
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.structure import Struct, TreeNode
+from tests.btrfs_recon.structure.samples import SAMPLES
+
+BASE = 0x1d_4000
+
+
+def count_structs(obj) -> int:
+    """Count the Struct instances within a parsed struct (including itself)"""
+    if isinstance(obj, Struct):
+        return 1 + sum(count_structs(getattr(obj, f.name)) for f in dataclasses.fields(obj))
+    if isinstance(obj, list):
+        return sum(count_structs(item) for item in obj)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--number', type=int, default=2_000,
+                        help='Number of copies of each sample node to parse')
+    parser.add_argument('--construct', action='store_true',
+                        help='Parse with Construct, rather than compiled parsers')
+    args = parser.parse_args()
+
+    samples = [SAMPLES['leaf'][1], SAMPLES['internal'][1]]
+    compiled = not args.construct
+
+    gc.collect()
+    tracemalloc.start()
+    nodes = [
+        parse_bytes_at(data, BASE, BASE, TreeNode, compiled=compiled)
+        for _ in range(args.number)
+        for data in samples
+    ]
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_structs = sum(count_structs(node) for node in nodes)
+    print(f'nodes parsed:     {len(nodes):>12,}')
+    print(f'structs:          {num_structs:>12,}')
+    print(f'peak traced:      {peak / 2**20:>10.1f} MiB')
+    print(f'retained:         {retained / 2**20:>10.1f} MiB')
+    print(f'bytes per struct: {retained / num_structs:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import Any
 
@@ -17,6 +18,10 @@ class BtrfsReconSettings(BaseSettings):
 
     DATABASE_URL: PostgresPsycopgDsn
 
+    CHUNK_MAP_CACHE_DIR: Path = (
+        Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'btrfs-recon' / 'chunk-maps'
+    )
+
     DB_SHELL_EXTRA_IMPORTS: list[ImportItem] = [
         {'sa': 'sqlalchemy'},
         ('sqlalchemy', ('orm', 'func')),
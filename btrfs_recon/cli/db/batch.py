@@ -0,0 +1,121 @@
+"""Grouping of many items into each DB transaction
+
+Committing once per item costs a (synced) Postgres transaction for every tree node or
+leaf item persisted. Instead, items are collected into batches, by count and by age,
+and each batch is persisted in a single transaction. Should the transaction fail, its
+items are retried one at a time, so the items at fault are isolated and reported,
+while the rest are still persisted.
+"""
+from __future__ import annotations
+
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, Sequence, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+__all__ = [
+    'DEFAULT_BATCH_SIZE',
+    'DEFAULT_BATCH_MS',
+    'Batcher',
+    'BatchResult',
+    'process_batch',
+]
+
+#: Maximum number of items persisted per transaction
+DEFAULT_BATCH_SIZE = 100
+#: Maximum time (in milliseconds) an item may wait for its batch to fill up
+DEFAULT_BATCH_MS = 1000
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class Batcher(Generic[T]):
+    """Collects items into batches, which are due once full, or once old enough"""
+
+    def __init__(self, size: int = DEFAULT_BATCH_SIZE, max_ms: int | None = DEFAULT_BATCH_MS):
+        self.size = max(size, 1)
+        self.max_age = max_ms / 1000 if max_ms else None
+        self.items: list[T] = []
+        self._started: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item: T) -> None:
+        if not self.items:
+            self._started = time.monotonic()
+        self.items.append(item)
+
+    def time_left(self) -> float | None:
+        """Return the seconds until the current batch is due, or None if never"""
+        if not self.items or self.max_age is None:
+            return None
+        return max(self._started + self.max_age - time.monotonic(), 0.0)
+
+    def is_due(self) -> bool:
+        return len(self.items) >= self.size or self.time_left() == 0.0
+
+    def take(self) -> list[T]:
+        """Return the current batch, and start a new one"""
+        items, self.items = self.items, []
+        self._started = None
+        return items
+
+
+@dataclass(slots=True)
+class BatchResult(Generic[T, R]):
+    #: Results of the items persisted
+    results: list[R] = field(default_factory=list)
+    #: (item, traceback) of every item which failed to be persisted
+    failures: list[tuple[T, str]] = field(default_factory=list)
+
+
+async def _commit(
+    session: AsyncSession,
+    items: Sequence[T],
+    process: Callable[[AsyncSession, Sequence[T]], Awaitable[list[R]]],
+) -> list[R]:
+    try:
+        results = await process(session, items)
+        await session.commit()
+        return results
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        # Don't hold onto persisted rows, polluting session and leaking memory
+        session.expunge_all()
+
+
+async def process_batch(
+    session: AsyncSession,
+    items: Sequence[T],
+    process: Callable[[AsyncSession, Sequence[T]], Awaitable[list[R]]],
+) -> BatchResult[T, R]:
+    """Persist items within a single transaction, retrying them one at a time on failure
+
+    `process` is expected to add the items to the session (flushing as needed), and to
+    return a list of results; it must not commit.
+    """
+    result = BatchResult()
+    if not items:
+        return result
+
+    try:
+        result.results = await _commit(session, items, process)
+        return result
+    except Exception:
+        if len(items) == 1:
+            result.failures.append((items[0], traceback.format_exc()))
+            return result
+
+    for item in items:
+        try:
+            result.results += await _commit(session, [item], process)
+        except Exception:
+            result.failures.append((item, traceback.format_exc()))
+
+    return result
@@ -1,26 +1,52 @@
 import asyncio
+import functools
+import io
+import itertools
+import traceback
 import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import AsyncIterable, Collection
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Collection,
+    Sequence,
+    get_args,
+)
 
 import aiomultiprocess
 import asyncclick as click
 import construct as cs
+import numpy as np
 import sqlalchemy as sa
-from aiomultiprocess import Pool
+import sqlalchemy.dialects.postgresql as pg
 from aiomultiprocess.types import ProxyException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import ddl
 from tqdm import tqdm
 from tui_progress import timed_subtask
 
-import btrfs_recon.db
 from btrfs_recon import structure
-from btrfs_recon.parsing import FindNodesLogFunc, find_nodes, parse_at
+from btrfs_recon.parsing import find_nodes, parse_at, parse_bytes_at
 from btrfs_recon.persistence import Filesystem, models, registry
-from btrfs_recon.types import DevId, ImagePath, PhysicalAddress
+from btrfs_recon.persistence.bulk import NodeRows, bulk_ingest
+from btrfs_recon.scanner import (
+    BTRFS_DEFAULT_NODESIZE,
+    HeaderScanner,
+    KnownLocations,
+    ScanMethod,
+    nodesize_or_default,
+    read_nodes,
+)
+from btrfs_recon.types import DevId, ImagePath, PhysicalAddress, PhysicalRange
+from btrfs_recon.util.checkpoints import DEFAULT_CHECKPOINT_MS, Checkpointer
+from btrfs_recon.util.ranges import invert_ranges, ranges_size, split_ranges, subtract_ranges
 
 from .base import db, pass_session
+from .batch import DEFAULT_BATCH_MS, DEFAULT_BATCH_SIZE, Batcher, process_batch
+from .pool import WorkerPool, worker_device_fp, worker_session
 from ..types import HEX_DEC_INT
 
 
@@ -106,12 +132,55 @@ async def sync_fs(session: AsyncSession, label: str):
 @click.option('-l', '--label', help='The unique label for the filesystem')
 @click.option('-d', '--devid', type=int, multiple=True,
               help='Limit scan to device with specified devid')
-@click.option('-a', '--alignment', type=int, default=0x10_000)
+@click.option('-a', '--alignment', type=HEX_DEC_INT, default=0x1000,
+              help='Granularity of scanned locations. Defaults to the sector size (4 KiB).')
+@click.option('--scan-method', type=click.Choice(get_args(ScanMethod)), default='auto',
+              help='How to pick out candidate headers: "stride" checks every aligned location, '
+                   '"search" looks only where the fsid occurs. "auto" picks search for alignments '
+                   'finer than 512 bytes.')
+@click.option('-n', '--nodesize', type=HEX_DEC_INT, default=None,
+              help="Size of tree nodes. Defaults to the node_size of each device's superblock, "
+                   'or, where that is damaged, to 16 KiB (the mkfs.btrfs default).')
 @click.option('-s', '--start', type=HEX_DEC_INT, default=None)
 @click.option('-e', '--end', type=HEX_DEC_INT, default=None)
 @click.option('-r/-f', '--reverse/--forward', type=bool, default=False)
+@click.option('--metadata-only', is_flag=True,
+              help='Only scan the physical ranges of METADATA and SYSTEM block groups, as mapped '
+                   'by the chunk tree already stored in the DB')
+@click.option('--unmapped/--no-unmapped', default=False,
+              help='With --metadata-only, follow up with a pass over ranges not mapped by any chunk')
+@click.option('--skip-holes/--no-skip-holes', default=True,
+              help='Skip over holes in sparse images (found with SEEK_DATA/SEEK_HOLE), '
+                   'without reading them')
+@click.option('--force', is_flag=True,
+              help='Reprocess nodes found at locations already stored in the DB. By default, '
+                   'these are skipped without being parsed.')
+@click.option('--resume', is_flag=True,
+              help='Skip ranges of each device already completely scanned by a previous run, '
+                   'at this alignment (or a finer one which divides it)')
+@click.option('--bulk/--no-bulk', default=False,
+              help='Persist found nodes in batches, with COPY into staging tables and set-based '
+                   'merges, rather than through the ORM. Nodes already stored are skipped, '
+                   'never updated.')
+@click.option('--compiled-parsers/--no-compiled-parsers', default=False,
+              help='Parse found nodes with parsers compiled to plain Python (struct.unpack_from), '
+                   'rather than through Construct')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+              help='Maximum number of nodes persisted per transaction')
+@click.option('--batch-ms', type=int, default=DEFAULT_BATCH_MS,
+              help='Maximum time (in milliseconds) a found node may wait for its batch to fill up')
+@click.option('--checkpoint-ms', type=int, default=DEFAULT_CHECKPOINT_MS,
+              help='Maximum time (in milliseconds) a scanned range may wait to be recorded for '
+                   '--resume. Ranges scanned in the meantime are recorded in the same transaction.')
 @click.option('--parallel/--no-parallel', type=bool, default=True)
+@click.option('--sharded/--no-sharded', default=True,
+              help='With --parallel, split devices into shards which worker processes scan '
+                   'themselves, rather than only parsing the locations found by this process')
+@click.option('--shard-size', type=HEX_DEC_INT, default=0x10000000,
+              help='Size of each shard scanned by a worker process. Defaults to 256 MiB.')
 @click.option('-w', '--workers', type=int, default=None)
+@click.option('--worker-max-rss', type=int, default=1024,
+              help='Resident memory (in MiB) beyond which a worker process is replaced')
 @click.option('--qsize', type=int, default=24)
 @click.option('--scan-qsize', type=int, default=1_000)
 @pass_session
@@ -119,76 +188,408 @@ async def scan_fs(
     session: AsyncSession,
     label: str,
     alignment: int,
+    scan_method: ScanMethod,
+    nodesize: int | None,
     start: int | None,
     end: int | None,
     reverse: bool,
     devid: Collection[int],
+    metadata_only: bool,
+    unmapped: bool,
+    skip_holes: bool,
+    force: bool,
+    resume: bool,
+    bulk: bool,
+    compiled_parsers: bool,
+    batch_size: int,
+    batch_ms: int,
+    checkpoint_ms: int,
     parallel: bool,
+    sharded: bool,
+    shard_size: int,
     workers: int | None,
+    worker_max_rss: int,
     qsize: int,
     scan_qsize: int,
 ):
-    """Scan a filesystem for aligned records"""
+    """Scan a filesystem for aligned records
+
+    All selected devices are scanned concurrently, each by its own reader. With
+    --sharded (the default), the devices are split into shards, each of which is
+    scanned, parsed, and persisted entirely within a worker process.
+
+    Scan progress is checkpointed to the DB as windows (or shards) complete, in
+    batches written once the oldest has waited --checkpoint-ms, so an interrupted
+    scan may be continued with --resume.
+    """
     q = sa.select(models.Filesystem).filter_by(label=label)
     fs: Filesystem = (await session.execute(q)).scalar_one()
 
-    for device in fs.devices:
-        if devid and device.devid not in devid:
-            continue
+    devices = [device for device in fs.devices if not devid or device.devid in devid]
 
-        with device.open() as fp:
-            log, headers = await find_nodes(
-                fp,
-                fsid=fs.fsid,
-                alignment=alignment,
-                start_loc=start,
-                end_loc=end,
-                reversed=reverse,
-                tqdm_kwargs=dict(
-                    desc=f'Scanning devid {device.devid}',
-                    dynamic_ncols=True,
-                    colour='blue',
-                ),
+    if metadata_only:
+        metadata_ranges = await models.ChunkTree.device_ranges(
+            session,
+            filesystem=fs,
+            flags=structure.BlockGroupFlag.METADATA | structure.BlockGroupFlag.SYSTEM,
+        )
+        devids_without_chunks = [
+            device.devid for device in devices if not metadata_ranges.get(device.devid)
+        ]
+        if devids_without_chunks:
+            raise click.UsageError(
+                f'--metadata-only: no METADATA or SYSTEM chunks are stored for devid(s) '
+                f'{", ".join(map(str, devids_without_chunks))}, so there is nothing to scan. Store '
+                f'the chunk tree (and refresh the chunk_tree view) first, or scan without '
+                f'--metadata-only.'
             )
 
-            if parallel:
-                await _scan_parallel(
-                    device, log, headers,
-                    workers=workers,
-                    qsize=qsize,
-                    scan_qsize=scan_qsize,
-                )
-            else:
-                async for loc, header in headers:
-                    tree_node = parse_at(fp, loc, structure.TreeNode)
+        if unmapped:
+            mapped_ranges = await models.ChunkTree.device_ranges(session, filesystem=fs)
+
+    known_locs: dict[models.Device, KnownLocations] = {}
+    if not force:
+        for device in devices:
+            known_locs[device] = KnownLocations(
+                await models.TreeNode.device_locs(session, device.id), alignment
+            )
+            print(f'devid {device.devid}: skipping {len(known_locs[device])} known node locations')
+
+    completed_ranges: dict[models.Device, list[PhysicalRange]] = {}
+    if resume:
+        for device in devices:
+            completed_ranges[device] = await models.ScanProgress.completed_ranges(
+                session, device.id, alignment
+            )
+
+    # Each device gets its own progress bar, with the totals displayed beneath them all
+    total_pbar = tqdm(
+        position=len(devices),
+        unit='loc',
+        total=0,
+        dynamic_ncols=True,
+        colour='cyan',
+        desc='Scanning all devices',
+    )
+
+    def log(*args) -> None:
+        total_pbar.write(' '.join(map(str, args)))
+
+    def get_nodesize(device: models.Device, fp: io.FileIO) -> int:
+        """Return the --nodesize, or else the node_size of the device's superblock"""
+        if nodesize is not None:
+            return nodesize
+
+        try:
+            node_size = device.parse_superblock(fp).node_size
+        except cs.ConstructError:
+            node_size = None
+
+        device_nodesize = nodesize_or_default(node_size)
+        if device_nodesize != node_size:
+            log(f'devid {device.devid}: superblock has no usable node_size; '
+                f'assuming nodesize 0x{device_nodesize:x}')
+        return device_nodesize
+
+    def get_scan_passes(
+        device: models.Device, fp: io.FileIO
+    ) -> list[tuple[str, list[PhysicalRange] | None]]:
+        """Return (description, physical ranges to scan or None for the whole device)"""
+        device_size = fp.seek(0, io.SEEK_END)
+
+        scan_passes: list[tuple[str, list[PhysicalRange] | None]] = [('', None)]
+        if metadata_only:
+            scan_passes = [('metadata', metadata_ranges.get(device.devid, []))]
+            if unmapped:
+                unmapped_ranges = invert_ranges(mapped_ranges.get(device.devid, []), 0, device_size)
+                scan_passes.append(('unmapped', unmapped_ranges))
+
+        if completed := completed_ranges.get(device):
+            log(f'Resuming devid {device.devid}: skipping {ranges_size(completed)} bytes already scanned')
+            scan_passes = [
+                (pass_desc, subtract_ranges([(0, device_size)] if ranges is None else ranges, completed))
+                for pass_desc, ranges in scan_passes
+            ]
+
+        return scan_passes
+
+    async def record_progress(scanned: dict[models.Device, list[PhysicalRange]]):
+        for device, ranges in scanned.items():
+            for start, end in ranges:
+                await models.ScanProgress.record(session, device.id, alignment, start, end)
+        await session.commit()
+
+    checkpointer: Checkpointer[models.Device] = Checkpointer(record_progress, checkpoint_ms)
+
+    if parallel and sharded:
+        shards: list[tuple[models.Device, PhysicalRange, int]] = []
+        device_pbars: dict[models.Device, tqdm] = {}
+        nodesizes: dict[models.Device, int] = {}
+
+        for position, device in enumerate(devices):
+            with device.open() as fp:
+                nodesizes[device] = get_nodesize(device, fp)
+                scanner = HeaderScanner(fp, alignment=alignment)
+
+                device_shards = [
+                    shard
+                    for _, ranges in get_scan_passes(device, fp)
+                    for shard in split_ranges(
+                        scanner.bounded_ranges(ranges, start, end), shard_size
+                    )
+                ]
+                if reverse:
+                    device_shards.reverse()
+
+                shard_locs = [(device, shard, scanner.count_locs([shard])) for shard in device_shards]
+                shards += shard_locs
+
+            device_pbars[device] = tqdm(
+                position=position,
+                unit='loc',
+                total=sum(num_locs for _, _, num_locs in shard_locs),
+                dynamic_ncols=True,
+                colour='blue',
+                desc=f'Scanning devid {device.devid}',
+            )
 
-                    if msg := await _process_loc(session, tree_node, device):
-                        log(msg)
-                        # Don't hold onto inserted rows, polluting session and leaking memory
-                        session.expunge_all()
+        total_pbar.total = sum(num_locs for _, _, num_locs in shards)
+        total_pbar.refresh()
+
+        await _scan_sharded(
+            shards, log,
+            checkpointer=checkpointer,
+            device_pbars=device_pbars,
+            total_pbar=total_pbar,
+            workers=workers,
+            max_rss=worker_max_rss << 20,
+            fsid=fs.fsid,
+            alignment=alignment,
+            method=scan_method,
+            skip_holes=skip_holes,
+            known_locs=known_locs,
+            reversed=reverse,
+            nodesizes=nodesizes,
+            bulk=bulk,
+            compiled=compiled_parsers,
+            batch_size=batch_size,
+            batch_ms=batch_ms,
+        )
+        await checkpointer.flush()
 
+        for pbar in device_pbars.values():
+            pbar.close()
+        total_pbar.close()
         print()
         print()
+        return
+
+    async def scan_device(position: int, device: models.Device) -> AsyncIterator[ScanItem]:
+        """Yield the nodes found on the device, interspersed with the completed windows"""
+        with device.open() as fp:
+            device_nodesize = get_nodesize(device, fp)
+            for pass_desc, ranges in get_scan_passes(device, fp):
+                done_windows: list[PhysicalRange] = []
+
+                device_log, headers = await find_nodes(
+                    fp,
+                    fsid=fs.fsid,
+                    alignment=alignment,
+                    method=scan_method,
+                    skip_holes=skip_holes,
+                    known=known_locs.get(device),
+                    start_loc=start,
+                    end_loc=end,
+                    reversed=reverse,
+                    ranges=ranges,
+                    on_progress=total_pbar.update,
+                    on_window_done=done_windows.append,
+                    tqdm_kwargs=dict(
+                        desc=f'Scanning devid {device.devid}' + (f' ({pass_desc})' if pass_desc else ''),
+                        position=position,
+                        dynamic_ncols=True,
+                        colour='blue',
+                    ),
+                )
+                total_pbar.total += device_log.pbar.total
+                total_pbar.refresh()
+
+                async for nodes in headers:
+                    # Windows are only reported done after their nodes have been yielded
+                    while done_windows:
+                        yield done_windows.pop(0)
+
+                    # NOTE: the scanner only reads from fp while we await the next batch,
+                    #       so it's safe to read the nodes from it here.
+                    locs = [loc for loc, header in nodes]
+                    node_data = await asyncio.to_thread(read_nodes, fp, locs, device_nodesize)
+                    for loc, data in zip(locs, node_data):
+                        yield FoundNode(loc, data)
+
+                while done_windows:
+                    yield done_windows.pop(0)
+
+    device_locs = {
+        device: scan_device(position, device)
+        for position, device in enumerate(devices)
+    }
+
+    if parallel:
+        await _scan_parallel(
+            device_locs, log,
+            checkpointer=checkpointer,
+            workers=workers,
+            max_rss=worker_max_rss << 20,
+            qsize=qsize,
+            scan_qsize=scan_qsize,
+            pbar_position=len(devices) + 1,
+            bulk=bulk,
+            compiled=compiled_parsers,
+            batch_size=batch_size,
+            batch_ms=batch_ms,
+        )
+    else:
+        await _scan_sequential(
+            session, device_locs, log,
+            checkpointer=checkpointer,
+            scan_qsize=scan_qsize,
+            bulk=bulk,
+            compiled=compiled_parsers,
+            batch_size=batch_size,
+            batch_ms=batch_ms,
+        )
+    await checkpointer.flush()
+
+    total_pbar.close()
+    print()
+    print()
 
     await session.commit()
 
 
-async def _scan_parallel(
+@dataclass(slots=True, frozen=True)
+class FoundNode:
+    loc: PhysicalAddress
+    #: The raw bytes of the whole node, read from loc
+    data: bytes
+
+
+#: A found node, or a [start, end) range whose found nodes have all been queued
+ScanItem = FoundNode | PhysicalRange
+
+
+async def _checkpoint(
+    checkpointer: Checkpointer[models.Device],
     device: models.Device,
-    log: FindNodesLogFunc,
-    headers: AsyncIterable[tuple[int, structure.Header]],
+    scanned: PhysicalRange,
+    log: Callable[..., None],
+) -> None:
+    """Checkpoint a completely processed range, logging if failures held it back"""
+    if num_failures := await checkpointer.complete(device, scanned):
+        start, end = scanned
+        log(
+            f'Not recording devid {device.devid} [0x{start:x}, 0x{end:x}) as scanned: '
+            f'{num_failures} node(s) in it failed to be processed'
+        )
+
+
+async def _feed_queue(
+    device_locs: dict[models.Device, AsyncIterable[ScanItem]],
+    queue: asyncio.Queue[tuple[models.Device, ScanItem]],
+    on_put: Callable[[], object] | None = None,
+) -> None:
+    """Drain the found locations of all devices into a single queue, concurrently"""
+    async def feed(device: models.Device, items: AsyncIterable[ScanItem]):
+        async for item in items:
+            await queue.put((device, item))
+            if on_put is not None and isinstance(item, FoundNode):
+                on_put()
+
+    await asyncio.gather(*(feed(device, locs) for device, locs in device_locs.items()))
+
+
+async def _scan_sequential(
+    session: AsyncSession,
+    device_locs: dict[models.Device, AsyncIterable[ScanItem]],
+    log: Callable[..., None],
+    checkpointer: Checkpointer[models.Device],
+    scan_qsize: int = 1_000,
+    bulk: bool = False,
+    compiled: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_ms: int | None = DEFAULT_BATCH_MS,
+):
+    queue: asyncio.Queue[tuple[models.Device, ScanItem] | None] = asyncio.Queue(maxsize=scan_qsize)
+    failures: list[tuple[ImagePath, DevId, PhysicalAddress, str]] = []
+    batchers: dict[models.Device, Batcher[structure.TreeNode]] = {}
+
+    async def flush(device: models.Device):
+        if not (batcher := batchers.get(device)):
+            return
+
+        persist = functools.partial(_process_nodes, device_id=device.id, bulk=bulk)
+        result = await process_batch(session, batcher.take(), persist)
+
+        for msg in result.results:
+            log(msg)
+        for tree_node, tb in result.failures:
+            failures.append((device.path, device.id, tree_node.phys_start, tb))
+            checkpointer.fail(device)
+            log(f'Failed to process {(device.path, device.id, tree_node.phys_start)}:\n\n' + tb)
+
+    async def feed_all():
+        await _feed_queue(device_locs, queue)
+        await queue.put(None)
+
+    feeder = asyncio.create_task(feed_all(), name='feed found nodes from all devices')
+
+    while item := await queue.get():
+        device, node = item
+        if not isinstance(node, FoundNode):
+            # Only checkpoint once everything found before it has been persisted
+            await flush(device)
+            await _checkpoint(checkpointer, device, node, log)
+            continue
+
+        tree_node = parse_bytes_at(
+            node.data, node.loc, node.loc, structure.TreeNode, compiled=compiled
+        )
+
+        batcher = batchers.setdefault(device, Batcher(batch_size, batch_ms))
+        batcher.add(tree_node)
+        if batcher.is_due():
+            await flush(device)
+
+    await feeder
+
+    for device in batchers:
+        await flush(device)
+
+    _print_failures(failures)
+
+
+async def _scan_parallel(
+    device_locs: dict[models.Device, AsyncIterable[ScanItem]],
+    log: Callable[..., None],
+    checkpointer: Checkpointer[models.Device],
     workers: int | None = None,
+    max_rss: int | None = None,
     qsize: int = 24,
     scan_qsize: int = 1_000,
+    pbar_position: int = 1,
+    bulk: bool = False,
+    compiled: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_ms: int | None = DEFAULT_BATCH_MS,
 ):
-    queue = asyncio.Queue(maxsize=scan_qsize)
+    queue: asyncio.Queue[tuple[models.Device, ScanItem]] = asyncio.Queue(maxsize=scan_qsize)
     pending_queue = asyncio.Queue(maxsize=qsize)
     failures: list[tuple[ImagePath, DevId, PhysicalAddress, str]] = []
 
     finished_scanning = asyncio.Event()
 
     queue_pbar = tqdm(
-        position=1,
+        position=pbar_position,
         unit='node',
         total=0,
         dynamic_ncols=True,
@@ -196,29 +597,32 @@ async def _scan_parallel(
         desc='Parse found locs',
     )
 
-    async with Pool(
+    async with WorkerPool(
         processes=workers,
         childconcurrency=1,
-        maxtasksperchild=qsize,
+        max_rss=max_rss,
     ) as pool:
-        device_id = device.id
-
-        async def _process_and_print(loc: int):
+        async def _process_and_print(device: models.Device, nodes: list[FoundNode]):
             if not pool.running:
                 return
 
-            args = (device.path, device_id, loc)
+            args = (device.id, [(node.loc, node.data) for node in nodes])
             try:
-                result = await pool.apply(_multiprocess_loc, args=args)
+                messages, node_failures = await pool.apply(
+                    _multiprocess_nodes, args=args, kwds={'bulk': bulk, 'compiled': compiled}
+                )
             except ProxyException as e:
                 tb = e.args[0]
-                failures.append(args + (tb,))
-                log(f'Failed to process {args}:\n\n' + tb)
-            else:
-                if result:
-                    log(result)
+                messages, node_failures = [], [(node.loc, tb) for node in nodes]
+
+            for msg in messages:
+                log(msg)
+            for loc, tb in node_failures:
+                failures.append((device.path, device.id, loc, tb))
+                checkpointer.fail(device)
+                log(f'Failed to process {(device.path, device.id, loc)}:\n\n' + tb)
 
-            queue_pbar.update(1)
+            queue_pbar.update(len(nodes))
 
             # Remove an item from the pending queue, freeing the queue master
             # to retrieve another item
@@ -226,70 +630,336 @@ async def _scan_parallel(
             pending_queue.task_done()
 
         async def queue_master():
+            batchers: dict[models.Device, Batcher[FoundNode]] = {}
+
+            async def submit(device: models.Device):
+                if (batcher := batchers.get(device)) and (nodes := batcher.take()):
+                    await pending_queue.put(device)
+                    asyncio.create_task(_process_and_print(device, nodes))
+
             wait_finished_scanning = asyncio.create_task(
                 finished_scanning.wait(), name='wait until all locations have been scanned'
             )
 
             while pool.running and (not queue.empty() or not finished_scanning.is_set()):
+                # Wake up in time to submit any batch coming due while we wait
+                time_left = [t for b in batchers.values() if (t := b.time_left()) is not None]
+
                 queue_get = asyncio.create_task(queue.get(), name='get next valid loc from queue')
                 done, pending = await asyncio.wait(
-                    (queue_get, wait_finished_scanning), return_when=asyncio.FIRST_COMPLETED
+                    (queue_get, wait_finished_scanning),
+                    timeout=min(time_left, default=None),
+                    return_when=asyncio.FIRST_COMPLETED,
                 )
-                if finished_scanning.is_set() and queue.empty():
-                    break
 
                 if queue_get in done:
-                    loc = queue_get.result()
-                    await pending_queue.put(loc)
-                    asyncio.create_task(_process_and_print(loc))
+                    device, node = queue_get.result()
+                    if not isinstance(node, FoundNode):
+                        # Only checkpoint once everything queued before it has been processed
+                        await submit(device)
+                        await pending_queue.join()
+                        await _checkpoint(checkpointer, device, node, log)
+                        continue
+
+                    batchers.setdefault(device, Batcher(batch_size, batch_ms)).add(node)
+                else:
+                    queue_get.cancel()
+                    if finished_scanning.is_set() and queue.empty():
+                        break
+
+                for device, batcher in batchers.items():
+                    if batcher.is_due():
+                        await submit(device)
+
+            for device in batchers:
+                await submit(device)
 
             await pending_queue.join()
 
         processor = asyncio.create_task(queue_master(), name='queue processor')
 
-        async for loc, header in headers:
-            await queue.put(loc)
+        def on_put():
             queue_pbar.total += 1
+            queue_pbar.refresh()
+
+        await _feed_queue(device_locs, queue, on_put=on_put)
         finished_scanning.set()
 
         await processor
 
-        if failures:
-            print(f'Encountered {len(failures)} failure(s)\n\n')
+        _print_failures(failures)
+
+
+@dataclass(slots=True)
+class ShardResult:
+    #: Number of plausible headers found in the shard
+    num_found: int = 0
+    #: Number of tree nodes persisted from the shard
+    num_saved: int = 0
+    #: Number of bytes skipped without reading, because they're holes in a sparse image
+    num_skipped_bytes: int = 0
+    #: Number of plausible headers skipped, because they're already in the DB
+    num_known: int = 0
+    #: (loc, traceback) of every found node which failed to be processed
+    failures: list[tuple[PhysicalAddress, str]] = field(default_factory=list)
+
+
+async def _scan_sharded(
+    shards: list[tuple[models.Device, PhysicalRange, int]],
+    log: Callable[..., None],
+    checkpointer: Checkpointer[models.Device],
+    *,
+    device_pbars: dict[models.Device, tqdm],
+    total_pbar: tqdm,
+    workers: int | None = None,
+    max_rss: int | None = None,
+    fsid: uuid.UUID | None = None,
+    alignment: int = 0x1000,
+    method: ScanMethod = 'auto',
+    skip_holes: bool = True,
+    known_locs: dict[models.Device, KnownLocations] | None = None,
+    reversed: bool = False,
+    nodesizes: dict[models.Device, int] | None = None,
+    bulk: bool = False,
+    compiled: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_ms: int | None = DEFAULT_BATCH_MS,
+):
+    """Have worker processes scan, parse, and persist each (device, shard, num_locs)
+
+    The shards of all devices are interleaved, so every device is read concurrently.
+    """
+    failures: list[tuple[ImagePath, DevId, PhysicalAddress, str]] = []
+    checkpoint_lock = asyncio.Lock()
+    shard_kwargs = dict(
+        fsid=fsid,
+        alignment=alignment,
+        method=method,
+        skip_holes=skip_holes,
+        reversed=reversed,
+        bulk=bulk,
+        compiled=compiled,
+        batch_size=batch_size,
+        batch_ms=batch_ms,
+    )
+    num_skipped_bytes = 0
+
+    # Round-robin between devices, so each device has a shard in progress at all times
+    device_shards: dict[models.Device, list[tuple[PhysicalRange, int]]] = {}
+    for device, shard, num_locs in shards:
+        device_shards.setdefault(device, []).append((shard, num_locs))
+
+    interleaved = [
+        (device, shard, num_locs)
+        for row in itertools.zip_longest(*(
+            [(device, shard, num_locs) for shard, num_locs in device_shards[device]]
+            for device in device_shards
+        ))
+        for device, shard, num_locs in filter(None, row)
+    ]
+
+    async with WorkerPool(processes=workers, childconcurrency=1, max_rss=max_rss) as pool:
+        async def run_shard(device: models.Device, shard: PhysicalRange, num_locs: int):
+            nonlocal num_skipped_bytes
+
+            shard_start, shard_end = shard
+            desc = f'devid {device.devid} [0x{shard_start:x}, 0x{shard_end:x})'
+
+            args = (device.path, device.id, shard)
+            kwds = dict(shard_kwargs)
+            if known_locs and device in known_locs:
+                # Only ship the known locations relevant to the shard
+                kwds['known'] = known_locs[device].restrict(*shard)
+            if nodesizes and device in nodesizes:
+                kwds['nodesize'] = nodesizes[device]
+
+            try:
+                result: ShardResult = await pool.apply(_multiprocess_shard, args=args, kwds=kwds)
+            except ProxyException as e:
+                tb = e.args[0]
+                failures.append((device.path, device.id, shard_start, tb))
+                log(f'Failed to scan {desc}:\n\n' + tb)
+            else:
+                num_skipped_bytes += result.num_skipped_bytes
+                total_pbar.set_postfix(skipped=tqdm.format_sizeof(num_skipped_bytes, 'B', 1024))
+
+                for loc, tb in result.failures:
+                    failures.append((device.path, device.id, loc, tb))
+                    log(f'Failed to process {(device.path, device.id, loc)}:\n\n' + tb)
+
+                if result.num_found:
+                    log(
+                        f'Scanned {desc}: saved {result.num_saved} of {result.num_found} found nodes'
+                        + (f' ({result.num_known} already known)' if result.num_known else '')
+                    )
+
+                # A device's shards finish in any order, so failures are judged per shard,
+                # rather than reported to the checkpointer
+                if result.failures:
+                    log(
+                        f'Not recording {desc} as scanned: '
+                        f'{len(result.failures)} node(s) in it failed to be processed'
+                    )
+                else:
+                    # The checkpoints share a single session, which mustn't be used concurrently
+                    async with checkpoint_lock:
+                        await checkpointer.complete(device, shard)
+
+            device_pbars[device].update(num_locs)
+            total_pbar.update(num_locs)
+
+        await asyncio.gather(*(
+            run_shard(device, shard, num_locs)
+            for device, shard, num_locs in interleaved
+        ))
+
+    _print_failures(failures)
 
-            for (*args, tb) in failures:
-                print(args, '\n', tb, '\n\n')
 
-            print(f'Encountered {len(failures)} failure(s)\n\n')
+def _print_failures(failures: list[tuple[ImagePath, DevId, PhysicalAddress, str]]) -> None:
+    if not failures:
+        return
+
+    print(f'Encountered {len(failures)} failure(s)\n\n')
+
+    for (*args, tb) in failures:
+        print(args, '\n', tb, '\n\n')
+
+    print(f'Encountered {len(failures)} failure(s)\n\n')
+
 
+async def _multiprocess_shard(
+    image_path: str,
+    device_id: int,
+    shard: PhysicalRange,
+    *,
+    fsid: uuid.UUID | None,
+    alignment: int,
+    method: ScanMethod,
+    skip_holes: bool,
+    reversed: bool,
+    known: KnownLocations | None = None,
+    nodesize: int = BTRFS_DEFAULT_NODESIZE,
+    bulk: bool = False,
+    compiled: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_ms: int | None = DEFAULT_BATCH_MS,
+) -> ShardResult:
+    result = ShardResult()
+
+    session = await worker_session()
+    fp = worker_device_fp(image_path)
+    scanner = HeaderScanner(
+        fp,
+        alignment=alignment,
+        fsid=fsid,
+        method=method,
+        skip_holes=skip_holes,
+        known=known,
+    )
+
+    batcher: Batcher[structure.TreeNode] = Batcher(batch_size, batch_ms)
+    persist = functools.partial(_process_nodes, device_id=device_id, bulk=bulk)
 
-async def _multiprocess_loc(image_path: str, device_id: int, loc: int):
-    async with btrfs_recon.db.Session() as session:
-        with open(image_path, 'rb') as fp:
-            tree_node = parse_at(fp, loc, structure.TreeNode)
+    async def flush():
+        batch_result = await process_batch(session, batcher.take(), persist)
+        result.num_saved += len(batch_result.results)
+        result.failures += [(tree_node.phys_start, tb) for tree_node, tb in batch_result.failures]
 
+    for batch in scanner.scan_ranges([shard], reversed=reversed):
+        result.num_skipped_bytes += batch.num_skipped_bytes
+        result.num_known += batch.num_known
+        result.num_found += batch.num_known
+        for loc, header in batch.nodes:
+            result.num_found += 1
+
+            try:
+                batcher.add(parse_at(fp, loc, structure.TreeNode, compiled=compiled, size=nodesize))
+            except Exception:
+                result.failures.append((loc, traceback.format_exc()))
+                continue
+
+            if batcher.is_due():
+                await flush()
+
+    await flush()
+    return result
+
+
+async def _multiprocess_nodes(
+    device_id: int,
+    nodes: list[tuple[PhysicalAddress, bytes]],
+    *,
+    bulk: bool = False,
+    compiled: bool = False,
+) -> tuple[list[str], list[tuple[PhysicalAddress, str]]]:
+    """Parse and persist a batch of (loc, data) found on a device
+
+    Returns the messages of the nodes saved, and the (loc, traceback) of those failed.
+    """
+    session = await worker_session()
+
+    tree_nodes: list[structure.TreeNode] = []
+    failures: list[tuple[PhysicalAddress, str]] = []
+    for loc, data in nodes:
         try:
-            return await _process_loc(session, tree_node=tree_node, device=device_id)
-        finally:
-            # Don't hold onto inserted rows, polluting session and leaking memory
-            session.expunge_all()
+            tree_nodes.append(
+                parse_bytes_at(data, loc, loc, structure.TreeNode, compiled=compiled)
+            )
+        except Exception:
+            failures.append((loc, traceback.format_exc()))
+
+    persist = functools.partial(_process_nodes, device_id=device_id, bulk=bulk)
+    result = await process_batch(session, tree_nodes, persist)
+
+    failures += [(tree_node.phys_start, tb) for tree_node, tb in result.failures]
+    return result.results, failures
+
+
+async def _process_nodes(
+    session: AsyncSession,
+    tree_nodes: Sequence[structure.TreeNode],
+    *,
+    device_id: int,
+    bulk: bool = False,
+) -> list[str]:
+    """Add tree nodes to the session's transaction, returning a message for each saved
+
+    The transaction is flushed, but left for the caller to commit.
+    """
+    if bulk:
+        rows = NodeRows()
+        for tree_node in tree_nodes:
+            try:
+                rows.add_node(tree_node, device_id)
+            except ValueError:
+                # Like _process_loc, skip nodes which can't be represented in the DB
+                continue
+
+        saved_locs = await bulk_ingest(session, rows)
+        return [f'Saved: TreeNode @ {hex(phys)} ({phys})' for phys in saved_locs]
+
+    instances = []
+    for tree_node in tree_nodes:
+        if (instance := await _process_loc(session, tree_node, device_id)) is not None:
+            instances.append(instance)
+
+    await session.flush()
+
+    return [
+        f'Saved: {instance.__class__.__name__} {instance.id} '
+        f'@ {hex(instance.address.phys)} ({instance.address.phys})'
+        for instance in instances
+    ]
 
 
 async def _process_loc(
     session: AsyncSession, tree_node: structure.TreeNode, device: int | models.Device
-):
+) -> models.TreeNode | None:
     try:
-        instance = tree_node.to_model(context={'device': device}, session=session)
+        return tree_node.to_model(context={'device': device}, session=session)
     except ValueError:
-        return
-    else:
-        await session.commit()
-
-        phys = instance.address.phys
-        return (
-            f'Saved: {instance.__class__.__name__} {instance.id} '
-            f'@ {hex(phys)} ({phys})'
-        )
+        return None
 
 
 @fs.command(name='reparse')
@@ -303,8 +973,14 @@ async def _process_loc(
               help='Whether to parse leaf items with existing structs from outdated serializers')
 # @click.option('--existing/--no-existing', default=False,
 #               help='Whether to parse leaf items with existing, up-to-date structs')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+              help='Maximum number of leaf items reparsed per transaction')
+@click.option('--batch-ms', type=int, default=DEFAULT_BATCH_MS,
+              help='Maximum time (in milliseconds) a leaf item may wait for its batch to fill up')
 @click.option('--parallel/--no-parallel', type=bool, default=True)
 @click.option('-w', '--workers', type=int, default=None)
+@click.option('--worker-max-rss', type=int, default=1024,
+              help='Resident memory (in MiB) beyond which a worker process is replaced')
 @click.option('--qsize', type=int, default=24)
 @pass_session
 async def reparse_fs(
@@ -315,8 +991,11 @@ async def reparse_fs(
     missing: bool,
     outdated: bool,
     # existing: bool,
+    batch_size: int,
+    batch_ms: int,
     parallel: bool,
     workers: int | None,
+    worker_max_rss: int,
     qsize: int,
 ):
     """Reparse existing leaf items from disk images"""
@@ -399,32 +1078,35 @@ async def reparse_fs(
 
         aiomultiprocess.set_start_method('fork')
 
-        async with Pool(
+        async with WorkerPool(
             processes=workers,
             childconcurrency=1,
-            maxtasksperchild=qsize,
+            max_rss=worker_max_rss << 20,
         ) as pool:
             queue = asyncio.Queue(maxsize=qsize)
             pending_queue = asyncio.Queue(maxsize=qsize)
             failures: list[tuple[int, str]] = []
             finished_submitting = asyncio.Event()
 
-            async def _process_and_print(leaf_item_id: int):
+            async def _process_and_print(leaf_item_ids: list[int]):
                 if not pool.running:
                     return
 
-                args = (leaf_item_id,)
                 try:
-                    result = await pool.apply(_multiprocess_leaf_item, args=args)
+                    messages, item_failures = await pool.apply(
+                        _multiprocess_leaf_items, args=(leaf_item_ids,)
+                    )
                 except ProxyException as e:
                     tb = e.args[0]
-                    failures.append(args + (tb,))
-                    pbar.write(f'Failed to process {args}:\n\n' + tb)
-                else:
-                    if result:
-                        pbar.write(result)
+                    messages, item_failures = [], [(leaf_item_id, tb) for leaf_item_id in leaf_item_ids]
 
-                pbar.update(1)
+                for msg in messages:
+                    pbar.write(msg)
+                for leaf_item_id, tb in item_failures:
+                    failures.append((leaf_item_id, tb))
+                    pbar.write(f'Failed to process {(leaf_item_id,)}:\n\n' + tb)
+
+                pbar.update(len(leaf_item_ids))
 
                 # Remove an item from the pending queue, freeing the queue master
                 # to retrieve another item
@@ -432,6 +1114,13 @@ async def reparse_fs(
                 pending_queue.task_done()
 
             async def queue_master():
+                batcher: Batcher[int] = Batcher(batch_size, batch_ms)
+
+                async def submit():
+                    if leaf_item_ids := batcher.take():
+                        await pending_queue.put(leaf_item_ids)
+                        asyncio.create_task(_process_and_print(leaf_item_ids))
+
                 wait_finished_submitting = asyncio.create_task(
                     finished_submitting.wait(), name='wait until all leaf items have been submitted'
                 )
@@ -439,16 +1128,22 @@ async def reparse_fs(
                 while pool.running and (not queue.empty() or not finished_submitting.is_set()):
                     queue_get = asyncio.create_task(queue.get(), name='get leaf item from queue')
                     done, pending = await asyncio.wait(
-                        (queue_get, wait_finished_submitting), return_when=asyncio.FIRST_COMPLETED
+                        (queue_get, wait_finished_submitting),
+                        timeout=batcher.time_left(),
+                        return_when=asyncio.FIRST_COMPLETED,
                     )
-                    if finished_submitting.is_set() and queue.empty():
-                        break
 
                     if queue_get in done:
-                        leaf_item_id = queue_get.result()
-                        await pending_queue.put(leaf_item_id)
-                        asyncio.create_task(_process_and_print(leaf_item_id))
+                        batcher.add(queue_get.result())
+                    else:
+                        queue_get.cancel()
+                        if finished_submitting.is_set() and queue.empty():
+                            break
+
+                    if batcher.is_due():
+                        await submit()
 
+                await submit()
                 await pending_queue.join()
 
             processor = asyncio.create_task(queue_master(), name='queue processor')
@@ -476,23 +1171,144 @@ async def reparse_fs(
                 print(f'Encountered {len(failures)} failure(s)\n\n')
 
     else:  # not parallel
-        q = q.with_only_columns(models.LeafItem)
-        pbar.iterable = (await session.execute(q)).scalars()
-        for leaf_item in pbar:
-            if result := await _process_leaf_item(session, leaf_item):
-                pbar.write(result)
+        leaf_item_ids = (await session.execute(q)).scalars().all()
+        pbar.total = len(leaf_item_ids)
 
+        batcher: Batcher[int] = Batcher(batch_size, batch_ms)
 
-async def _multiprocess_leaf_item(leaf_item_id: int) -> str | None:
-    async with btrfs_recon.db.Session() as session:
-        q = sa.select(models.LeafItem).filter_by(id=leaf_item_id)
-        res = await session.execute(q)
-        leaf_item: models.LeafItem = res.scalar()
+        async def flush():
+            ids = batcher.take()
+            result = await process_batch(session, ids, _process_leaf_items)
+            for msg in result.results:
+                pbar.write(msg)
+            for leaf_item_id, tb in result.failures:
+                pbar.write(f'Failed to process {(leaf_item_id,)}:\n\n' + tb)
+            pbar.update(len(ids))
 
-        return await _process_leaf_item(session, leaf_item)
+        for leaf_item_id in leaf_item_ids:
+            batcher.add(leaf_item_id)
+            if batcher.is_due():
+                await flush()
+        await flush()
 
 
-async def _process_leaf_item(session: AsyncSession, leaf_item: models.LeafItem) -> str | None:
-    leaf_item.reparse(session=session)
-    await session.commit()
+async def _multiprocess_leaf_items(
+    leaf_item_ids: list[int],
+) -> tuple[list[str], list[tuple[int, str]]]:
+    """Reparse a batch of leaf items
+
+    Returns the messages of the items reparsed, and the (id, traceback) of those failed.
+    """
+    session = await worker_session()
+    persist = functools.partial(_process_leaf_items, open_device=worker_device_fp)
+    result = await process_batch(session, leaf_item_ids, persist)
+    return result.results, result.failures
+
+
+async def _process_leaf_items(
+    session: AsyncSession,
+    leaf_item_ids: Sequence[int],
+    *,
+    open_device: Callable[[str], BinaryIO] | None = None,
+) -> list[str]:
+    """Reparse leaf items within the session's transaction, leaving the commit to the caller"""
+    q = sa.select(models.LeafItem).filter(models.LeafItem.id.in_(leaf_item_ids))
+    res = await session.execute(q)
+
+    messages = []
+    for leaf_item in res.scalars():
+        fp = open_device(leaf_item.address.device.path) if open_device else None
+        messages.append(await _process_leaf_item(session, leaf_item, fp=fp))
+
+    await session.flush()
+    return messages
+
+
+async def _process_leaf_item(
+    session: AsyncSession, leaf_item: models.LeafItem, *, fp: BinaryIO | None = None
+) -> str:
+    leaf_item.reparse(fp=fp, session=session)
     return f'Reparsed {leaf_item}'
+
+
+@fs.command(name='backfill-bytenr')
+@click.option('-l', '--label', help='The unique label for the filesystem')
+@click.option('--overwrite/--no-overwrite', default=False,
+              help='Whether to recompute logical addresses already recorded')
+@click.option('--batch-size', type=int, default=50_000,
+              help='Maximum number of addresses updated per transaction')
+@pass_session
+async def backfill_bytenr(session: AsyncSession, label: str, overwrite: bool, batch_size: int):
+    """Compute the logical addresses (bytenr) of scanned addresses from the chunk tree
+
+    Physical addresses are mapped back through each device's chunk stripes in batches,
+    and written back with a single UPDATE per batch. Addresses outside of any known
+    chunk are left untouched.
+    """
+    q = sa.select(models.Filesystem).filter_by(label=label)
+    fs: Filesystem = (await session.execute(q)).scalar_one()
+
+    with timed_subtask('Loading chunk tree'):
+        chunk_cache = await models.ChunkTree.refresh_cache(session, filesystem=fs)
+
+    # Both columns are passed as arrays and zipped back into rows by unnest(),
+    # so each batch costs two bind parameters, rather than two per row.
+    bytenrs = sa.select(
+        sa.func.unnest(sa.bindparam('ids', type_=pg.ARRAY(sa.Integer))).label('id'),
+        sa.func.unnest(sa.bindparam('bytenrs', type_=pg.ARRAY(sa.BigInteger))).label('bytenr'),
+    ).subquery('bytenrs')
+    update = (
+        sa.update(models.Address)
+        .where(models.Address.id == bytenrs.c.id)
+        .values(bytenr=sa.cast(bytenrs.c.bytenr, models.Address.bytenr.type))
+        .execution_options(synchronize_session=False)
+    )
+
+    filters = [] if overwrite else [models.Address.bytenr.is_(None)]
+
+    for device in fs.devices:
+        device_filters = [models.Address.device_id == device.id, *filters]
+        total = (await session.execute(
+            sa.select(sa.func.count()).select_from(models.Address).filter(*device_filters)
+        )).scalar()
+
+        pbar = tqdm(
+            desc=str(device),
+            total=total,
+            unit='addr',
+            maxinterval=2,
+            dynamic_ncols=True,
+        )
+        num_unmapped = 0
+        last_id = 0
+
+        with pbar:
+            while True:
+                q = (
+                    sa.select(models.Address.id, models.Address.phys)
+                    .filter(*device_filters, models.Address.id > last_id)
+                    .order_by(models.Address.id)
+                    .limit(batch_size)
+                )
+                rows = (await session.execute(q)).all()
+                if not rows:
+                    break
+
+                ids, physicals = (np.array(column, dtype=np.int64) for column in zip(*rows))
+                last_id = int(ids[-1])
+
+                logicals = chunk_cache.reverse(device.devid, physicals, strict=False)
+                mapped = logicals >= 0
+                num_unmapped += len(rows) - int(mapped.sum())
+
+                if mapped.any():
+                    await session.execute(update, {
+                        'ids': ids[mapped].tolist(),
+                        'bytenrs': logicals[mapped].tolist(),
+                    })
+                    await session.commit()
+
+                pbar.update(len(rows))
+
+        if num_unmapped:
+            click.echo(f'{device}: {num_unmapped} address(es) lie outside of any known chunk')
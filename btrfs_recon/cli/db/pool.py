@@ -0,0 +1,116 @@
+"""A process pool whose workers keep their DB session, file handles, and caches for life
+
+Workers are not recycled after some number of tasks, but when their memory usage
+grows past a limit. Tasks run within the workers may grab the per-process state
+with worker_session() and worker_device_fp().
+"""
+from __future__ import annotations
+
+import os
+import resource
+import sys
+from typing import BinaryIO
+
+from aiomultiprocess import Pool
+from aiomultiprocess.pool import PoolWorker
+from aiomultiprocess.types import QueueID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import btrfs_recon.db
+from btrfs_recon.persistence import models
+
+__all__ = [
+    'DEFAULT_MAX_WORKER_RSS',
+    'WorkerPool',
+    'current_rss',
+    'worker_device_fp',
+    'worker_session',
+]
+
+#: Resident memory (in bytes) beyond which a worker is retired and replaced
+DEFAULT_MAX_WORKER_RSS = 1 << 30  # 1 GiB
+
+_session: AsyncSession | None = None
+_device_fps: dict[str, BinaryIO] = {}
+
+
+def _init_worker() -> None:
+    # Connections inherited over fork() are in use by the parent, and must never be
+    # touched by the child. Drop them, without closing them out from under the parent.
+    btrfs_recon.db.engine.sync_engine.dispose(close=False)
+    btrfs_recon.db.sync_engine.dispose(close=False)
+
+
+async def worker_session() -> AsyncSession:
+    """Return the DB session of the current worker process, opening it on first use
+
+    The ChunkTree cache is warmed alongside the session, and lives as long as it does.
+    """
+    global _session
+    if _session is None:
+        _session = btrfs_recon.db.Session()
+        await models.ChunkTree.refresh_cache(_session)
+    return _session
+
+
+def worker_device_fp(path: str) -> BinaryIO:
+    """Return the read-only handle of the current worker process to a device/image"""
+    if (fp := _device_fps.get(path)) is None:
+        fp = _device_fps[path] = open(path, 'rb')
+    return fp
+
+
+def current_rss() -> int:
+    """Return the resident memory of the current process, in bytes"""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Not Linux; fall back to the peak RSS (reported in KiB everywhere but macOS)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class _RecyclingPoolWorker(PoolWorker):
+    def __init__(self, *args, max_rss: int | None = None, **kwargs):
+        self.max_rss = max_rss
+        super().__init__(*args, **kwargs)
+
+    # PoolWorker.run stops taking new work once it has completed `ttl` tasks (0 meaning
+    # never). Once over the memory limit, a ttl of 1 retires the worker as soon as its
+    # in-flight tasks are done, and the Pool starts a fresh worker in its place.
+    @property
+    def ttl(self) -> int:
+        if self.max_rss and current_rss() > self.max_rss:
+            return 1
+        return 0
+
+    @ttl.setter
+    def ttl(self, value: int) -> None:
+        # Task counts don't drive recycling
+        pass
+
+
+class WorkerPool(Pool):
+    """An aiomultiprocess Pool recycling its workers by memory usage, not task counts"""
+
+    def __init__(self, *args, max_rss: int | None = DEFAULT_MAX_WORKER_RSS, **kwargs):
+        # NOTE: Pool.__init__ starts the workers, so this must be set beforehand
+        self.max_rss = max_rss
+        kwargs.setdefault('initializer', _init_worker)
+        super().__init__(*args, **kwargs)
+
+    def create_worker(self, qid: QueueID) -> _RecyclingPoolWorker:
+        tx, rx = self.queues[qid]
+        process = _RecyclingPoolWorker(
+            tx,
+            rx,
+            concurrency=self.childconcurrency,
+            max_rss=self.max_rss,
+            initializer=self.initializer,
+            initargs=self.initargs,
+            loop_initializer=self.loop_initializer,
+            exception_handler=self.exception_handler,
+        )
+        process.start()
+        return process
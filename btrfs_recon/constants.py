@@ -3,3 +3,4 @@ BTRFS_UUID_SIZE: int = 16
 BTRFS_LABEL_SIZE: int = 256
 BTRFS_CSUM_SIZE: int = 32
 BTRFS_FSID_SIZE: int = 16
+BTRFS_CSUM_TYPE_CRC32C: int = 0
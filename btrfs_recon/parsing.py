@@ -1,5 +1,7 @@
 import asyncio
 import io
+import mmap
+import os
 import typing
 import uuid
 from collections import deque
@@ -8,12 +10,42 @@ from typing import BinaryIO, Callable, Iterable
 import construct as cs
 from tqdm import tqdm
 
-from btrfs_recon.structure import Header, LeafItem, KeyType, ObjectId, Struct, Superblock, TreeNode
-from btrfs_recon.types import DevId, PhysicalAddress
+from btrfs_recon.constants import BTRFS_CSUM_TYPE_CRC32C
+from btrfs_recon.scanner import (
+    BTRFS_DEFAULT_NODESIZE,
+    DEFAULT_WINDOW_SIZE,
+    HeaderScanner,
+    KnownLocations,
+    ScanMethod,
+    node_checksum_valid,
+    nodesize_or_default,
+    read_nodes,
+)
+from btrfs_recon.structure import (
+    Header,
+    LazyTreeNode,
+    LeafItem,
+    KeyType,
+    ObjectId,
+    Struct,
+    Superblock,
+    TreeNode,
+)
+from btrfs_recon.structure.arrays import key_ptrs, raw_header
+from btrfs_recon.structure.compiled import CompiledParser, CompileError, compile_parser
+from btrfs_recon.types import PhysicalRange
 from btrfs_recon.util.chunk_cache import ChunkTreeCache
+from btrfs_recon.util.logical_reader import LogicalReader, NoValidCopyError
 
 
-def parse_fs(*device_handles: BinaryIO, pos: int = 0x10_000) -> tuple[Superblock, ChunkTreeCache]:
+def parse_fs(
+    *device_handles: BinaryIO, pos: int = 0x10_000, nodesize: int | None = None
+) -> tuple[Superblock, ChunkTreeCache]:
+    """Parse the superblock and chunk tree of a filesystem from its devices
+
+    :param nodesize: size of the chunk tree's nodes. Defaults to the superblock's
+        node_size, or, if that isn't a nodesize btrfs supports, 16 KiB.
+    """
     if not device_handles:
         raise ValueError('Please pass at least one device/image file handle')
 
@@ -25,43 +57,61 @@ def parse_fs(*device_handles: BinaryIO, pos: int = 0x10_000) -> tuple[Superblock
         devid_fp_map[dev_item.devid] = fp
 
     assert superblock
+    if nodesize is None:
+        nodesize = nodesize_or_default(superblock.node_size)
 
     tree = ChunkTreeCache()
     for sys_chunk in superblock.sys_chunks:
         tree.insert(
             sys_chunk.key.offset,
-            sys_chunk.chunk.length,
+            sys_chunk.key.offset + sys_chunk.chunk.length,
+            sys_chunk.chunk.stripe_len,
             sys_chunk.chunk.stripes,
+            flags=sys_chunk.chunk.ty,
+            sub_stripes=sys_chunk.chunk.sub_stripes,
         )
 
-    chunk_tree_queue: deque[tuple[DevId, PhysicalAddress]] = deque(tree.offsets(superblock.chunk_root).items())
-    while chunk_tree_queue:
-        devid, physical = chunk_tree_queue.popleft()
-        fp = devid_fp_map[devid]
-        node = parse_at(fp, physical, TreeNode)
-
-        # Leaf node
-        if node.header.level == 0:
-            for item in node['items']:
-                if item.key.ty != KeyType.ChunkItem:
-                    continue
-
-                tree.insert(
-                    item.key.offset,
-                    item.data.length,
-                    item.data.stripes,
-                )
-
-                print(f'=== CHUNK: {item.phys_start} (in node @ {node.phys_start})')
-                print(item)
-                print(f'===')
-                print()
-
-        # Internal node (level != 0)
-        else:
-            for ptr in node['items']:
-                node_physical = tree.offset(ptr.blockptr)
-                chunk_tree_queue.append(node_physical)
+    with LogicalReader(tree, devid_fp_map) as reader:
+        chunk_tree_queue: deque[int] = deque([superblock.chunk_root])
+        while chunk_tree_queue:
+            logical = chunk_tree_queue.popleft()
+            if superblock.csum_type != BTRFS_CSUM_TYPE_CRC32C:
+                # Only crc32c checksums are verified; any copy will have to do
+                data = reader.read(logical, nodesize)
+            else:
+                try:
+                    # Every copy of the node is read at once; the first with a valid checksum wins
+                    data = reader.read_verified(logical, nodesize, node_checksum_valid)
+                except NoValidCopyError as e:
+                    # Damaged or not, a node is better than none
+                    if not e.copies:
+                        raise
+                    data = e.copies[0]
+
+            # Leaf node
+            if raw_header(data)['level'] == 0:
+                # Only the chunk items are decoded, found from the item headers array
+                physical = tree.offset(logical)[1]
+                node = LazyTreeNode(data, physical, physical)
+                for index in node.indices_of(KeyType.ChunkItem):
+                    item = node[index]
+                    tree.insert(
+                        item.key.offset,
+                        item.key.offset + item.data.length,
+                        item.data.stripe_len,
+                        item.data.stripes,
+                        flags=item.data.ty,
+                        sub_stripes=item.data.sub_stripes,
+                    )
+
+                    print(f'=== CHUNK: {item.phys_start} (in node @ {node.phys_start})')
+                    print(item)
+                    print(f'===')
+                    print()
+
+            # Internal node (level != 0)
+            else:
+                chunk_tree_queue.extend(key_ptrs(data)['blockptr'].tolist())
 
     # root_tree_root_physical = tree.offset(superblock.root)
     # root_tree_queue = deque((root_tree_root_physical,))
@@ -74,12 +124,168 @@ def parse_fs(*device_handles: BinaryIO, pos: int = 0x10_000) -> tuple[Superblock
     return superblock, tree
 
 
-def parse_at(fp: BinaryIO, pos: int, type_: cs.Struct | typing.Type[Struct], **contextkw):
+def _compiled_parser(
+    type_: cs.Struct | typing.Type[Struct], contextkw: dict, raw: bool = False
+) -> CompiledParser | None:
+    """Return the compiled parser of a struct, or None if it must be parsed by Construct"""
+    if contextkw or not (isinstance(type_, type) and issubclass(type_, Struct)):
+        return None
+    try:
+        return compile_parser(type_, raw=raw)
+    except CompileError:
+        return None
+
+
+def parse_at(
+    fp: BinaryIO,
+    pos: int,
+    type_: cs.Struct | typing.Type[Struct],
+    *,
+    compiled: bool = False,
+    size: int | None = None,
+    raw: bool = False,
+    **contextkw,
+):
+    """Parse a struct at position pos of fp
+
+    With compiled=True, structs which can be compiled (see structure.compiled) are read
+    into memory and parsed by their compiled parser. Those of variable size are only
+    parsed this way if the number of bytes to read is passed as size (e.g. the nodesize,
+    for TreeNodes). In all other cases, Construct parses the struct from fp.
+
+    With raw=True, display wrappers are skipped (see structure.fields.is_raw), for less
+    allocation churn when parsing in bulk. Struct.cook() applies them afterward.
+    """
+    if compiled and (parser := _compiled_parser(type_, contextkw, raw)):
+        if read_size := parser.size or size:
+            orig_pos = fp.tell()
+            try:
+                fp.seek(pos)
+                data = fp.read(read_size)
+            finally:
+                fp.seek(orig_pos)
+            return parser.parse(data, pos, pos)
+
+    if raw:
+        contextkw['raw'] = True
     if issubclass(type_, Struct):
         type_ = type_.as_struct()
     return cs.Pointer(pos, type_).parse_stream(fp, **contextkw)
 
 
+class PositionedBytesIO(io.BytesIO):
+    """In-memory bytes read from a device, which report their positions on the device
+
+    Seeking to and telling absolute device positions lets structs parsed from the
+    bytes carry the same phys_start/phys_end as they would if parsed from the device.
+    """
+
+    def __init__(self, data: bytes, base: int):
+        super().__init__(data)
+        self.base = base
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos -= self.base
+        return super().seek(pos, whence) + self.base
+
+    def tell(self) -> int:
+        return super().tell() + self.base
+
+
+class PositionedBufferIO:
+    """A read-only stream over a buffer read from a device, which never copies it
+
+    Like PositionedBytesIO, positions are those on the device. Unlike it, reads return
+    memoryview slices of the buffer, so byte fields parsed by Construct from the stream
+    refer to the buffer, rather than copies of it.
+    """
+
+    def __init__(self, buffer: bytes | memoryview | mmap.mmap, base: int):
+        self.view = memoryview(buffer).cast('B')
+        self.base = base
+        self._pos = 0
+
+    def read(self, size: int | None = -1) -> memoryview:
+        start = self._pos
+        end = len(self.view) if size is None or size < 0 else min(start + size, len(self.view))
+        self._pos = max(start, end)
+        return self.view[start:end]
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos -= self.base
+        elif whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += len(self.view)
+        else:
+            raise ValueError(f'invalid whence ({whence})')
+
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos + self.base}')
+        self._pos = pos
+        return self.tell()
+
+    def tell(self) -> int:
+        return self._pos + self.base
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+
+def parse_bytes_at(
+    data: bytes | memoryview | mmap.mmap,
+    base: int,
+    pos: int,
+    type_: cs.Struct | typing.Type[Struct],
+    *,
+    compiled: bool = False,
+    raw: bool = False,
+    **contextkw,
+):
+    """Parse a struct at device position pos, from bytes read from the device at base
+
+    data may also be a memoryview (or any other buffer, like an mmap of the device),
+    which is parsed without copying: the struct's byte fields (e.g. Header.csum,
+    FileExtentItem.data, Superblock._unparsed_data) are memoryview slices of it, until
+    materialized (see Struct.materialize).
+
+    With compiled=True, the struct's compiled parser is used, if it has one. With
+    raw=True, display wrappers are skipped (see parse_at).
+    """
+    if compiled and (parser := _compiled_parser(type_, contextkw, raw)):
+        return parser.parse(data, pos, base)
+
+    if isinstance(data, bytes):
+        stream = PositionedBytesIO(data, base)
+    else:
+        stream = PositionedBufferIO(data, base)
+    return parse_at(stream, pos, type_, raw=raw, **contextkw)
+
+
+def map_device(fp: BinaryIO) -> memoryview:
+    """Map a whole device/image into memory (read-only), for parsing with parse_bytes_at
+
+    Positions within the returned view are device positions (i.e. its base is 0).
+
+    NOTE: the mapping can't be closed while the view (or any slice of it, like the
+          byte fields of structs parsed from it) is referenced. Structs parsed by
+          Construct (rather than compiled parsers) leave reference cycles holding
+          slices, which are only released by the garbage collector.
+    """
+    # NOTE: block devices report no size through fstat, so their end is found by seeking
+    orig_pos = fp.tell()
+    try:
+        size = fp.seek(0, os.SEEK_END)
+    finally:
+        fp.seek(orig_pos)
+    return memoryview(mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ))
+
+
 def pparse_at(fp: BinaryIO, pos: int, type_: cs.Struct | typing.Type[Struct], **contextkw):
     print(parse_at(fp, pos, type_, **contextkw))
 
@@ -112,40 +318,49 @@ async def find_nodes(
     echo: bool = True,
     show_progress: bool = True,
     tqdm_kwargs: dict = None,
-) -> tuple[FindNodesLogFunc, typing.AsyncIterable[tuple[int, Header]]]:
-    if fsid is not None and not isinstance(fsid, uuid.UUID):
-        fsid = uuid.UUID(fsid)
-
-    fp.seek(0, io.SEEK_END)
-    file_size = fp.tell()
-    max_loc = file_size - Header.sizeof()
-    aligned_max_loc = max_loc - (max_loc % alignment)
+    window_size: int = DEFAULT_WINDOW_SIZE,
+    method: ScanMethod = 'auto',
+    skip_holes: bool = True,
+    known: KnownLocations | None = None,
+    ranges: Iterable[PhysicalRange] | None = None,
+    on_progress: Callable[[int], object] | None = None,
+    on_window_done: Callable[[PhysicalRange], object] | None = None,
+) -> tuple[FindNodesLogFunc, typing.AsyncIterable[list[tuple[int, Header]]]]:
+    """Locate all plausible tree node headers in a device/image
+
+    The returned async iterable yields a batch of (loc, header) pairs for every
+    window of the device read (see HeaderScanner), skipping empty batches.
+
+    :param skip_holes: whether to skip over holes in sparse images, without reading them
+    :param known: if passed, headers found at these locations are skipped without parsing
+    :param ranges: if passed, only these half-open [start, end) physical ranges are
+        scanned (further limited by start_loc and end_loc)
+    :param on_progress: called with the number of locations checked, after each window
+    :param on_window_done: called with the [start, end) range of each window, once all its
+        nodes have been consumed from the iterable (i.e. when the next batch is requested)
+    """
+    scanner = HeaderScanner(
+        fp,
+        alignment=alignment,
+        fsid=fsid,
+        window_size=window_size,
+        method=method,
+        skip_holes=skip_holes,
+        known=known,
+    )
 
+    file_size = scanner.file_size
     max_hex_length = len(f'0x{file_size:x}')
     max_int_length = len(f'{file_size}')
 
-    if reversed:
-        if start_loc < end_loc:
-            start_loc, end_loc = end_loc, start_loc
-
-        start_loc = aligned_max_loc if start_loc is None else start_loc
-        start_loc = start_loc + alignment - (start_loc % alignment)
-        end_loc = -1 if end_loc is None else end_loc - 1
-        loc_iter = range(start_loc, end_loc, -alignment)
-    else:
-        if start_loc > end_loc:
-            start_loc, end_loc = end_loc, start_loc
-
-        start_loc = 0 if start_loc is None else start_loc
-        start_loc = start_loc - (start_loc % alignment)
-        end_loc = aligned_max_loc + 1 if end_loc is None else end_loc + 1
-        loc_iter = range(start_loc, end_loc, alignment)
+    ranges = scanner.bounded_ranges(ranges, start_loc, end_loc)
+    num_locs = scanner.count_locs(ranges)
 
     if show_progress:
         tqdm_kwargs = tqdm_kwargs or {}
         tqdm_kwargs.setdefault('unit', 'loc')
 
-        pbar = tqdm(loc_iter, **tqdm_kwargs)
+        pbar = tqdm(total=num_locs, **tqdm_kwargs)
         buf = io.StringIO()
 
         def log(*args, **kwargs):
@@ -159,54 +374,83 @@ async def find_nodes(
         log.pbar = pbar
 
     else:
-        pbar = loc_iter
+        pbar = None
         log = lambda *a, **k: print(*a, **k)
         log.pbar = None
 
-    async def find_results() -> typing.AsyncGenerator[tuple[int, Header], None]:
-        for loc in pbar:
-            # Yield to event loop
-            await asyncio.sleep(0)
+    async def find_results() -> typing.AsyncGenerator[list[tuple[int, Header]], None]:
+        batches = scanner.scan_ranges(ranges, reversed=reversed)
+        num_skipped_bytes = 0
+        num_known = 0
+        while True:
+            # Read and triage each window in a worker thread, so the event loop (and the
+            # scans of any other devices) may proceed during the I/O
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+
+            num_skipped_bytes += batch.num_skipped_bytes
+            num_known += batch.num_known
 
             if show_progress:
-                pbar.set_postfix_str(hex(loc))
+                pbar.update(batch.num_locs)
+                pbar.set_postfix(
+                    loc=hex(batch.start),
+                    skipped=tqdm.format_sizeof(num_skipped_bytes, 'B', 1024),
+                    known=num_known,
+                )
+
+            if on_progress is not None:
+                on_progress(batch.num_locs)
+
+            nodes = []
+            for loc, header in batch.nodes:
+                if predicate is not None and not predicate(loc, header):
+                    continue
+
+                if echo:
+                    log(f'0x{loc:0{max_hex_length}x} ({loc:>{max_int_length}d})')
 
-            header = parse_at(fp, loc, Header)
-            if fsid is not None and header.fsid != fsid:
-                continue
+                nodes.append((loc, header))
 
-            if predicate is not None and not predicate(loc, header):
-                continue
+            if nodes:
+                yield nodes
 
-            if echo:
-                log(f'0x{loc:0{max_hex_length}x} ({loc:>{max_int_length}d})')
+            if on_window_done is not None:
+                on_window_done((batch.start, batch.end))
 
-            yield loc, header
+        if show_progress:
+            pbar.close()
 
     return log, find_results()
 
 
-def find_fs_roots(fp: io.FileIO, **kwargs) -> Iterable[tuple[int, LeafItem]]:
-    log, results = find_nodes(
+async def find_fs_roots(
+    fp: io.FileIO, *, nodesize: int = BTRFS_DEFAULT_NODESIZE, **kwargs
+) -> typing.AsyncIterator[tuple[int, LeafItem]]:
+    log, results = await find_nodes(
         fp, **kwargs, predicate=lambda loc, header: header.level == 0 and header.nritems > 0
     )
 
-    for loc, header in results:
-        node = parse_at(fp, loc, TreeNode)
-        for item in reversed(node['items']):
-            if not (
-                item.key.objectid == ObjectId.FsTree
-                and item.key.ty == KeyType.RootItem
-            ):
-                continue
-
-            log(f'\n\n!!!!!!!! FOUND ROOT TREE ITEM !!!!!!!!!!!!!')
-            log(f'### Header — {hex(loc)} (loc)')
-            log(str(header))
-            log(f'\n')
-            log(f'### Item')
-            log(str(item))
-            log('')
-            log('')
-
-            yield loc, item
+    async for nodes in results:
+        locs = [loc for loc, header in nodes]
+        for (loc, header), data in zip(nodes, read_nodes(fp, locs, nodesize)):
+            # Only the root items are decoded; the rest of the node is never touched
+            node = LazyTreeNode(data, loc, loc)
+            root_items = node.key_range(
+                (ObjectId.FsTree, KeyType.RootItem, 0),
+                (ObjectId.FsTree, KeyType.RootItem, 0xffff_ffff_ffff_ffff),
+            )
+            for index in reversed(root_items):
+                item = node[index]
+
+                log(f'\n\n!!!!!!!! FOUND ROOT TREE ITEM !!!!!!!!!!!!!')
+                log(f'### Header — {hex(loc)} (loc)')
+                log(str(header))
+                log(f'\n')
+                log(f'### Item')
+                log(str(item))
+                log('')
+                log('')
+
+                yield loc, item
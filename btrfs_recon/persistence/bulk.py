@@ -0,0 +1,403 @@
+"""Bulk ingest of parsed tree nodes, bypassing the ORM
+
+Rather than building model instances and flushing them row by row, the rows of every
+table touched by a batch of tree nodes are built straight from the parsed structs,
+streamed into temporary staging tables with binary COPY, and merged into the real
+tables with a handful of set-based INSERT ... SELECT statements.
+
+The rows produced match those of the StructSchemas. Unlike the ORM path, however,
+stored nodes are never updated: any node with a struct at an already-stored address
+is dropped from the batch whole.
+"""
+from __future__ import annotations
+
+import functools
+from dataclasses import dataclass
+from typing import Any, Callable, Type
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from btrfs_recon import structure
+from btrfs_recon.persistence import models
+from btrfs_recon.persistence.fields.uint import PGUnsignedInteger
+from btrfs_recon.persistence.serializers import get_row_serializer, registry
+
+__all__ = [
+    'NodeRows',
+    'bulk_ingest',
+]
+
+ModelType = Type[models.BaseModel]
+
+#: Tables written by bulk ingest, in an order satisfying their foreign keys
+MERGE_ORDER: tuple[ModelType, ...] = (
+    models.Address,
+    models.TreeNode,
+    models.Key,
+    models.KeyPtr,
+    models.LeafItem,
+    models.InodeItem,
+    models.RootItem,
+    models.InodeRef,
+    models.DirItem,
+    models.FileExtentItem,
+    models.ChunkItem,
+    models.Stripe,
+)
+
+#: Columns which can't be filled until a later table is merged (InodeItems within
+#: RootItems refer to the RootItem, which itself refers to the InodeItem)
+POST_UPDATE_COLUMNS: dict[ModelType, tuple[str, ...]] = {
+    models.InodeItem: ('root_item_id',),
+}
+
+#: Columns filled by the DB, never staged
+_SERVER_COLUMNS = frozenset({'created_at', 'updated_at'})
+
+#: Staging column holding the id of the tree node a row was parsed from
+_NODE_COLUMN = '_node'
+
+
+@dataclass(slots=True, frozen=True)
+class _Ref:
+    """Reference to a row built in the same batch, whose id is not yet allocated"""
+    model: ModelType
+    index: int
+
+
+def _enum_name(column: sa.Column) -> Callable[[Any], str]:
+    names = frozenset(column.type.enums)
+
+    def convert(value: Any) -> str:
+        name = getattr(value, 'name', value)
+        if name not in names:
+            raise ValueError(f'{value!r} is not a valid value for {column}')
+        return name
+
+    return convert
+
+
+def _staging_type(column: sa.Column) -> tuple[str, Callable[[Any], Any] | None]:
+    """Return the type of a column's staging column, and how to convert values for it
+
+    Unsigned ints are staged as numeric, and cast to their real type on merge, as only
+    the builtin types may be written with binary COPY. Enums are staged by name.
+    """
+    col_type = column.type
+    if isinstance(col_type, PGUnsignedInteger):
+        return 'numeric', int
+    elif isinstance(col_type, sa.Enum):
+        return 'text', _enum_name(column)
+    elif isinstance(col_type, pg.BYTEA):
+        return 'bytea', bytes
+    elif isinstance(col_type, pg.UUID):
+        return 'uuid', None
+    elif isinstance(col_type, sa.DateTime):
+        return 'timestamp', None
+    elif isinstance(col_type, sa.Integer):
+        return 'int4', None
+    elif isinstance(col_type, sa.String):
+        return 'text', str
+    else:
+        raise TypeError(f'Unable to stage column {column} of type {col_type!r}')
+
+
+def _merge_expr(column: sa.Column) -> str:
+    """Return the SQL expression converting a staging column to its real type"""
+    name = f's."{column.name}"'
+    col_type = column.type
+    if isinstance(col_type, PGUnsignedInteger):
+        return f'CAST(CAST({name} AS text) AS {col_type.sqltype})'
+    elif isinstance(col_type, sa.Enum):
+        return f'CAST({name} AS {col_type.name})'
+    else:
+        return name
+
+
+@functools.cache
+def _staged_columns(model: ModelType) -> tuple[sa.Column, ...]:
+    return tuple(
+        column
+        for column in model.__table__.columns
+        if column.computed is None and column.name not in _SERVER_COLUMNS
+    )
+
+
+@functools.cache
+def _converters(model: ModelType) -> dict[str, Callable[[Any], Any]]:
+    return {
+        column.name: convert
+        for column in _staged_columns(model)
+        if (convert := _staging_type(column)[1]) is not None
+    }
+
+
+def _staging_table(model: ModelType) -> str:
+    return f'_bulk_{model.__tablename__}'
+
+
+class NodeRows:
+    """The rows of every table touched by a batch of tree nodes
+
+    Rows refer to each other by _Ref, until ids are allocated for them on ingest.
+    """
+
+    def __init__(self):
+        self.rows: dict[ModelType, list[dict[str, Any]]] = {model: [] for model in MERGE_ORDER}
+        #: Physical address of each node added, in the order of their TreeNode rows
+        self.node_locs: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.node_locs)
+
+    def add_node(self, tree_node: structure.TreeNode, device_id: int) -> None:
+        """Add the rows of a tree node, its items, and their data
+
+        If any field can't be represented (e.g. an enum value the DB doesn't know), a
+        ValueError is raised, and none of the node's rows are kept.
+        """
+        counts = {model: len(rows) for model, rows in self.rows.items()}
+        try:
+            self._add_tree_node(tree_node, device_id)
+        except Exception:
+            for model, count in counts.items():
+                del self.rows[model][count:]
+            raise
+
+        self.node_locs.append(tree_node.phys_start)
+
+    def _add(self, model: ModelType, node: _Ref, values: dict[str, Any]) -> _Ref:
+        converters = _converters(model)
+        for name, value in values.items():
+            if value is not None and type(value) is not _Ref and name in converters:
+                values[name] = converters[name](value)
+
+        rows = self.rows[model]
+        ref = _Ref(model, len(rows))
+        values[_NODE_COLUMN] = node
+        rows.append(values)
+        return ref
+
+    def _set(self, ref: _Ref, **values) -> None:
+        self.rows[ref.model][ref.index].update(values)
+
+    def _add_struct(
+        self,
+        model: Type[models.BaseStruct],
+        struct: structure.Struct,
+        device_id: int,
+        node: _Ref,
+        **values,
+    ) -> _Ref:
+        """Add the rows of a struct and its address
+
+        Column values are those of the struct's compiled row serializer, overridden by
+        any values passed (generally, the relationships to other rows).
+        """
+        address_values, struct_values = get_row_serializer(model)(struct)
+
+        address = self._add(models.Address, node, {
+            **address_values,
+            'device_id': device_id,
+            'struct_type': model.__name__,
+        })
+        ref = self._add(model, node, {
+            **struct_values,
+            **values,
+            'address_id': address,
+        })
+        self._set(address, struct_id=ref)
+        return ref
+
+    def _add_key(
+        self, key: structure.Key, device_id: int, node: _Ref, owner: _Ref
+    ) -> _Ref:
+        return self._add_struct(
+            models.Key, key, device_id, node,
+            struct_type=owner.model.__name__, struct_id=owner,
+        )
+
+    def _add_tree_node(self, tree_node: structure.TreeNode, device_id: int) -> None:
+        header = tree_node.header
+
+        # The tree node's own row is next up, and every row of the node points to it
+        node = _Ref(models.TreeNode, len(self.rows[models.TreeNode]))
+        self._add_struct(models.TreeNode, tree_node, device_id, node)
+
+        for item in tree_node.items:
+            if header.level == 0:
+                self._add_leaf_item(item, device_id, node)
+            else:
+                key_ptr = self._add_struct(
+                    models.KeyPtr, item, device_id, node, parent_id=node, ref_node_id=None,
+                )
+                self._set(key_ptr, key_id=self._add_key(item.key, device_id, node, key_ptr))
+
+    def _add_leaf_item(self, item: structure.LeafItem, device_id: int, node: _Ref) -> None:
+        leaf_item = self._add_struct(models.LeafItem, item, device_id, node, parent_id=node)
+        self._set(leaf_item, key_id=self._add_key(item.key, device_id, node, leaf_item))
+
+        entry = registry.find_by_key_type(item.key.ty)
+        if entry is None or item.data is None:
+            return
+
+        model = entry.model
+        data = item.data
+        values = {}
+        if issubclass(model, models.BaseLeafItemData):
+            values['leaf_item_id'] = leaf_item
+
+        ref = self._add_struct(model, data, device_id, node, **values)
+        self._set(leaf_item, struct_type=model.__name__, struct_id=ref)
+
+        if model is models.DirItem:
+            self._set(ref, location_id=self._add_key(data.location, device_id, node, ref))
+
+        elif model is models.RootItem:
+            inode = self._add_struct(
+                models.InodeItem, data.inode, device_id, node,
+                leaf_item_id=None, root_item_id=ref,
+            )
+            drop_progress = None
+            if data.drop_progress:
+                drop_progress = self._add_key(data.drop_progress, device_id, node, ref)
+            self._set(ref, inode_id=inode, drop_progress_id=drop_progress)
+
+        elif model is models.ChunkItem:
+            for stripe in data.stripes:
+                self._add_struct(models.Stripe, stripe, device_id, node, chunk_item_id=ref)
+
+
+async def _ensure_staging_tables(session: AsyncSession) -> None:
+    for model in MERGE_ORDER:
+        columns = ', '.join(
+            f'"{column.name}" {_staging_type(column)[0]}'
+            for column in _staged_columns(model)
+        )
+        await session.execute(sa.text(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS {_staging_table(model)} '
+            f'({columns}, "{_NODE_COLUMN}" int4) '
+            f'ON COMMIT DELETE ROWS'
+        ))
+
+
+async def _allocate_ids(session: AsyncSession, rows: NodeRows) -> dict[ModelType, list[int]]:
+    ids = {}
+    for model, model_rows in rows.rows.items():
+        if not model_rows:
+            continue
+
+        res = await session.execute(
+            sa.text(
+                'SELECT nextval(pg_get_serial_sequence(:table, \'id\')) '
+                'FROM generate_series(1, :num)'
+            ),
+            {'table': model.__tablename__, 'num': len(model_rows)},
+        )
+        ids[model] = list(res.scalars())
+    return ids
+
+
+async def _copy_rows(
+    session: AsyncSession, rows: NodeRows, ids: dict[ModelType, list[int]]
+) -> None:
+    conn = await session.connection()
+    raw_conn = await conn.get_raw_connection()
+
+    async with raw_conn.driver_connection.cursor() as cursor:
+        for model, model_rows in rows.rows.items():
+            if not model_rows:
+                continue
+
+            columns = _staged_columns(model)
+            names = [column.name for column in columns if column.name != 'id'] + [_NODE_COLUMN]
+            types = [_staging_type(column)[0] for column in columns if column.name != 'id']
+            col_list = ', '.join(f'"{name}"' for name in ['id', *names])
+
+            async with cursor.copy(
+                f'COPY {_staging_table(model)} ({col_list}) FROM STDIN (FORMAT BINARY)'
+            ) as copy:
+                copy.set_types(['int4', *types, 'int4'])
+
+                model_ids = ids[model]
+                for row_id, row in zip(model_ids, model_rows):
+                    values = [row_id]
+                    for name in names:
+                        value = row.get(name)
+                        if type(value) is _Ref:
+                            value = ids[value.model][value.index]
+                        values.append(value)
+                    await copy.write_row(values)
+
+
+async def _drop_stored_nodes(session: AsyncSession) -> set[int]:
+    """Remove from staging every node with a struct at an already-stored address
+
+    Returns the TreeNode ids of the nodes removed.
+    """
+    columns = {column.name: column for column in _staged_columns(models.Address)}
+    res = await session.execute(sa.text(
+        f'SELECT DISTINCT s."{_NODE_COLUMN}" '
+        f'FROM {_staging_table(models.Address)} s '
+        f'JOIN address a ON a.device_id = s.device_id '
+        f'AND a.phys = {_merge_expr(columns["phys"])} '
+        f'AND a.phys_size = {_merge_expr(columns["phys_size"])}'
+    ))
+    stored_nodes = list(res.scalars())
+
+    if stored_nodes:
+        for model in MERGE_ORDER:
+            await session.execute(
+                sa.text(f'DELETE FROM {_staging_table(model)} WHERE "{_NODE_COLUMN}" = ANY(:nodes)'),
+                {'nodes': stored_nodes},
+            )
+
+    return set(stored_nodes)
+
+
+async def _merge(session: AsyncSession) -> None:
+    for model in MERGE_ORDER:
+        post_update = POST_UPDATE_COLUMNS.get(model, ())
+        columns = _staged_columns(model)
+
+        col_list = ', '.join(f'"{column.name}"' for column in columns)
+        exprs = ', '.join(
+            'NULL' if column.name in post_update else _merge_expr(column)
+            for column in columns
+        )
+        await session.execute(sa.text(
+            f'INSERT INTO {model.__tablename__} ({col_list}) '
+            f'SELECT {exprs} FROM {_staging_table(model)} s'
+        ))
+
+    for model, post_update in POST_UPDATE_COLUMNS.items():
+        for name in post_update:
+            await session.execute(sa.text(
+                f'UPDATE {model.__tablename__} t SET "{name}" = s."{name}" '
+                f'FROM {_staging_table(model)} s '
+                f'WHERE t.id = s.id AND s."{name}" IS NOT NULL'
+            ))
+
+
+async def bulk_ingest(session: AsyncSession, rows: NodeRows) -> list[int]:
+    """Write the rows of a batch of tree nodes to the DB, within the session's transaction
+
+    Returns the physical addresses of the tree nodes written. The caller is responsible
+    for committing.
+    """
+    if not rows:
+        return []
+
+    await _ensure_staging_tables(session)
+    ids = await _allocate_ids(session, rows)
+    await _copy_rows(session, rows, ids)
+    stored_nodes = await _drop_stored_nodes(session)
+    await _merge(session)
+
+    return [
+        loc
+        for node_id, loc in zip(ids[models.TreeNode], rows.node_locs)
+        if node_id not in stored_nodes
+    ]
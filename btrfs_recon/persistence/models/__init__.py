@@ -10,6 +10,7 @@ from .inode import *
 from .key import *
 from .physical import *
 from .root_item import *
+from .scan_progress import *
 from .superblock import *
 from .tree_node import *
 
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Awaitable, Iterable
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Iterable, TYPE_CHECKING
 
 import sqlalchemy.dialects.postgresql as pg
 import sqlalchemy as sa
@@ -8,13 +10,17 @@ import sqlalchemy.orm as orm
 from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from btrfs_recon import structure
-from btrfs_recon.types import DevId, PhysicalAddress
+from btrfs_recon import settings, structure
+from btrfs_recon.types import DevId, PhysicalAddress, PhysicalRange
 from btrfs_recon.util.properties import classproperty
-from btrfs_recon.util.chunk_cache import ChunkTreeCache
+from btrfs_recon.util.chunk_cache import ChunkTreeCache, stripe_extent_length
+from btrfs_recon.util.ranges import merge_ranges
 from .. import fields
 from ._views import MaterializedView
 
+if TYPE_CHECKING:
+    from .fs import Filesystem
+
 __all__ = ['ChunkTree']
 
 
@@ -26,6 +32,7 @@ class ChunkTree(MaterializedView):
     length = sa.Column(fields.uint8)
     stripe_len = sa.Column(fields.uint8)
     num_stripes = sa.Column(fields.uint2)
+    sub_stripes = sa.Column(fields.uint2)
     stripes: orm.Mapped[tuple[tuple[DevId, PhysicalAddress], ...]] = sa.Column(
         sa.ARRAY(fields.uint8, dimensions=2, as_tuple=True)
     )
@@ -64,6 +71,7 @@ class ChunkTree(MaterializedView):
                 ChunkItem.length,
                 ChunkItem.stripe_len,
                 ChunkItem.num_stripes,
+                ChunkItem.sub_stripes,
                 stripes.label('stripes'),
                 *flag_fields,
             )
@@ -82,50 +90,188 @@ class ChunkTree(MaterializedView):
                 log_end,
                 ChunkItem.stripe_len,
                 ChunkItem.num_stripes,
+                ChunkItem.sub_stripes,
             )
             .order_by(log_start)
         )
 
-    _cache: ChunkTreeCache | None = None
+    @property
+    def flags(self) -> int:
+        """The chunk's BlockGroupFlags, reassembled from the has_*_flag columns"""
+        flags = 0
+        for flag in structure.BlockGroupFlag:
+            if getattr(self, f'has_{flag.name}_flag'):
+                flags |= flag
+        return flags
+
+    @property
+    def stripe_extent_length(self) -> int:
+        """Number of bytes the chunk occupies on the device of each of its stripes"""
+        return stripe_extent_length(self.length, self.flags, self.num_stripes, self.sub_stripes)
+
+    @classmethod
+    async def device_ranges(
+        cls,
+        session: AsyncSession,
+        *,
+        filesystem: Filesystem | None = None,
+        flags: int | None = None,
+    ) -> dict[DevId, list[PhysicalRange]]:
+        """Return the physical ranges of each device occupied by chunks
+
+        :param filesystem: if passed, only that filesystem's chunks are included. As
+            devids are only unique within a filesystem, pass it whenever the DB may
+            hold more than one.
+        :param flags: if passed, only chunks with any of these BlockGroupFlags are included
+        """
+        res = await session.execute(cls._cache_query(filesystem))
+
+        ranges: dict[DevId, list[PhysicalRange]] = defaultdict(list)
+        for chunk in res.scalars():
+            if flags is not None and not chunk.flags & flags:
+                continue
+
+            extent_length = chunk.stripe_extent_length
+            for devid, offset in chunk.stripes:
+                ranges[devid].append((offset, offset + extent_length))
+
+        return {devid: merge_ranges(devid_ranges) for devid, devid_ranges in ranges.items()}
+
+    #: Loaded chunk maps, by Filesystem.id (None for the map of all filesystems)
+    _caches: dict[int | None, ChunkTreeCache] = {}
 
     @classproperty
     def cache(cls) -> ChunkTreeCache:
-        if cls._cache is None:
+        return cls.get_cache()
+
+    @classmethod
+    def get_cache(cls, filesystem: Filesystem | None = None) -> ChunkTreeCache:
+        """Return the loaded chunk map of a filesystem (or of all filesystems, if None)"""
+        if (cache := cls._caches.get(filesystem.id if filesystem else None)) is None:
             raise RuntimeError(
                 'ChunkTreeCache not yet loaded. Please call refresh_cache to load it.'
             )
-        return cls._cache
+        return cache
 
     @classmethod
     def refresh_cache(
-        cls, session: AsyncSession | orm.Session, *, force: bool = False
-    ) -> Awaitable[None] | None:
+        cls,
+        session: AsyncSession | orm.Session,
+        *,
+        filesystem: Filesystem | None = None,
+        force: bool = False,
+    ) -> Awaitable[ChunkTreeCache] | ChunkTreeCache:
+        """Load the chunk map of a filesystem (or of all filesystems), if not yet loaded
+
+        Chunk maps queried from the DB are saved to settings.CHUNK_MAP_CACHE_DIR, in
+        files named after the current storage of the chunk_tree view. Without a unique
+        index, the view can't be refreshed CONCURRENTLY, so every REFRESH writes new
+        storage — and until then, any process loads the map by memory-mapping its file.
+
+        :param force: whether to query the map from the DB, even if already loaded or saved
+        """
         if isinstance(session, AsyncSession):
-            return cls._refresh_cache_async(session, force=force)
+            return cls._refresh_cache_async(session, filesystem=filesystem, force=force)
+
+        if not force and (cache := cls._caches.get(filesystem.id if filesystem else None)) is not None:
+            return cache
 
-        if cls._cache and not force:
-            return
+        version = session.execute(cls._cache_version_query()).scalar()
+        path = cls._cache_path(session, filesystem, version)
+        if not force and (cache := cls._load_cache_file(filesystem, path)) is not None:
+            return cache
 
-        res = session.execute(sa.select(ChunkTree))
-        chunks = res.scalars()
-        cls.fill_cache(chunks)
+        res = session.execute(cls._cache_query(filesystem))
+        return cls.fill_cache(res.scalars(), filesystem=filesystem, path=path)
 
     @classmethod
-    async def _refresh_cache_async(cls, session: AsyncSession, *, force: bool = False) -> None:
-        if cls._cache and not force:
-            return
+    async def _refresh_cache_async(
+        cls, session: AsyncSession, *, filesystem: Filesystem | None = None, force: bool = False
+    ) -> ChunkTreeCache:
+        if not force and (cache := cls._caches.get(filesystem.id if filesystem else None)) is not None:
+            return cache
+
+        version = (await session.execute(cls._cache_version_query())).scalar()
+        path = cls._cache_path(session, filesystem, version)
+        if not force and (cache := cls._load_cache_file(filesystem, path)) is not None:
+            return cache
 
-        res = await session.execute(sa.select(ChunkTree))
-        chunks = res.scalars()
-        cls.fill_cache(chunks)
+        res = await session.execute(cls._cache_query(filesystem))
+        return cls.fill_cache(res.scalars(), filesystem=filesystem, path=path)
 
     @classmethod
-    def fill_cache(cls, chunks: Iterable[ChunkTree]) -> None:
-        cls._cache = ChunkTreeCache()
+    def _cache_query(cls, filesystem: Filesystem | None) -> sa.sql.Select:
+        q = sa.select(ChunkTree)
+        if filesystem is not None:
+            from . import Address, ChunkItem
+
+            device_ids = [device.id for device in filesystem.devices]
+            q = q.filter(ChunkTree.id.in_(
+                sa.select(ChunkItem.id)
+                .join(Address, ChunkItem.address_id == Address.id)
+                .filter(Address.device_id.in_(device_ids))
+            ))
+        return q
+
+    @classmethod
+    def _cache_version_query(cls) -> sa.sql.Select:
+        return sa.select(sa.func.pg_relation_filenode(sa.cast(cls.__tablename__, pg.REGCLASS)))
+
+    @classmethod
+    def _cache_path(
+        cls, session: AsyncSession | orm.Session, filesystem: Filesystem | None, version: int
+    ) -> Path:
+        if filesystem is None:
+            name = 'all'
+        elif filesystem.fsid is not None:
+            name = str(filesystem.fsid)
+        else:
+            name = f'fs{filesystem.id}'
+        return settings.CHUNK_MAP_CACHE_DIR / f'{session.bind.url.database}-{name}-{version}.npy'
+
+    @classmethod
+    def _load_cache_file(cls, filesystem: Filesystem | None, path: Path) -> ChunkTreeCache | None:
+        try:
+            cache = ChunkTreeCache.load(path)
+        except (OSError, ValueError):
+            return None
+
+        cls._caches[filesystem.id if filesystem else None] = cache
+        return cache
+
+    @classmethod
+    def fill_cache(
+        cls,
+        chunks: Iterable[ChunkTree],
+        *,
+        filesystem: Filesystem | None = None,
+        path: Path | None = None,
+    ) -> ChunkTreeCache:
+        """Load a chunk map from ChunkTree rows, saving it to path, if passed
+
+        Maps saved for earlier versions of the view are removed.
+        """
+        cache = ChunkTreeCache()
         for chunk in chunks:
-            cls._cache.insert(
+            cache.insert(
                 chunk.log_start,
                 chunk.log_end,
                 chunk.stripe_len,
-                chunk.stripes
+                chunk.stripes,
+                flags=chunk.flags,
+                sub_stripes=chunk.sub_stripes,
             )
+        cls._caches[filesystem.id if filesystem else None] = cache
+
+        if path is not None:
+            prefix = path.stem.rpartition('-')[0]
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                for stale_path in path.parent.glob(f'{prefix}-*.npy'):
+                    stale_path.unlink(missing_ok=True)
+                cache.save(path)
+            except OSError:
+                # Saved maps only speed up loading; the loaded map is all that's needed
+                pass
+
+        return cache
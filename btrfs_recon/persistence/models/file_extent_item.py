@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from io import BytesIO
 from typing import Iterable
 
 import sqlalchemy as sa
@@ -10,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from btrfs_recon.persistence import fields
 from btrfs_recon.structure import CompressionType, EncodingType, EncryptionType, ExtentDataType
 from btrfs_recon.types import DevId, PhysicalAddress
+from btrfs_recon.util.logical_reader import LogicalReader
 from .base import BaseLeafItemData
 
 __all__ = ['FileExtentItem']
@@ -60,18 +60,19 @@ class FileExtentItem(BaseLeafItemData):
     async def calculate_phys(
         self, session: AsyncSession, *, size: int | None = None
     ) -> Iterable[tuple[DevId, PhysicalAddress, int]]:
-        from btrfs_recon.persistence import ChunkTree
+        from btrfs_recon.persistence import ChunkTree, Filesystem
 
         assert self.type == ExtentDataType.REGULAR, \
             f'Can only calculate physical addresses of REGULAR files. Found: {self.type}'
 
-        await ChunkTree.refresh_cache(session)
-        return ChunkTree.cache.offsets(
+        filesystem = await Filesystem.of_device(session, self.address.device_id)
+        chunk_cache = await ChunkTree.refresh_cache(session, filesystem=filesystem)
+        return chunk_cache.offsets(
             self.disk_bytenr, size if size is not None else self.disk_num_bytes
         )
 
     async def read_bytes(self, session: AsyncSession, *, size: int | None = None) -> bytes:
-        from btrfs_recon.persistence.models import Device
+        from btrfs_recon.persistence import ChunkTree, Device, Filesystem
 
         if self.type == ExtentDataType.INLINE:
             return self.data
@@ -79,22 +80,19 @@ class FileExtentItem(BaseLeafItemData):
         if self.type != ExtentDataType.REGULAR:
             raise NotImplementedError(f'Cannot read bytes of {self.type} type files')
 
-        phys_locs = await self.calculate_phys(session, size=size)
+        filesystem = await Filesystem.of_device(session, self.address.device_id)
+        chunk_cache = await ChunkTree.refresh_cache(session, filesystem=filesystem)
 
-        # TODO: limit to only devids from same Filesystem
-        # TODO: limit to only devids encountered in phys_locs
-        devid_map = await Device.devid_map(session)
-        devid_fps = {devid: device.open() for devid, device in devid_map.items()}
+        if filesystem is not None:
+            devices = filesystem.devices
+        else:
+            devices = (await Device.devid_map(session)).values()
+        devid_fps = {device.devid: device.open() for device in devices}
 
         try:
-            buf = BytesIO()
-            for devid, phys, num_bytes in phys_locs:
-                fp = devid_fps[devid]
-                fp.seek(phys)
-                chunk = fp.read(num_bytes)
-                buf.write(chunk)
-
-            return buf.getvalue()
+            # Mirrored extents are read from all their copies at once
+            with LogicalReader(chunk_cache, devid_fps) as reader:
+                return reader.read(self.disk_bytenr, size if size is not None else self.disk_num_bytes)
 
         finally:
             for fp in devid_fps.values():
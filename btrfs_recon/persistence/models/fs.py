@@ -7,6 +7,7 @@ from typing import BinaryIO, TYPE_CHECKING
 import sqlalchemy.orm as orm
 import sqlalchemy as sa
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .base import BaseModel
 
@@ -30,6 +31,12 @@ class Filesystem(BaseModel):
         'Device', secondary=FilesystemDevice.__table__, uselist=True, lazy='selectin'
     )
 
+    @classmethod
+    async def of_device(cls, session: AsyncSession, device_id: int) -> Filesystem | None:
+        """Return the filesystem a device belongs to, if any"""
+        q = sa.select(cls).join(FilesystemDevice).filter(FilesystemDevice.device_id == device_id)
+        return (await session.execute(q)).scalars().first()
+
     @classmethod
     def from_devices(cls, *paths: Path | str, **attrs) -> 'Filesystem':
         from .physical import Device
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from btrfs_recon.persistence import fields
+from btrfs_recon.types import PhysicalAddress, PhysicalRange
+from btrfs_recon.util.ranges import merge_ranges
+from .base import BaseModel
+
+if TYPE_CHECKING:
+    from .physical import Device
+
+__all__ = ['ScanProgress']
+
+
+class ScanProgress(BaseModel):
+    """A half-open [start, end) range of a device which has been completely scanned"""
+
+    device_id = sa.Column(sa.Integer, sa.ForeignKey('device.id'), nullable=False)
+    alignment = sa.Column(fields.uint8, nullable=False)
+    start = sa.Column(fields.uint8, nullable=False)
+    end = sa.Column(fields.uint8, nullable=False)
+
+    device: orm.Mapped['Device'] = orm.relationship('Device', lazy='selectin')
+
+    __table_args__ = (
+        sa.Index('scan_progress_lookup_device', device_id, alignment),
+    )
+
+    @classmethod
+    async def completed_ranges(
+        cls, session: AsyncSession, device_id: int, alignment: int
+    ) -> list[PhysicalRange]:
+        """Return the ranges of the device already scanned at (or finer than) the alignment
+
+        A range scanned at a finer alignment, which evenly divides the requested one,
+        has checked every location the requested alignment would.
+        """
+        q = sa.select(cls).filter_by(device_id=device_id)
+        res = await session.execute(q)
+        return merge_ranges(
+            (progress.start, progress.end)
+            for progress in res.scalars()
+            if alignment % progress.alignment == 0
+        )
+
+    @classmethod
+    async def record(
+        cls,
+        session: AsyncSession,
+        device_id: int,
+        alignment: int,
+        start: PhysicalAddress,
+        end: PhysicalAddress,
+    ) -> ScanProgress:
+        """Record [start, end) as completely scanned, extending an adjoining range if possible
+
+        Scans proceed window-by-window (or shard-by-shard), so extending ranges keeps
+        a single row per contiguous scanned region, rather than one per window.
+
+        The caller is responsible for committing, so many ranges may be recorded in a
+        single transaction.
+        """
+        q = (
+            sa.select(cls)
+            .filter_by(device_id=device_id, alignment=alignment)
+            .filter(sa.or_(cls.end == start, cls.start == end))
+            .limit(1)
+        )
+        res = await session.execute(q)
+        if progress := res.scalar():
+            progress.start = min(progress.start, start)
+            progress.end = max(progress.end, end)
+        else:
+            progress = cls(device_id=device_id, alignment=alignment, start=start, end=end)
+            session.add(progress)
+
+        return progress
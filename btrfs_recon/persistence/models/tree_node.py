@@ -6,8 +6,11 @@ from typing import BinaryIO
 import sqlalchemy.orm as orm
 import sqlalchemy as sa
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from btrfs_recon import structure
+from btrfs_recon.types import PhysicalAddress
+from .address import Address
 from .base import BaseStruct
 from .key import Keyed
 from .. import fields
@@ -39,6 +42,18 @@ class TreeNode(BaseStruct):
         sa.Index('treenode_passthru_generation', 'id', generation),
     )
 
+    @classmethod
+    async def device_locs(cls, session: AsyncSession, device_id: int) -> list[PhysicalAddress]:
+        """Return the physical addresses of all tree nodes persisted from a device"""
+        q = (
+            sa.select(Address.phys)
+            .select_from(cls)
+            .join(cls.address)
+            .filter(Address.device_id == device_id)
+        )
+        res = await session.execute(q)
+        return list(res.scalars())
+
 
 class KeyPtr(Keyed, BaseStruct):
     parent_id: orm.Mapped[int] = sa.Column(sa.ForeignKey(TreeNode.id), nullable=False)
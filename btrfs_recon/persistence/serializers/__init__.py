@@ -6,6 +6,7 @@ from .dir_item import *
 from .file_extent_item import *
 from .inode import *
 from .root_item import *
+from .rows import *
 from .superblock import *
 from .tree_node import *
 
@@ -16,6 +17,7 @@ from .dir_item import __all__ as __dir_item_all__
 from .file_extent_item import __all__ as __file_extent_item_all__
 from .inode import __all__ as __inode_all__
 from .root_item import __all__ as __root_item_all__
+from .rows import __all__ as __rows_all__
 from .superblock import __all__ as __superblock_all__
 from .tree_node import __all__ as __tree_node_all__
 
@@ -31,6 +33,7 @@ __all__ = [
     *__file_extent_item_all__,
     *__inode_all__,
     *__root_item_all__,
+    *__rows_all__,
     *__superblock_all__,
     *__tree_node_all__,
     'registry',
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import dataclasses
+import functools
 from collections.abc import Iterable
 from typing import Any, Mapping, TYPE_CHECKING, Type
 
@@ -14,12 +15,11 @@ from marshmallow_sqlalchemy import ModelConverter, SQLAlchemyAutoSchema
 from marshmallow_sqlalchemy.schema import SQLAlchemyAutoSchemaMeta, SQLAlchemyAutoSchemaOpts
 
 from btrfs_recon.persistence import Address
-from btrfs_recon.persistence.fields import uint8
 from btrfs_recon.persistence.serializers import fields
 from btrfs_recon.structure import KeyType, Struct
 
 if TYPE_CHECKING:
-    from btrfs_recon.persistence import BaseStruct
+    from btrfs_recon.persistence import BaseModel, BaseStruct
 
 __all__ = [
     'BaseSchema',
@@ -197,18 +197,22 @@ class StructSchemaOpts(SQLAlchemyAutoSchemaOpts):
      - `version`: An integer to be incremented whenever the Schema class changes its output.
             This allows rows produced by the Schema to be re-parsed when the Schema changes.
      - `key_type`: The KeyType enum value this Schema handles the data of a leaf item for.
+     - `flatten`: Names of nested structs whose fields are raised to the toplevel (taking
+            precedence over the struct's own fields) before loading.
 
     """
 
     struct_class: Type[Struct] | None = None
     version: int = 0
     key_type: KeyType | None = None
+    flatten: tuple[str, ...] = ()
 
     def __init__(self, meta, *args, **kwargs):
         super().__init__(meta, *args, **kwargs)
         self.struct_class = getattr(meta, 'struct_class', None)
         self.version = getattr(meta, 'version', self.version)
         self.key_type = getattr(meta, 'key_type', self.key_type)
+        self.flatten = tuple(getattr(meta, 'flatten', self.flatten))
 
 
 class StructSchemaVersionField(fields.Field):
@@ -230,6 +234,16 @@ class StructSchema(BaseSchema, SQLAlchemyAutoSchema):
     _version = StructSchemaVersionField()
     address = fields.Nested(AddressSchema, data_key='*', attribute='address')
 
+    @ma.pre_load
+    def _flatten_nested_structs(self, data: dict[str, Any], **kwargs) -> dict[str, Any]:
+        # NOTE: marshmallow doesn't support deep data_keys (i.e. dotted paths), so the
+        #       fields of flattened structs are raised to toplevel. This runs after
+        #       _dataclass_to_dict, as hooks are invoked in order of their names.
+        for name in self.opts.flatten:
+            if nested := data.get(name):
+                data.update(nested)
+        return data
+
     @ma.post_load()
     def post_make_instance_upsert_address(self, instance, *, many: bool = False, **kwargs):
         _TRACKED_STRUCTS.append(instance)
@@ -239,12 +253,93 @@ class StructSchema(BaseSchema, SQLAlchemyAutoSchema):
 _TRACKED_STRUCTS: list[BaseStruct] = []
 
 
+@functools.cache
+def _struct_model(name: str) -> Type[BaseStruct] | None:
+    """Return the struct model named by an Address.struct_type"""
+    from btrfs_recon.persistence import BaseStruct
+
+    for mapper in BaseStruct.registry.mappers:
+        if mapper.class_.__name__ == name:
+            return mapper.class_
+    return None
+
+
+def _attach_as_stored(session: orm.Session, instance: BaseModel, pk: int) -> BaseModel:
+    """Swap a pending instance for the stored row with the given primary key
+
+    Returns the attached instance: either the one passed, or one for the same row
+    already present in the session.
+    """
+    session.expunge(instance)
+
+    if (existing := session.identity_map.get(orm.identity_key(type(instance), pk))) is not None:
+        return existing
+
+    instance.id = pk
+    orm.make_transient_to_detached(instance)
+    session.add(instance)
+    return instance
+
+
+def _flag_all_modified(instance: BaseModel) -> None:
+    """Have the next flush write every loaded column (and many-to-one ref) of an instance"""
+    mapper = sa.inspect(instance).mapper
+    values = orm.attributes.instance_dict(instance)
+
+    for prop in mapper.iterate_properties:
+        if prop.key not in values:
+            continue
+
+        if isinstance(prop, orm.ColumnProperty):
+            if not any(column.primary_key for column in prop.columns):
+                orm.attributes.flag_modified(instance, prop.key)
+        elif isinstance(prop, orm.RelationshipProperty):
+            if prop.direction is orm.MANYTOONE and not prop.viewonly:
+                orm.attributes.flag_modified(instance, prop.key)
+
+
+def _upsert_addresses(rows: list[dict[str, Any]]) -> pg.Insert:
+    """Return an INSERT ... ON CONFLICT DO UPDATE of Address rows
+
+    Only headers and tree nodes carry a bytenr, so a row with none (e.g. a leaf
+    item's) keeps the bytenr already stored, such as one from `fs backfill-bytenr`.
+    Each row's id and stored struct ref are returned.
+    """
+    stmt = pg.insert(Address).values(rows)
+    return (
+        stmt
+        .on_conflict_do_update(
+            index_elements=[Address.device_id, Address.phys, Address.phys_size],
+            set_={
+                'bytenr': sa.func.coalesce(stmt.excluded.bytenr, Address.bytenr),
+                'updated_at': sa.func.now(),
+            },
+        )
+        .returning(
+            Address.id,
+            Address.device_id,
+            Address.phys,
+            Address.phys_size,
+            Address.struct_type,
+            Address.struct_id,
+        )
+    )
+
+
 @sa.event.listens_for(orm.Session, 'before_flush')
 def before_flush(session, flush_context, instances):
+    """Upsert the Addresses of loaded structs, resolving conflicts with stored structs
+
+    All new Addresses are written at once, with INSERT ... ON CONFLICT DO UPDATE, and
+    swapped for the stored rows they've become. Where an Address was already stored
+    with a struct of the same type, the new struct takes over that struct's row, and
+    its INSERT becomes an UPDATE. Where the stored struct was of another type, it's
+    superseded: the old struct row is deleted, and the new struct is inserted.
+    """
     if not _TRACKED_STRUCTS:
         return
 
-    # 1. Grab all Addresses of tracked structs
+    # 1. Grab the new Addresses of tracked structs
     address_key = lambda addr: (
         addr.device_id or addr.device.id,
         addr.phys,
@@ -253,64 +348,50 @@ def before_flush(session, flush_context, instances):
     address_struct_map = {
         address_key(struct.address): struct
         for struct in reversed(_TRACKED_STRUCTS)
+        if sa.inspect(struct.address).pending
     }
     _TRACKED_STRUCTS.clear()
 
-    # 2. Construct query to select all address rows with matching contents
-    values = sa.values(
-        sa.column('device_id', sa.Integer),
-        sa.column('phys', uint8),
-        sa.column('phys_size', uint8),
-        name='address_input',
-    ).data(address_struct_map.keys())
-    q = (
-        sa.select(Address)
-        .options(
-            orm.load_only(
-                Address.id,
-                Address.device_id,
-                Address.phys,
-                Address.phys_size,
-                Address.struct_type,
-                Address.struct_id,
-            )
-        )
-        .join(values, onclause=(
-            (Address.device_id == values.c.device_id)
-            & (Address.phys == values.c.phys)
-            & (Address.phys_size == values.c.phys_size)
-        ))
-    )
-    matching_addresses = session.execute(q)
+    if not address_struct_map:
+        return
 
-    to_delete = []
-    for address in matching_addresses.scalars():
-        if not (struct := address_struct_map.get(address_key(address))):
+    # 2. Upsert them, returning the struct refs stored before (which the update leaves be)
+    upserted = session.execute(_upsert_addresses([
+        {
+            'device_id': device_id,
+            'phys': phys,
+            'phys_size': phys_size,
+            'bytenr': address_struct_map[device_id, phys, phys_size].address.bytenr,
+        }
+        for device_id, phys, phys_size in address_struct_map
+    ]))
+
+    superseded: dict[str, list[int]] = {}
+    for address_id, device_id, phys, phys_size, struct_type, struct_id in upserted:
+        struct = address_struct_map[device_id, phys, phys_size]
+        address = _attach_as_stored(session, struct.address, address_id)
+        if address is not struct.address:
+            struct.address = address
+
+        if struct_id is None or sa.inspect(struct).persistent:
             continue
 
-        # If existing Address row has same struct_type, use the existing Address in the matching
-        # Struct, and change the Struct's INSERT to an UPDATE
-        if type(struct).__name__ == address.struct_type:
-            # Since we'll be using the exact same existing address row, with no updates,
-            # we completely remove and stop tracking our proposed Address instance
-            session.expunge(struct.address)
+        # 3. If the stored struct has the same type, update it in place with the new struct
+        if type(struct).__name__ == struct_type:
+            if _attach_as_stored(session, struct, struct_id) is struct:
+                _flag_all_modified(struct)
 
-            # We still want to track our Struct, as it may have changes requiring updates,
-            # but it should no longer be considered "new", and instead should just be marked
-            # dirty.
-            session._new.pop(orm.attributes.instance_state(struct), None)
-            orm.attributes.flag_dirty(struct)
-
-            orm.attributes.set_committed_value(struct, 'id', address.struct_id)
-            orm.attributes.set_committed_value(struct, 'address', address)
-
-        # If the existing Address row has a differing struct_type, we're superseding it, not
-        # updating. So, delete the existing Address row, which will CASCADE to its referring Struct
+        # 4. Otherwise, the stored struct is superseded, and must go
         else:
-            to_delete.append(address.id)
-            session.expunge(address)
-
-    session.execute(sa.delete(Address).filter(Address.id.in_(to_delete)))
+            superseded.setdefault(struct_type, []).append(struct_id)
+
+    for struct_type, struct_ids in superseded.items():
+        if model := _struct_model(struct_type):
+            session.execute(
+                sa.delete(model)
+                .filter(model.id.in_(struct_ids))
+                .execution_options(synchronize_session=False)
+            )
 
 
 class LeafItemDataSchema(StructSchema):
@@ -0,0 +1,155 @@
+"""Compiled serializers, turning parsed structs straight into column values
+
+The StructSchemas are the reference implementation of struct → model translation,
+but they're costly on the hot path: each load deep-copies the struct into dicts, runs
+the pre/post-load hooks, and builds a schema for every nested struct. Here, a function
+is generated for each registry entry, which reads every column's value straight off
+the struct's fields, following the same rules as the schemas:
+
+ - columns take the value of the same-named struct field (or None, if it has none)
+ - fields of the nested structs named in the schema's Meta.flatten take precedence
+   over the struct's own fields — including phys_start/phys_size, of the Address
+ - the Address' bytenr comes from any `bytenr` field found along the way
+ - `_version` is the schema's Meta.version
+
+Only the columns of the struct and its Address are produced. Relationships between
+structs (foreign keys, nested structs, items) are left to the caller.
+"""
+from __future__ import annotations
+
+import dataclasses
+import functools
+import types
+import typing
+from dataclasses import dataclass
+from typing import Any, Callable, Type
+
+from btrfs_recon import structure
+from btrfs_recon.persistence import models
+from . import registry
+
+__all__ = [
+    'RowSerializer',
+    'get_row_serializer',
+    'serialized_columns',
+]
+
+#: Columns filled by the DB, never serialized
+_SERVER_COLUMNS = frozenset({'created_at', 'updated_at'})
+
+#: Address columns, and the struct fields they're read from
+_ADDRESS_FIELDS = {
+    'phys': 'phys_start',
+    'phys_size': 'phys_size',
+    'bytenr': 'bytenr',
+}
+
+#: (address values, struct values)
+SerializedRows = tuple[dict[str, Any], dict[str, Any]]
+
+
+@dataclass(slots=True, frozen=True)
+class RowSerializer:
+    model: Type[models.BaseStruct]
+    struct: Type[structure.Struct]
+    #: Generated source of the serialize function, for the curious
+    source: str
+    serialize: Callable[[structure.Struct], SerializedRows]
+
+    def __call__(self, struct: structure.Struct) -> SerializedRows:
+        return self.serialize(struct)
+
+
+@functools.cache
+def serialized_columns(model: Type[models.BaseStruct]) -> tuple[str, ...]:
+    """Return the names of a model's columns filled from the fields of its struct"""
+    return tuple(
+        column.name
+        for column in model.__table__.columns
+        if column.computed is None
+        and not column.primary_key
+        and not column.foreign_keys
+        and column.name not in _SERVER_COLUMNS
+        and column.name not in ('_version', 'struct_type', 'struct_id')
+    )
+
+
+def _nested_struct(hint: Any) -> tuple[Type[structure.Struct], bool] | None:
+    """Return the Struct class in a field's type hint, and whether it's optional"""
+    if isinstance(hint, type) and issubclass(hint, structure.Struct):
+        return hint, False
+
+    if isinstance(hint, types.UnionType) or typing.get_origin(hint) is typing.Union:
+        args = typing.get_args(hint)
+        for arg in args:
+            if isinstance(arg, type) and issubclass(arg, structure.Struct):
+                return arg, type(None) in args
+
+    return None
+
+
+def _generate_source(
+    model: Type[models.BaseStruct], struct_cls: Type[structure.Struct], flatten: tuple[str, ...],
+    version: int,
+) -> str:
+    hints = {f.name: f.type for f in dataclasses.fields(struct_cls)}
+
+    # Sources of field values, in increasing order of precedence: (var name, field names, optional)
+    sources: list[tuple[str, frozenset[str], bool]] = [
+        ('struct', frozenset(f.name for f in dataclasses.fields(struct_cls)), False),
+    ]
+    lines = ['def serialize(struct):']
+    for name in flatten:
+        if (nested := _nested_struct(hints.get(name))) is None:
+            raise TypeError(f'{struct_cls.__name__}.{name} is not a nested Struct, and cannot be flattened')
+        nested_cls, optional = nested
+
+        var = f'_{name}'
+        lines.append(f'    {var} = struct.{name}')
+        sources.append((var, frozenset(f.name for f in dataclasses.fields(nested_cls)), optional))
+
+    def value_expr(field_name: str) -> str:
+        expr = 'None'
+        for var, field_names, optional in sources:
+            if field_name not in field_names:
+                continue
+            if optional:
+                expr = f'({var}.{field_name} if {var} is not None else {expr})'
+            else:
+                expr = f'{var}.{field_name}'
+        return expr
+
+    lines.append('    return (')
+    lines.append('        {')
+    for column, field_name in _ADDRESS_FIELDS.items():
+        lines.append(f'            {column!r}: {value_expr(field_name)},')
+    lines.append('        },')
+    lines.append('        {')
+    for column in serialized_columns(model):
+        lines.append(f'            {column!r}: {value_expr(column)},')
+    lines.append(f"            '_version': {version!r},")
+    lines.append('        },')
+    lines.append('    )')
+
+    return '\n'.join(lines) + '\n'
+
+
+@functools.cache
+def get_row_serializer(model: Type[models.BaseStruct]) -> RowSerializer:
+    """Return the compiled serializer of a registered struct model"""
+    entry = registry.find_by_model(model)
+    if entry is None:
+        raise KeyError(f'Model {model.__name__} was not found in registry')
+
+    opts = entry.schema.opts
+    source = _generate_source(entry.model, entry.struct, opts.flatten, opts.version)
+
+    namespace: dict[str, Any] = {}
+    exec(compile(source, f'<row serializer for {model.__name__}>', 'exec'), namespace)
+
+    return RowSerializer(
+        model=entry.model,
+        struct=entry.struct,
+        source=source,
+        serialize=namespace['serialize'],
+    )
@@ -20,14 +20,13 @@ class TreeNodeSchema(StructSchema):
         model = models.TreeNode
         struct_class = structure.TreeNode
         exclude = ('is_leaf',)
+        flatten = ('header',)
 
     leaf_items = fields.Nested('LeafItemSchema', many=True)
     key_ptrs = fields.Nested('KeyPtrSchema', many=True)
 
     @pre_load
     def before_load(self, data, **kwargs):
-        data.update(data['header'])
-
         items_key = 'leaf_items' if data['header']['level'] == 0 else 'key_ptrs'
         data[items_key] = data['items']
         return data
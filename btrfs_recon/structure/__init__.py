@@ -1,4 +1,6 @@
+from .arrays import *
 from .chunk_item import *
+from .compiled import *
 from .dev_item import *
 from .dir_item import *
 from .extent_item import *
@@ -6,6 +8,7 @@ from .file_extent_item import *
 from .header import *
 from .inode import *
 from .key import *
+from .lazy import *
 from .leaf_item import *
 from .root_item import *
 from .root_ref import *
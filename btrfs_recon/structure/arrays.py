@@ -0,0 +1,137 @@
+"""NumPy structured-array views of the raw bytes of tree nodes
+
+Building a LeafItem or KeyPtr struct for every item is far too heavy when only the
+keys (or pointers) of thousands of nodes are of interest — key histograms, ordering
+checks, searching for particular objectids. The functions here view a node's item
+headers as a structured array over its bytes, without decoding (or copying) them.
+
+They accept the buffer of a single node (e.g. from scanner.read_nodes), or of a
+larger read containing the node at some offset (e.g. a HeaderScanner window, or the
+view of a whole device from parsing.map_device).
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+
+__all__ = [
+    'RAW_HEADER_DTYPE',
+    'LEAF_ITEM_DTYPE',
+    'KEY_PTR_DTYPE',
+    'raw_header',
+    'leaf_items',
+    'key_ptrs',
+    'node_items',
+    'concat_node_items',
+]
+
+#: Raw, on-disk layout of a tree node header (matching structure.Header)
+RAW_HEADER_DTYPE = np.dtype([
+    ('csum', 'V32'),
+    ('fsid', 'V16'),
+    ('bytenr', '<u8'),
+    ('flags', '<u8'),
+    ('chunk_tree_uuid', 'V16'),
+    ('generation', '<u8'),
+    ('owner', '<u8'),
+    ('nritems', '<u4'),
+    ('level', 'u1'),
+])
+
+#: Layout of the item headers of leaf nodes (a Key, then the offset and size of the data)
+LEAF_ITEM_DTYPE = np.dtype([
+    ('objectid', '<u8'),
+    ('type', 'u1'),
+    ('offset', '<u8'),
+    ('data_offset', '<u4'),
+    ('data_size', '<u4'),
+])
+
+#: Layout of the key pointers of internal nodes
+KEY_PTR_DTYPE = np.dtype([
+    ('objectid', '<u8'),
+    ('type', 'u1'),
+    ('offset', '<u8'),
+    ('blockptr', '<u8'),
+    ('generation', '<u8'),
+])
+
+
+def raw_header(data, offset: int = 0) -> np.void:
+    """View the header of the node at offset into data, as a RAW_HEADER_DTYPE record"""
+    try:
+        return np.frombuffer(data, RAW_HEADER_DTYPE, count=1, offset=offset)[0]
+    except ValueError as e:
+        raise ValueError(f'node header at offset {offset} extends past the data: {e}') from e
+
+
+def _view_items(data, offset: int, header: np.void, dtype: np.dtype) -> np.ndarray:
+    try:
+        return np.frombuffer(
+            data, dtype, count=int(header['nritems']), offset=offset + RAW_HEADER_DTYPE.itemsize
+        )
+    except ValueError as e:
+        raise ValueError(f'items of node at offset {offset} extend past the data: {e}') from e
+
+
+def leaf_items(data, offset: int = 0) -> np.ndarray:
+    """View the item headers of the leaf node at offset into data
+
+    :return: an array of LEAF_ITEM_DTYPE, one per item, sharing data's memory.
+        data_offset is relative to the end of the node header, as on disk.
+    :raises ValueError: if the node is not a leaf, or its items extend past data
+    """
+    header = raw_header(data, offset)
+    if header['level'] != 0:
+        raise ValueError(f'node at offset {offset} is not a leaf (level {header["level"]})')
+    return _view_items(data, offset, header, LEAF_ITEM_DTYPE)
+
+
+def key_ptrs(data, offset: int = 0) -> np.ndarray:
+    """View the key pointers of the internal node at offset into data
+
+    :return: an array of KEY_PTR_DTYPE, one per item, sharing data's memory
+    :raises ValueError: if the node is a leaf, or its items extend past data
+    """
+    header = raw_header(data, offset)
+    if header['level'] == 0:
+        raise ValueError(f'node at offset {offset} is a leaf, not an internal node')
+    return _view_items(data, offset, header, KEY_PTR_DTYPE)
+
+
+def node_items(data, offset: int = 0) -> np.ndarray:
+    """View the items of the node at offset into data, as leaf items or key pointers by its level"""
+    header = raw_header(data, offset)
+    return _view_items(data, offset, header, LEAF_ITEM_DTYPE if header['level'] == 0 else KEY_PTR_DTYPE)
+
+
+def concat_node_items(nodes: Iterable[tuple[int, bytes]], *, leaves: bool = True) -> np.ndarray:
+    """Gather the items of many nodes into one array, tagged with their node's location
+
+    :param nodes: (loc, node bytes) pairs, e.g. zip(locs, scanner.read_nodes(fp, locs, nodesize)).
+        Nodes of the other kind (internal nodes, if leaves=True) are skipped.
+    :param leaves: whether to gather the items of leaves, or the key pointers of
+        internal nodes
+    :return: an array of LEAF_ITEM_DTYPE or KEY_PTR_DTYPE fields, preceded by a `loc`
+        (u8) field holding the location of each item's node. Unlike the views returned
+        by the other functions, this is a copy.
+    """
+    item_dtype = LEAF_ITEM_DTYPE if leaves else KEY_PTR_DTYPE
+    dtype = np.dtype([('loc', '<u8'), *((name, item_dtype.fields[name][0]) for name in item_dtype.names)])
+
+    parts = []
+    for loc, data in nodes:
+        header = raw_header(data)
+        if (header['level'] == 0) != leaves:
+            continue
+        items = _view_items(data, 0, header, item_dtype)
+        part = np.empty(len(items), dtype)
+        part['loc'] = loc
+        for name in item_dtype.names:
+            part[name] = items[name]
+        parts.append(part)
+
+    if not parts:
+        return np.empty(0, dtype)
+    return np.concatenate(parts)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import copy
+import dataclasses
 from dataclasses import dataclass
 from functools import partial
 from typing import Any, BinaryIO, Callable, Optional, Type, TYPE_CHECKING, TypeVar
@@ -17,11 +19,19 @@ __all__ = ['Struct', 'field']
 
 
 class _StructMeta(type):
-    """Automatically applies @dataclass to subclasses, and adds standard addressing fields"""
+    """Automatically applies @dataclass to subclasses, and adds standard addressing fields
+
+    The dataclasses are slotted, so parsed structs (of which large walks hold millions)
+    carry no per-instance __dict__.
+    """
 
     def __new__(mcs, name, bases, attrs, **kwargs):
+        is_base_struct = not bases
+        if '__slots__' in attrs and not is_base_struct:
+            # The class recreated by dataclass(slots=True), with our fields already added
+            return super().__new__(mcs, name, bases, attrs, **kwargs)
+
         annotations = attrs['__annotations__']
-        is_base_struct = bases == (DataclassMixin,)
 
         if is_base_struct:
             #
@@ -38,6 +48,9 @@ class _StructMeta(type):
             del annotations['phys_end']
             del annotations['phys_size']
 
+            # The base Struct declares its own (fieldless) slots, so it's not a dataclass
+            return super().__new__(mcs, name, bases, attrs, **kwargs)
+
         else:
             phys_field = partial(csfield, fields.HexDecInt(cs.Tell))
             phys_type = int
@@ -59,16 +72,35 @@ class _StructMeta(type):
             }
 
         cls = super().__new__(mcs, name, bases, attrs, **kwargs)
-        cls = dataclass(cls)
+        cls = dataclass(cls, slots=True)
         return cls
 
 
+class _StructAdapter(DataclassStruct):
+    """DataclassStruct of a Struct
+
+    construct_typed requires its dataclasses to derive from DataclassMixin — which,
+    lacking __slots__, would give every struct a __dict__. Structs provide the same
+    methods themselves, so the check is skipped.
+    """
+
+    def __init__(self, dc_type: Type[Struct], reverse: bool = False):
+        self.dc_type = dc_type
+        self.reverse = reverse
+
+        dc_fields = dataclasses.fields(dc_type)
+        if reverse:
+            dc_fields = tuple(reversed(dc_fields))
+
+        super(DataclassStruct, self).__init__(cs.Struct(**{f.name: f.metadata['subcon'] for f in dc_fields}))
+
+
 _TYPED_STRUCT_AS_STRUCT_KEY = '__struct'
 
 StructT = TypeVar('StructT', bound='Struct')
 
 
-class Struct(DataclassMixin, metaclass=_StructMeta):
+class Struct(metaclass=_StructMeta):
     phys_start: int
     # NOTE: this field is moved to last position by _StructMeta
     phys_end: int
@@ -77,7 +109,7 @@ class Struct(DataclassMixin, metaclass=_StructMeta):
     @classmethod
     def as_struct(cls) -> cs.Struct:
         if not hasattr(cls, _TYPED_STRUCT_AS_STRUCT_KEY):
-            setattr(cls, _TYPED_STRUCT_AS_STRUCT_KEY, DataclassStruct(cls))
+            setattr(cls, _TYPED_STRUCT_AS_STRUCT_KEY, _StructAdapter(cls))
         return getattr(cls, _TYPED_STRUCT_AS_STRUCT_KEY)
 
     @classmethod
@@ -96,6 +128,44 @@ class Struct(DataclassMixin, metaclass=_StructMeta):
     def parse_stream(cls: Type[StructT], stream: BinaryIO, **contextkw) -> StructT:
         return cls.as_struct().parse_stream(stream, **contextkw)
 
+    def materialize(self: StructT) -> StructT:
+        """Copy any memoryview fields into bytes, releasing the buffer they were parsed from
+
+        Structs parsed from memoryviews (e.g. of an mmap) hold slices of the buffer in
+        their byte fields, keeping it exported (and an mmap unclosable). Materialized
+        fields are displayed as they would be if parsed from bytes.
+
+        Nested structs are materialized, too. Returns the struct itself.
+        """
+        for f in dataclasses.fields(self):
+            value = getattr(self, f.name)
+            materialized = _materialize(value, f.metadata.get('subcon'))
+            if materialized is not value:
+                setattr(self, f.name, materialized)
+        return self
+
+    def cooked(self: StructT) -> StructT:
+        """Return a copy of the struct with the display wrappers skipped by raw parsing
+
+        Positions and enums parsed as plain ints, and timespecs parsed as (sec, nsec)
+        tuples (see fields.is_raw), are replaced by what regular parsing produces.
+        Nested structs are cooked, too. Structs not parsed raw are returned as equal copies.
+        """
+        cooked = copy.copy(self)
+        for f in dataclasses.fields(self):
+            setattr(cooked, f.name, _cooked(getattr(self, f.name), f.metadata.get('subcon')))
+        return cooked
+
+    # Used by DataclassMixin.__str__ to guard against recursion
+    __slots__ = ('__recursion_lock__',)
+
+    __getitem__ = DataclassMixin.__getitem__
+    __setitem__ = DataclassMixin.__setitem__
+
+    def __str__(self) -> str:
+        # Structs parsed raw are displayed as if they weren't
+        return DataclassMixin.__str__(self.cooked())
+
     def __class_getitem__(cls, count) -> Construct:
         return cls.as_struct()[count]
 
@@ -122,6 +192,64 @@ class Struct(DataclassMixin, metaclass=_StructMeta):
         return schema.load(self)
 
 
+def _bytes_type(subcon: Construct | None) -> Callable[[bytes], bytes]:
+    """Return the bytes subclass a field's Hex/HexDump wrappers display its bytes as"""
+    while subcon is not None:
+        if isinstance(subcon, cs.HexDump):
+            return cs.HexDumpDisplayedBytes
+        if isinstance(subcon, cs.Hex):
+            return cs.HexDisplayedBytes
+        if isinstance(subcon, cs.IfThenElse):
+            subcon = subcon.thensubcon
+        elif isinstance(subcon, cs.Checksum):
+            subcon = subcon.checksumfield
+        else:
+            subcon = getattr(subcon, 'subcon', None)
+    return bytes
+
+
+def _materialize(value: Any, subcon: Construct | None) -> Any:
+    if isinstance(value, memoryview):
+        return _bytes_type(subcon)(value)
+    if isinstance(value, Struct):
+        return value.materialize()
+    if isinstance(value, list):
+        for i, item in enumerate(value):
+            value[i] = _materialize(item, subcon)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = _materialize(item, None)
+    return value
+
+
+def _display_subcon(subcon: Construct | None) -> Construct | None:
+    """Return the display wrapper of a field skipped by raw parsing, if it has one"""
+    while subcon is not None:
+        if isinstance(subcon, (fields.HexDecInt, fields.TEnum, fields.TimespecDatetimeAdapter)):
+            return subcon
+        if isinstance(subcon, cs.IfThenElse):
+            subcon = subcon.thensubcon
+        else:
+            subcon = getattr(subcon, 'subcon', None)
+    return None
+
+
+def _cooked(value: Any, subcon: Construct | None) -> Any:
+    if isinstance(value, Struct):
+        return value.cooked()
+    if isinstance(value, list):
+        return cs.ListContainer(_cooked(item, subcon) for item in value)
+    if type(value) is int or type(value) is tuple:
+        display = _display_subcon(subcon)
+        if isinstance(display, fields.HexDecInt) and type(value) is int:
+            return fields.HexAndDecDisplayedInteger(value, num_bytes=display.subcon.sizeof())
+        if isinstance(display, fields.TEnum) and type(value) is int:
+            return display.enum_type(value)
+        if isinstance(display, fields.TimespecDatetimeAdapter) and type(value) is tuple:
+            return fields.timespec_datetime(*value)
+    return value
+
+
 def field(
     subcon: Construct[ParsedType, Any] | Type[Struct],
     doc: Optional[str] = None,
@@ -0,0 +1,543 @@
+"""Compiled parsers for structs, bypassing the interpreted Construct machinery
+
+Parsing through Construct walks every field's subcon, building a context Container
+and evaluating each `this` expression along the way, and then copies the Container
+into the dataclass. For fixed-layout structs (and those whose variable parts depend
+only on fields parsed before them), a plain Python function can do the same work:
+runs of fixed-size fields are read with a single precompiled `struct.unpack_from`,
+nested structs are parsed by their own compiled functions, and `this` expressions
+are translated into references to local variables.
+
+Compiled parsers return the very same dataclasses (including phys_start/phys_end/
+phys_size) as the interpreted ones. Structs containing constructs the compiler does
+not understand raise CompileError; callers are expected to fall back to interpreted
+parsing for those (see parse_at(compiled=True)).
+
+Byte fields are sliced from the data passed, rather than unpacked, so parsing from a
+memoryview (e.g. of an mmap) copies none of them: they are left as memoryview slices
+of the buffer, until materialized (see Struct.materialize).
+
+With raw=True, the display wrappers are skipped, as when parsing with the raw context
+flag (see fields.is_raw): positions and enums are plain ints, and timespecs are
+(sec, nsec) tuples.
+
+The generated source of any parser is available as CompiledParser.source.
+"""
+from __future__ import annotations
+
+import dataclasses
+import itertools
+import struct as pystruct
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Type, TypeVar
+from uuid import UUID
+
+import construct as cs
+from construct.expr import BinExpr, Path, UniExpr, opnames
+from construct_typed import DataclassStruct, TEnum
+
+from . import fields
+from .base import Struct
+
+__all__ = [
+    'CompileError',
+    'CompiledParser',
+    'compile_parser',
+]
+
+StructT = TypeVar('StructT', bound=Struct)
+
+#: Signature of generated parse functions: (data, offset, base, parent) -> (struct, end offset)
+ParseFunc = Callable[[bytes | memoryview, int, int, Any], tuple[Any, int]]
+
+#: struct format of the (sec, nsec) of a fields.TimespecStruct
+_TIMESPEC_FMT = 'QI'
+
+#: Adapters whose _decode() needs neither context nor path
+_CONTEXT_FREE_ADAPTERS = (cs.Hex, cs.HexDump, fields.TimespecDatetimeAdapter)
+
+
+def _phys(pos: int) -> fields.HexAndDecDisplayedInteger:
+    # Equivalent to HexDecInt(Tell), without the overhead of HexAndDecDisplayedInteger.__new__
+    obj = int.__new__(fields.HexAndDecDisplayedInteger, pos)
+    obj._num_bytes = 0
+    obj._uppercase = False
+    return obj
+
+
+class CompileError(Exception):
+    """Raised when a struct uses constructs which cannot be compiled"""
+
+
+@dataclass(frozen=True)
+class CompiledParser(Generic[StructT]):
+    struct: Type[StructT]
+    #: Generated source of the parse function, for the curious
+    source: str
+    parse_func: ParseFunc
+    #: Number of levels of parent context (`this._`) the struct refers to
+    parent_depth: int
+    #: Size of the struct in bytes, if it's always the same
+    size: int | None
+    #: Whether display wrappers are skipped (see fields.is_raw)
+    raw: bool = False
+
+    def parse(self, data: bytes | memoryview, pos: int = 0, base: int = 0) -> StructT:
+        """Parse the struct at device position pos, from data read from the device at base
+
+        data may be bytes, or any buffer (memoryview, mmap, bytearray) — byte fields
+        parsed from the latter are memoryview slices of it.
+        """
+        if self.parent_depth:
+            raise ValueError(
+                f'{self.struct.__name__} refers to its parent struct, and may only be parsed within it'
+            )
+
+        offset = pos - base
+        if offset < 0:
+            raise cs.StreamError(f'position {pos} precedes the data read at {base}')
+
+        if not isinstance(data, bytes):
+            data = _byte_view(data)
+
+        try:
+            obj, _ = self.parse_func(data, offset, base, None)
+        except pystruct.error as e:
+            raise cs.StreamError(f'stream read less than required: {e}') from e
+        return obj
+
+
+@dataclass(slots=True)
+class _Fixed:
+    """A field of fixed size, read as part of a single struct.unpack_from format"""
+    #: struct format of the field (without byte order)
+    fmt: str
+    #: Number of values the format unpacks to
+    count: int
+    #: Produces the expression of the field's value, given those of the unpacked values,
+    #: and that of the field's offset into data
+    wrap: Callable[[list[str], str], str]
+
+
+class _FunctionCompiler:
+    """Generates the parse function of a single struct"""
+
+    def __init__(self, struct_cls: Type[Struct], raw: bool = False):
+        self.struct_cls = struct_cls
+        self.raw = raw
+        self.namespace: dict[str, Any] = {
+            '_StreamError': cs.StreamError,
+            '_RangeError': cs.RangeError,
+            '_ListContainer': cs.ListContainer,
+            '_Container': cs.Container,
+            '_phys': _phys,
+            '_UUID': UUID,
+        }
+        self.lines: list[str] = []
+        self.parent_depth = 0
+
+        #: Fields parsed so far (whose local variables may be referred to)
+        self._scope: list[str] = []
+        #: Fixed fields not yet read: (target var, field)
+        self._pending: list[tuple[str, _Fixed]] = []
+        self._names = itertools.count()
+
+    def compile(self) -> tuple[str, Callable]:
+        self.lines.append('def parse(data, o, base, _parent):')
+
+        dc_fields = dataclasses.fields(self.struct_cls)
+        for f in dc_fields:
+            target = f'v_{f.name}'
+            if f.name in ('phys_start', 'phys_end'):
+                self._flush()
+                self._emit(f'{target} = base + o' if self.raw else f'{target} = _phys(base + o)')
+            elif f.name == 'phys_size':
+                self._emit(f'{target} = v_phys_end - v_phys_start')
+            else:
+                compiled = self._compile(f.metadata['subcon'])
+                if isinstance(compiled, _Fixed):
+                    self._pending.append((target, compiled))
+                else:
+                    self._flush()
+                    for line in compiled(target):
+                        self._emit(line)
+            self._scope.append(f.name)
+
+        self._flush()
+
+        cls_name = self._const(self.struct_cls, 'cls')
+        init_args = ', '.join(f'v_{f.name}' for f in dc_fields if f.init)
+        self._emit(f'obj = {cls_name}({init_args})')
+        for f in dc_fields:
+            if not f.init:
+                self._emit(f'obj.{f.name} = v_{f.name}')
+        self._emit('return obj, o')
+
+        source = '\n'.join(self.lines) + '\n'
+        exec(compile(source, f'<compiled parser for {self.struct_cls.__name__}>', 'exec'), self.namespace)
+        return source, self.namespace['parse']
+
+    ###
+    # Code generation helpers
+    #
+
+    def _emit(self, line: str) -> None:
+        self.lines.append(f'    {line}')
+
+    def _name(self, prefix: str) -> str:
+        return f'_{prefix}{next(self._names)}'
+
+    def _const(self, value: Any, prefix: str = 'k') -> str:
+        """Return the name of a variable holding value, within the generated function"""
+        name = self._name(prefix)
+        self.namespace[name] = value
+        return name
+
+    def _flush(self) -> None:
+        """Read all pending fixed fields with one unpack_from"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        for line in self._read_fixed(pending):
+            self._emit(line)
+
+    def _read_fixed(self, pending: list[tuple[str, _Fixed]]) -> list[str]:
+        fmt = '<' + ''.join(fixed.fmt for _, fixed in pending)
+        unpack = pystruct.Struct(fmt)
+        unpack_name = self._const(unpack.unpack_from, 'unpack')
+
+        values = [self._name('') for _ in range(sum(fixed.count for _, fixed in pending))]
+        lines = [f'{", ".join(values)}, = {unpack_name}(data, o)'] if values else []
+        offset = 0
+        fmt = '<'
+        for target, fixed in pending:
+            at = f'o + {pystruct.calcsize(fmt)}' if len(fmt) > 1 else 'o'
+            lines.append(f'{target} = {fixed.wrap(values[offset:offset + fixed.count], at)}')
+            offset += fixed.count
+            fmt += fixed.fmt
+        lines.append(f'o += {unpack.size}')
+        return lines
+
+    def _as_lines(self, compiled: _Fixed | Callable[[str], list[str]]) -> Callable[[str], list[str]]:
+        if isinstance(compiled, _Fixed):
+            return lambda target: self._read_fixed([(target, compiled)])
+        return compiled
+
+    ###
+    # Expressions
+    #
+
+    def _expr(self, expr: Any) -> str:
+        """Translate a Construct `this` expression into Python source"""
+        if isinstance(expr, Path):
+            return self._path(expr)
+        if isinstance(expr, BinExpr):
+            return f'({self._expr(expr.lhs)} {opnames[expr.op]} {self._expr(expr.rhs)})'
+        if isinstance(expr, UniExpr):
+            return f'({opnames[expr.op]} {self._expr(expr.operand)})'
+        if callable(expr):
+            raise CompileError(f'Cannot compile expression {expr!r}')
+        if expr is None or type(expr) in (bool, int, float, str, bytes):
+            return repr(expr)
+        return self._const(expr)
+
+    def _path(self, path: Path) -> str:
+        parts: list[str] = []
+        node: Path | None = path
+        while (parent := node._Path__parent) is not None:
+            parts.append(node._Path__field)
+            node = parent
+        if node._Path__name != 'this':
+            raise CompileError(f'Cannot compile expression {path!r}')
+        parts.reverse()
+
+        if not parts:
+            raise CompileError(f'Cannot compile a reference to the whole context: {path!r}')
+        if not all(isinstance(part, str) and part.isidentifier() for part in parts):
+            raise CompileError(f'Cannot compile expression {path!r}')
+
+        if parts[0] == '_':
+            depth = 1
+            while depth < len(parts) and parts[depth] == '_':
+                depth += 1
+            self.parent_depth = max(self.parent_depth, depth)
+            return '.'.join(['_parent', *parts[1:]])
+
+        if parts[0] not in self._scope:
+            raise CompileError(f'Expression {path!r} refers to a field not yet parsed')
+        return '.'.join([f'v_{parts[0]}', *parts[1:]])
+
+    def _context(self) -> str:
+        """Return an expression building the context passed to nested structs"""
+        items = ', '.join(f'{name}=v_{name}' for name in self._scope)
+        return f'_Container({items}{", " if items else ""}_=_parent)'
+
+    ###
+    # Subcons
+    #
+
+    def _compile(self, subcon: cs.Construct) -> _Fixed | Callable[[str], list[str]]:
+        """Compile a subcon into either a _Fixed, or a function generating lines of code
+
+        Generated lines read the field from data at offset `o`, store its value into the
+        target variable passed, and advance `o` past it.
+        """
+        if isinstance(subcon, cs.Renamed):
+            if subcon.parsed is not None:
+                raise CompileError('Cannot compile fields with parsed hooks')
+            return self._compile(subcon.subcon)
+
+        if isinstance(subcon, cs.FormatField):
+            if not subcon.fmtstr.startswith('<') or len(subcon.fmtstr) != 2:
+                raise CompileError(f'Unsupported format field {subcon.fmtstr!r}')
+            return _Fixed(subcon.fmtstr[1:], 1, lambda v, at: v[0])
+
+        if isinstance(subcon, cs.Bytes):
+            if isinstance(subcon.length, int):
+                # Skipped by the unpack, and sliced instead, so buffers aren't copied
+                n = subcon.length
+                return _Fixed(f'{n}x', 0, lambda v, at: f'data[{at}:{at} + {n}]')
+            return self._compile_var_bytes(subcon.length)
+
+        if isinstance(subcon, DataclassStruct):
+            return self._compile_struct(subcon.dc_type)
+
+        if isinstance(subcon, TEnum):
+            if self.raw:
+                return self._compile(subcon.subcon)
+
+            # Calling the enum class is rather slow; look up known members directly
+            enum_name = self._const(subcon.enum_type, 'enum')
+            members_name = self._const(subcon.enum_type._value2member_map_, 'members')
+            return self._wrap(
+                self._compile(subcon.subcon),
+                lambda v: f'({members_name}[{v}] if {v} in {members_name} else {enum_name}({v}))',
+            )
+
+        if isinstance(subcon, fields.UUIDAdapter):
+            inner = subcon.subcon
+            if (
+                isinstance(inner, cs.Array)
+                and isinstance(inner.count, int)
+                and isinstance(inner.subcon, cs.FormatField)
+                and inner.subcon.fmtstr in ('<B', '>B', '=B')
+            ):
+                return _Fixed(f'{inner.count}s', 1, lambda v, at: f'_UUID(bytes={v[0]})')
+            raise CompileError('Unsupported UUID layout')
+
+        if isinstance(subcon, fields.TimespecDatetimeAdapter) and self.raw:
+            return _Fixed(_TIMESPEC_FMT, 2, lambda v, at: f'({v[0]}, {v[1]})')
+
+        if isinstance(subcon, _CONTEXT_FREE_ADAPTERS):
+            adapter_name = self._const(subcon, 'adapter')
+            return self._wrap(self._compile(subcon.subcon), lambda v: f'{adapter_name}._decode({v}, None, None)')
+
+        if isinstance(subcon, cs.StringEncoded):
+            return self._compile_padded_string(subcon)
+
+        if isinstance(subcon, cs.Array):
+            return self._compile_array(subcon)
+
+        if isinstance(subcon, cs.IfThenElse):
+            return self._compile_if(subcon)
+
+        if subcon is cs.Pass:
+            return lambda target: [f'{target} = None']
+
+        if isinstance(subcon, cs.Pointer):
+            return self._compile_pointer(subcon)
+
+        if isinstance(subcon, cs.LazyBound):
+            return self._compile(subcon.subconfunc())
+
+        if isinstance(subcon, cs.Switch):
+            return self._compile_switch(subcon)
+
+        raise CompileError(f'Cannot compile {type(subcon).__name__}')
+
+    def _wrap(
+        self, compiled: _Fixed | Callable[[str], list[str]], wrap: Callable[[str], str]
+    ) -> _Fixed | Callable[[str], list[str]]:
+        if isinstance(compiled, _Fixed):
+            inner = compiled.wrap
+            return _Fixed(compiled.fmt, compiled.count, lambda v, at: wrap(inner(v, at)))
+
+        def gen(target: str) -> list[str]:
+            return [*compiled(target), f'{target} = {wrap(target)}']
+        return gen
+
+    def _compile_struct(self, struct_cls: Type[Struct]) -> Callable[[str], list[str]]:
+        parser = compile_parser(struct_cls, raw=self.raw)
+        parse_name = self._const(parser.parse_func, 'parse')
+        if parser.parent_depth > 1:
+            self.parent_depth = max(self.parent_depth, parser.parent_depth - 1)
+
+        def gen(target: str) -> list[str]:
+            context = self._context() if parser.parent_depth else 'None'
+            return [f'{target}, o = {parse_name}(data, o, base, {context})']
+        return gen
+
+    def _compile_var_bytes(self, length: Any) -> Callable[[str], list[str]]:
+        def gen(target: str) -> list[str]:
+            n = self._name('n')
+            return [
+                f'{n} = {self._expr(length)}',
+                f'if {n} < 0: raise _StreamError("length must be non-negative, found %s" % {n})',
+                f'{target} = data[o:o + {n}]',
+                f'if len({target}) != {n}: raise _StreamError("stream read less than specified amount")',
+                f'o += {n}',
+            ]
+        return gen
+
+    def _compile_padded_string(self, subcon: cs.StringEncoded) -> _Fixed | Callable[[str], list[str]]:
+        sized = subcon.subcon
+        if not (
+            isinstance(sized, cs.FixedSized)
+            and isinstance(sized.subcon, cs.NullStripped)
+            and sized.subcon.subcon is cs.GreedyBytes
+            and len(sized.subcon.pad) == 1
+        ):
+            raise CompileError('Cannot compile strings other than PaddedString')
+
+        pad = sized.subcon.pad
+        encoding = subcon.encoding
+        # NOTE: bytes() is a no-op on bytes, and copies memoryviews (which have no rstrip)
+        decode = lambda v: f'bytes({v}).rstrip({pad!r}).decode({encoding!r})'
+
+        if isinstance(sized.length, int):
+            return _Fixed(f'{sized.length}s', 1, lambda v, at: f'{v[0]}.rstrip({pad!r}).decode({encoding!r})')
+        return self._wrap(self._compile_var_bytes(sized.length), decode)
+
+    def _compile_array(self, subcon: cs.Array) -> _Fixed | Callable[[str], list[str]]:
+        if subcon.discard:
+            raise CompileError('Cannot compile discarding Arrays')
+
+        element = self._compile(subcon.subcon)
+        if isinstance(subcon.count, int) and isinstance(element, _Fixed):
+            count, inner = subcon.count, element
+            inner_size = pystruct.calcsize('<' + inner.fmt)
+            return _Fixed(
+                inner.fmt * count,
+                inner.count * count,
+                lambda v, at: '_ListContainer(({}))'.format(''.join(
+                    f'{inner.wrap(v[i * inner.count:(i + 1) * inner.count], f"{at} + {i * inner_size}")}, '
+                    for i in range(count)
+                )),
+            )
+
+        element_lines = self._as_lines(element)
+
+        def gen(target: str) -> list[str]:
+            n = self._name('n')
+            e = self._name('e')
+            return [
+                f'{n} = {self._expr(subcon.count)}',
+                f'if {n} < 0: raise _RangeError("invalid count %s" % ({n},))',
+                f'{target} = _ListContainer()',
+                f'for _ in range({n}):',
+                *(f'    {line}' for line in element_lines(e)),
+                f'    {target}.append({e})',
+            ]
+        return gen
+
+    def _compile_if(self, subcon: cs.IfThenElse) -> Callable[[str], list[str]]:
+        then_lines = self._as_lines(self._compile(subcon.thensubcon))
+        else_lines = self._as_lines(self._compile(subcon.elsesubcon))
+
+        def gen(target: str) -> list[str]:
+            return [
+                f'if {self._expr(subcon.condfunc)}:',
+                *(f'    {line}' for line in then_lines(target)),
+                'else:',
+                *(f'    {line}' for line in else_lines(target)),
+            ]
+        return gen
+
+    def _compile_pointer(self, subcon: cs.Pointer) -> Callable[[str], list[str]]:
+        if subcon.stream is not None:
+            raise CompileError('Cannot compile Pointers into other streams')
+        pointee_lines = self._as_lines(self._compile(subcon.subcon))
+
+        def gen(target: str) -> list[str]:
+            saved = self._name('saved')
+            return [
+                f'{saved} = o',
+                f'o = {self._expr(subcon.offset)} - base',
+                'if o < 0: raise _StreamError("pointer precedes the data read")',
+                *pointee_lines(target),
+                f'o = {saved}',
+            ]
+        return gen
+
+    def _compile_switch(self, subcon: cs.Switch) -> Callable[[str], list[str]]:
+        if subcon.default is not cs.Pass:
+            raise CompileError('Cannot compile Switches with a default')
+
+        parsers = {}
+        for key, case in subcon.cases.items():
+            while isinstance(case, cs.Renamed):
+                case = case.subcon
+            if not isinstance(case, DataclassStruct):
+                raise CompileError('Cannot compile Switches with cases other than structs')
+            parsers[key] = compile_parser(case.dc_type, raw=self.raw)
+
+        cases_name = self._const({key: p.parse_func for key, p in parsers.items()}, 'cases')
+        parent_depth = max((p.parent_depth for p in parsers.values()), default=0)
+        if parent_depth > 1:
+            self.parent_depth = max(self.parent_depth, parent_depth - 1)
+
+        def gen(target: str) -> list[str]:
+            func = self._name('f')
+            context = self._context() if parent_depth else 'None'
+            return [
+                f'{func} = {cases_name}.get({self._expr(subcon.keyfunc)})',
+                f'if {func} is None:',
+                f'    {target} = None',
+                'else:',
+                f'    {target}, o = {func}(data, o, base, {context})',
+            ]
+        return gen
+
+
+_parsers: dict[tuple[Type[Struct], bool], CompiledParser | CompileError] = {}
+
+
+def compile_parser(struct_cls: Type[StructT], *, raw: bool = False) -> CompiledParser[StructT]:
+    """Return the compiled parser of a struct, raising CompileError if it can't be compiled
+
+    :param raw: whether to skip display wrappers (see fields.is_raw)
+    """
+    if (parser := _parsers.get((struct_cls, raw))) is None:
+        try:
+            compiler = _FunctionCompiler(struct_cls, raw)
+            source, parse_func = compiler.compile()
+        except CompileError as e:
+            parser = CompileError(f'{struct_cls.__name__}: {e}')
+        else:
+            parser = CompiledParser(
+                struct=struct_cls,
+                source=source,
+                parse_func=parse_func,
+                parent_depth=compiler.parent_depth,
+                size=_static_size(struct_cls),
+                raw=raw,
+            )
+        _parsers[(struct_cls, raw)] = parser
+
+    if isinstance(parser, CompileError):
+        raise CompileError(*parser.args)
+    return parser
+
+
+def _byte_view(buffer) -> memoryview:
+    view = memoryview(buffer)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+
+def _static_size(struct_cls: Type[Struct]) -> int | None:
+    try:
+        return struct_cls.sizeof()
+    except cs.SizeofError:
+        return None
@@ -1,5 +1,4 @@
 import construct as cs
-from construct_typed import TEnum
 
 from . import fields
 from .base import field, Struct
@@ -28,5 +27,5 @@ class DirItem(Struct):
     transid: int = field(cs.Int64ul)
     data_len: int = field(cs.Int16ul)
     name_len: int = field(cs.Int16ul)
-    ty: DirEntryType = field(TEnum(cs.Int8ul, DirEntryType))
+    ty: DirEntryType = field(fields.TEnum(cs.Int8ul, DirEntryType))
     name: str = field(cs.PaddedString(cs.this.name_len, 'utf8'))
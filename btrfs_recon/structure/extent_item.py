@@ -1,5 +1,4 @@
 import construct as cs
-from construct_typed import TEnum
 
 from .base import field, Struct
 from . import fields
@@ -25,4 +24,4 @@ class ExtentItem(Struct):
     """
     refs: int = field(cs.Int64ul * 'The number of explicit references to this extent')
     generation: int = field(cs.Int64ul * 'transid of transaction that allocated this extent')
-    flags: ExtentItemFlags = field(TEnum(cs.Int8ul, ExtentItemFlags))
+    flags: ExtentItemFlags = field(fields.TEnum(cs.Int8ul, ExtentItemFlags))
@@ -14,10 +14,22 @@ __all__ = [
     'UUID',
     'FSID',
     'HexDecInt',
+    'TEnum',
     'Timespec',
+    'is_raw',
+    'timespec_datetime',
 ]
 
 
+def is_raw(context) -> bool:
+    """Whether a struct is being parsed in raw mode, skipping display wrappers
+
+    Raw mode is requested by passing raw=True as a context keyword to parse(), and
+    yields plain ints for positions and enums, and (sec, nsec) tuples for timespecs.
+    """
+    return context is not None and context._params.get('raw', False)
+
+
 class UUIDAdapter(cs.Adapter):
     def _decode(self, obj, context, path) -> uuid.UUID:
         return uuid.UUID(bytes=bytes(obj))
@@ -54,7 +66,7 @@ class HexAndDecDisplayedInteger(int):
 
 class HexDecInt(cs.Hex):
     def _decode(self, obj, context, path):
-        if isinstance(obj, int):
+        if isinstance(obj, int) and not is_raw(context):
             return HexAndDecDisplayedInteger(obj, num_bytes=self.subcon._sizeof(context, path))
         return obj
 
@@ -64,12 +76,19 @@ class TimespecStruct(Struct):
     nsec: int = field(cs.Int32ul)
 
 
+def timespec_datetime(sec: int, nsec: int) -> datetime | None:
+    """Return the datetime of a timespec, or None if it's out of range"""
+    try:
+        return datetime.utcfromtimestamp(sec).replace(microsecond=int(nsec / 1000))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
 class TimespecDatetimeAdapter(cs.Adapter):
     def _decode(self, obj, context, path):
-        try:
-            return datetime.utcfromtimestamp(obj.sec).replace(microsecond=int(obj.nsec / 1000))
-        except (ValueError, OverflowError, OSError):
-            return None
+        if is_raw(context):
+            return obj.sec, obj.nsec
+        return timespec_datetime(obj.sec, obj.nsec)
 
 
 Timespec = TimespecDatetimeAdapter(TimespecStruct.as_struct())
@@ -83,6 +102,15 @@ class EnumBase(cst.EnumBase):
         return super()._missing_(value)
 
 
+class TEnum(cst.TEnum):
+    """Typed enum, parsed as a plain int in raw mode"""
+
+    def _decode(self, obj, context, path):
+        if is_raw(context):
+            return obj
+        return super()._decode(obj, context, path)
+
+
 class Checksum(cs.Checksum):
     """Checksum field allowing dynamic building of checksums and invalid checksums to be parsed"""
 
@@ -1,5 +1,4 @@
 import construct as cs
-from construct_typed import TEnum
 
 from . import fields
 from .base import field, Struct
@@ -45,10 +44,10 @@ class FileExtentItem(Struct):
     # XXX: are these names canonical?
     generation: int = field(cs.Int64ul)
     ram_bytes: int = field(cs.Int64ul)
-    compression: CompressionType = field(TEnum(cs.Int8ul, CompressionType))
-    encryption: EncryptionType = field(TEnum(cs.Int8ul, EncryptionType))
-    other_encoding: EncodingType = field(TEnum(cs.Int16ul, EncodingType))
-    type: ExtentDataType = field(TEnum(cs.Int8ul, ExtentDataType))
+    compression: CompressionType = field(fields.TEnum(cs.Int8ul, CompressionType))
+    encryption: EncryptionType = field(fields.TEnum(cs.Int8ul, EncryptionType))
+    other_encoding: EncodingType = field(fields.TEnum(cs.Int16ul, EncodingType))
+    type: ExtentDataType = field(fields.TEnum(cs.Int8ul, ExtentDataType))
     data: bytes | None = field(
         cs.If(cs.this.type == ExtentDataType.INLINE,
               cs.HexDump(cs.Bytes(cs.this.ram_bytes)))
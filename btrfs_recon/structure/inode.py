@@ -1,7 +1,6 @@
 from datetime import datetime
 
 import construct as cs
-from construct_typed import TEnum
 
 from . import fields
 from .base import field, Struct
@@ -39,7 +38,7 @@ class InodeItem(Struct):
     gid: int = field(cs.Int32ul)
     mode: int = field(cs.Int32ul)
     rdev: int = field(cs.Int64ul)
-    flags: InodeItemFlag = field(TEnum(cs.Int64ul, InodeItemFlag))
+    flags: InodeItemFlag = field(fields.TEnum(cs.Int64ul, InodeItemFlag))
 
     sequence: int = field(cs.Int64ul, 'modification sequence number for NFS')
 
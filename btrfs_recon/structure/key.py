@@ -1,5 +1,4 @@
 import construct as cs
-from construct_typed import TEnum
 
 from .base import Struct, field
 from . import fields
@@ -82,8 +81,8 @@ class KeyType(fields.EnumBase):
 
 
 class Key(Struct):
-    objectid: ObjectId = field(TEnum(cs.Int64ul, ObjectId))
-    ty: KeyType = field(TEnum(cs.Int8ul, KeyType))
+    objectid: ObjectId = field(fields.TEnum(cs.Int64ul, ObjectId))
+    ty: KeyType = field(fields.TEnum(cs.Int8ul, KeyType))
     offset: int = field(cs.Int64ul)
 
 
@@ -0,0 +1,210 @@
+"""Tree nodes whose items are only decoded once they're accessed
+
+Parsing a TreeNode decodes every item, and follows every leaf item's pointer into its
+data, even when only the header and keys are of interest. A LazyTreeNode decodes its
+header at once, and views its item headers (keys, data offsets and sizes, or key
+pointers) as a packed NumPy array over the node's bytes. LeafItem/KeyPtr structs,
+and the data of leaf items, are decoded (by their compiled parsers) only when asked
+for, and are cached once decoded.
+"""
+from __future__ import annotations
+
+import struct as pystruct
+from typing import Iterator, overload
+
+import construct as cs
+import numpy as np
+
+from . import fields
+from .arrays import node_items
+from .compiled import compile_parser
+from .header import Header
+from .key import Key, KeyPtr, KeyType
+from .leaf_item import LeafItem, _get_data_field
+from .tree_node import TreeNode
+
+__all__ = [
+    'LazyTreeNode',
+]
+
+KeyTuple = tuple[int, int, int]
+
+_U64_MASK = 0xffff_ffff_ffff_ffff
+
+_data_structs: dict[int, type] | None = None
+
+
+def _data_struct(key_type: int) -> type | None:
+    """Return the struct class of the data of leaf items with a key type"""
+    global _data_structs
+    if _data_structs is None:
+        _data_structs = {key: case.dc_type for key, case in _get_data_field().cases.items()}
+    return _data_structs.get(key_type)
+
+
+class LazyTreeNode:
+    """A tree node parsed from its bytes, decoding items and their data on demand
+
+    Items are accessed by index (node[i], or iteration), and are the same LeafItem and
+    KeyPtr structs found in TreeNode.items. The header fields of all items are
+    available without decoding any as `item_headers`, a structured array of
+    LEAF_ITEM_DTYPE or KEY_PTR_DTYPE.
+    """
+
+    __slots__ = ('data', 'base', 'header', 'item_headers', '_items')
+
+    def __init__(self, data: bytes, pos: int = 0, base: int = 0):
+        """
+        :param data: bytes read from the device at base, containing the whole node
+        :param pos: device position of the node
+        """
+        self.data = data
+        self.base = base
+        self.header: Header = compile_parser(Header).parse(data, pos, base)
+
+        try:
+            self.item_headers: np.ndarray = node_items(data, pos - base)
+        except ValueError as e:
+            raise cs.StreamError(f'node items extend past the data read: {e}') from e
+
+        self._items: dict[int, LeafItem | KeyPtr] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__name__} @ {self.phys_start:#x}'
+            f' level={self.header.level} nritems={len(self)}>'
+        )
+
+    @property
+    def phys_start(self) -> int:
+        return self.header.phys_start
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.header.level == 0
+
+    def __len__(self) -> int:
+        return len(self.item_headers)
+
+    @overload
+    def __getitem__(self, index: int) -> LeafItem | KeyPtr: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[LeafItem | KeyPtr]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = self._index(index)
+        if (item := self._items.get(index)) is None:
+            item = self._items[index] = self._decode_item(index)
+        return item
+
+    def __iter__(self) -> Iterator[LeafItem | KeyPtr]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def _index(self, index: int) -> int:
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('item index out of range')
+        return index
+
+    def _item_pos(self, index: int) -> int:
+        return self.header.phys_end + index * self.item_headers.itemsize
+
+    def _decode_item(self, index: int) -> LeafItem | KeyPtr:
+        parser = compile_parser(LeafItem if self.is_leaf else KeyPtr)
+        # LeafItems find their data relative to the header, through their parent context
+        context = cs.Container(phys_start=self.header.phys_start, header=self.header, _=None)
+        try:
+            item, _ = parser.parse_func(self.data, self._item_pos(index) - self.base, self.base, context)
+        except pystruct.error as e:
+            raise cs.StreamError(f'stream read less than required: {e}') from e
+        return item
+
+    def key(self, index: int) -> Key:
+        """Decode the key of an item, without decoding the rest of it"""
+        index = self._index(index)
+        if (item := self._items.get(index)) is not None:
+            return item.key
+        return compile_parser(Key).parse(self.data, self._item_pos(index), self.base)
+
+    def item_data(self, index: int):
+        """Decode the data of a leaf item, without decoding the rest of it
+
+        Returns None for items with key types of no known data struct (like LeafItem.data).
+        """
+        if not self.is_leaf:
+            raise TypeError('Only the items of leaf nodes have data')
+
+        index = self._index(index)
+        if (item := self._items.get(index)) is not None:
+            return item.data
+
+        item_header = self.item_headers[index]
+        if (struct_cls := _data_struct(int(item_header['type']))) is None:
+            return None
+
+        # Local import, as parsing relies on the structure package
+        from btrfs_recon.parsing import parse_bytes_at
+        pos = self.header.phys_end + int(item_header['data_offset'])
+        return parse_bytes_at(self.data, self.base, pos, struct_cls, compiled=True)
+
+    def keys(self) -> list[KeyTuple]:
+        """Return the (objectid, type, offset) of every item, as plain ints"""
+        headers = self.item_headers
+        return list(zip(
+            headers['objectid'].tolist(),
+            headers['type'].tolist(),
+            headers['offset'].tolist(),
+        ))
+
+    def bisect_left(self, objectid: int, ty: int = 0, offset: int = 0) -> int:
+        """Return the index of the first item with a key not less than the one passed"""
+        return int(np.count_nonzero(self._keys_lt(objectid, ty, offset)))
+
+    def bisect_right(self, objectid: int, ty: int = 0xff, offset: int = 0xffff_ffff_ffff_ffff) -> int:
+        """Return the index of the first item with a key greater than the one passed"""
+        return int(np.count_nonzero(~self._keys_gt(objectid, ty, offset)))
+
+    def key_range(self, start: KeyTuple, end: KeyTuple) -> range:
+        """Return the indices of the items with keys in the closed range [start, end]
+
+        As items are sorted by key, this is found with vectorized comparisons of the
+        item headers alone.
+        """
+        return range(self.bisect_left(*start), self.bisect_right(*end))
+
+    def _keys_lt(self, objectid: int, ty: int, offset: int) -> np.ndarray:
+        h = self.item_headers
+        # Negative ObjectIds (e.g. TreeLog) are stored as their unsigned 64-bit counterparts
+        objectid &= _U64_MASK
+        return (h['objectid'] < objectid) | (
+            (h['objectid'] == objectid) & (
+                (h['type'] < ty) | ((h['type'] == ty) & (h['offset'] < offset))
+            )
+        )
+
+    def _keys_gt(self, objectid: int, ty: int, offset: int) -> np.ndarray:
+        h = self.item_headers
+        objectid &= _U64_MASK
+        return (h['objectid'] > objectid) | (
+            (h['objectid'] == objectid) & (
+                (h['type'] > ty) | ((h['type'] == ty) & (h['offset'] > offset))
+            )
+        )
+
+    def indices_of(self, key_type: KeyType | int) -> np.ndarray:
+        """Return the indices of all items with the passed key type"""
+        return np.flatnonzero(self.item_headers['type'] == int(key_type))
+
+    def to_tree_node(self) -> TreeNode:
+        """Decode all items, returning the same TreeNode parsing the node eagerly would"""
+        node = TreeNode(self.header, cs.ListContainer(self))
+        node.phys_start = self.header.phys_start
+        node.phys_end = fields.HexAndDecDisplayedInteger(self._item_pos(len(self)), num_bytes=0)
+        node.phys_size = node.phys_end - node.phys_start
+        return node
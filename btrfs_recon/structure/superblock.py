@@ -4,7 +4,6 @@ import struct
 from uuid import UUID
 
 import construct as cs
-from construct_typed import TEnum
 from crc32c import crc32c
 
 from btrfs_recon.constants import BTRFS_CSUM_SIZE, BTRFS_LABEL_SIZE, BTRFS_MAGIC
@@ -42,7 +41,7 @@ class Superblock(Struct):
     _csum_data_start: int = field(cs.Tell)
     fsid: UUID = field(fields.FSID)
     bytenr: int = field(cs.Int64ul)
-    flags: SuperblockFlags = field(TEnum(cs.Int64ul, SuperblockFlags))
+    flags: SuperblockFlags = field(fields.TEnum(cs.Int64ul, SuperblockFlags))
     magic: str = field(cs.Const(BTRFS_MAGIC))
     generation: int = field(cs.Int64ul)
 
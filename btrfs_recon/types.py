@@ -4,6 +4,8 @@ from typing import Collection, Literal
 DevId = int
 ImagePath = str | Path
 PhysicalAddress = int
+#: Half-open [start, end) range of physical addresses
+PhysicalRange = tuple[PhysicalAddress, PhysicalAddress]
 
 
 AliasedItems = dict[str, str]
@@ -0,0 +1,86 @@
+"""Checkpointing of scan progress, in coalesced, infrequent writes
+
+A scan completes a window (or shard) of a device at a time. Recording each one as
+it completes would cost a DB round-trip and a (synced) commit for every window —
+tens of thousands of them on a multi-TB image. Instead, completed ranges are held
+in memory, merged with any they adjoin, and written all at once when the time
+budget runs out (or on flush()).
+
+A range is only checkpointed if no node found within it failed to be processed, so
+a resumed scan goes back over any range with nodes yet to be persisted.
+"""
+from __future__ import annotations
+
+import time
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from btrfs_recon.types import PhysicalRange
+from btrfs_recon.util.ranges import merge_ranges
+
+__all__ = [
+    'DEFAULT_CHECKPOINT_MS',
+    'Checkpointer',
+]
+
+#: Maximum time (in milliseconds) a completed range may wait to be written
+DEFAULT_CHECKPOINT_MS = 10_000
+
+K = TypeVar('K', bound=Hashable)
+
+
+class Checkpointer(Generic[K]):
+    """Collects the completed ranges of each key (e.g. device), writing them in batches
+
+    Failures are reported with fail() as they happen, and each range with complete()
+    once everything found within it has been processed. As each key's ranges complete
+    in order, the failures reported for a key since its last complete() belong to the
+    range being completed, which is then left out.
+
+    Call flush() once done, to write any ranges still pending.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[dict[K, list[PhysicalRange]]], Awaitable[object]],
+        max_ms: int | None = DEFAULT_CHECKPOINT_MS,
+    ):
+        """
+        :param write: called with the merged ranges of each key to record, which it
+            should persist (and commit) all at once
+        :param max_ms: maximum time a completed range may wait to be written. If None
+            (or 0), ranges are only written on flush().
+        """
+        self.write = write
+        self.max_age = max_ms / 1000 if max_ms else None
+        self.pending: dict[K, list[PhysicalRange]] = {}
+        self._failures: dict[K, int] = {}
+        self._started: float | None = None
+
+    def fail(self, key: K) -> None:
+        """Note that something found in the key's current range failed to be processed"""
+        self._failures[key] = self._failures.get(key, 0) + 1
+
+    async def complete(self, key: K, scanned: PhysicalRange) -> int:
+        """Checkpoint a range of the key, unless anything in it failed
+
+        :return: the number of failures which kept the range from being checkpointed
+        """
+        if num_failures := self._failures.pop(key, 0):
+            return num_failures
+
+        if not self.pending:
+            self._started = time.monotonic()
+        self.pending.setdefault(key, []).append(scanned)
+
+        if self.max_age is not None and time.monotonic() - self._started >= self.max_age:
+            await self.flush()
+        return 0
+
+    async def flush(self) -> None:
+        """Write every range completed since the last write"""
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+        self._started = None
+        await self.write({key: merge_ranges(ranges) for key, ranges in pending.items()})
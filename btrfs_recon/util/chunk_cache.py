@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from typing import Iterable, TYPE_CHECKING
+import bisect
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Sequence, TYPE_CHECKING
 
 import construct as cs
-from intervaltree import Interval, IntervalTree
+import numpy as np
 
 from btrfs_recon.types import DevId, PhysicalAddress
 
@@ -11,7 +15,211 @@ if TYPE_CHECKING:
     from btrfs_recon import structure
 
 
-class ChunkTreeCache(IntervalTree):
+class StripeLayout(NamedTuple):
+    """How the stripe units of a chunk are laid out over its stripes
+
+    A chunk's logical bytes are divided into stripe units of stripe_len bytes, dealt
+    out in rows across its stripes. Each row holds data_stripes units, each stored on
+    copies consecutive stripes; RAID5/6 rows additionally hold parity units, and rotate
+    which stripes hold data from row to row.
+    """
+    #: Number of stripe units of data in each row
+    data_stripes: int
+    #: Number of stripes holding a copy of each stripe unit
+    copies: int
+    #: Number of parity units in each row (RAID5: 1, RAID6: 2)
+    parity: int
+
+
+class FullStripe(NamedTuple):
+    """One row of a RAID5/6 chunk: its data stripe units, and the parity over them"""
+    #: Logical address of the first byte of the row
+    logical: int
+    stripe_len: int
+    #: (devid, physical address) of each data stripe unit, in column order
+    data: tuple[tuple[DevId, PhysicalAddress], ...]
+    #: (devid, physical address) of the P (and, for RAID6, Q) stripe units
+    parity: tuple[tuple[DevId, PhysicalAddress], ...]
+
+
+#: Profiles storing a full copy of the chunk on every stripe
+MIRRORED_PROFILES = 1 << 4 | 1 << 5 | 1 << 9 | 1 << 10  # RAID1 | DUP | RAID1C3 | RAID1C4
+
+
+def stripe_layout(flags: int, num_stripes: int, sub_stripes: int = 2) -> StripeLayout:
+    """Return the layout of a chunk's stripe units, from its BlockGroupFlags
+
+    Mirrored profiles (DUP, RAID1*) store a full copy on every stripe; RAID10 splits
+    bytes across each mirrored set of sub_stripes; RAID5/6 across all stripes save
+    those holding parity; and RAID0 across all stripes. As in the kernel, a chunk with
+    no profile flag (SINGLE) is striped like RAID0 (though it only ever has one stripe).
+    """
+    from btrfs_recon.structure import BlockGroupFlag
+
+    if flags & MIRRORED_PROFILES:
+        return StripeLayout(1, num_stripes, 0)
+    elif flags & BlockGroupFlag.RAID10:
+        sub_stripes = sub_stripes or 2
+        return StripeLayout(num_stripes // sub_stripes, sub_stripes, 0)
+    elif flags & BlockGroupFlag.RAID5:
+        return StripeLayout(num_stripes - 1, 1, 1)
+    elif flags & BlockGroupFlag.RAID6:
+        return StripeLayout(num_stripes - 2, 1, 2)
+    else:
+        return StripeLayout(num_stripes, 1, 0)
+
+
+def num_data_stripes(flags: int, num_stripes: int, sub_stripes: int = 2) -> int:
+    """Return the number of stripes a chunk's logical bytes are divided among"""
+    return stripe_layout(flags, num_stripes, sub_stripes).data_stripes
+
+
+def stripe_extent_length(length: int, flags: int, num_stripes: int, sub_stripes: int = 2) -> int:
+    """Return the number of bytes a chunk occupies on the device of each of its stripes"""
+    return length // num_data_stripes(flags, num_stripes, sub_stripes)
+
+
+#: Layout of the stripe table of a ChunkTreeCache (see ChunkTreeCache.to_table()):
+#: one row per stripe, ordered by the logical address of the chunk, then by stripe
+CHUNK_STRIPE_DTYPE = np.dtype([
+    ('log_start', '<u8'),
+    ('log_end', '<u8'),
+    ('stripe_len', '<u8'),
+    ('flags', '<u8'),
+    ('sub_stripes', '<u2'),
+    ('devid', '<u8'),
+    ('offset', '<u8'),
+])
+
+
+@dataclass(slots=True, frozen=True)
+class Chunk:
+    log_start: int
+    log_end: int
+    stripe_len: int
+    stripes: tuple[tuple[DevId, PhysicalAddress], ...]
+    #: BlockGroupFlags of the chunk (only the profile flags matter for mapping)
+    flags: int = 0
+    sub_stripes: int = 2
+
+    @property
+    def length(self) -> int:
+        return self.log_end - self.log_start
+
+    @property
+    def layout(self) -> StripeLayout:
+        return stripe_layout(self.flags, len(self.stripes), self.sub_stripes)
+
+
+class ChunkTreeCache:
+    """Mapping of logical -> physical addresses, from the chunks of a filesystem
+
+    Chunks are kept in sorted NumPy arrays (log_start, length, stripe_len, layout, and
+    offsets into a table of stripes), so a logical address is found by bisection.
+    Whole arrays of logical addresses (e.g. every KeyPtr.blockptr of a node) are
+    translated at once with translate(), and whole arrays of physical addresses on
+    a device are mapped back to logical addresses with reverse().
+
+    Each chunk is mapped according to its profile (see stripe_layout()). Where a
+    profile keeps several copies of data, lookups take a mirror number choosing
+    among them, and mirrors() returns every copy.
+
+    Chunks may be inserted at any time; the arrays are rebuilt on the next lookup.
+
+    All the arrays are derived from a single stripe table, which may be saved to a
+    file with save(), and memory-mapped back with load() — so processes sharing a
+    chunk map needn't query or rebuild it, and share its pages read-only.
+    """
+
+    __slots__ = (
+        '_chunks',
+        '_table',
+        '_log_starts',
+        '_log_starts_list',
+        '_lengths',
+        '_stripe_lens',
+        '_num_stripes',
+        '_data_stripes',
+        '_copies',
+        '_parity',
+        '_stripe_index',
+        '_stripe_devids',
+        '_stripe_offsets',
+        '_reverse',
+    )
+
+    def __init__(self, chunks: Iterable[Chunk] = ()):
+        #: Chunks by log_start (None if not yet created from a loaded stripe table)
+        self._chunks: dict[int, Chunk] | None = {}
+        #: Stripe table, with CHUNK_STRIPE_DTYPE (None if not yet built from _chunks)
+        self._table: np.ndarray | None = None
+        self._log_starts: np.ndarray | None = None
+        #: Per-device extent arrays for reverse(), built on demand
+        self._reverse: dict[DevId, _DeviceExtents] | None = None
+
+        for chunk in chunks:
+            self._chunks[chunk.log_start] = chunk
+
+    @classmethod
+    def from_table(cls, table: np.ndarray) -> ChunkTreeCache:
+        """Create a cache from a stripe table, as returned by to_table()
+
+        The table is used as-is (it may be a read-only memmap), and Chunk objects are
+        only created once something needs them (e.g. offsets() or insert()).
+        """
+        if table.dtype != CHUNK_STRIPE_DTYPE:
+            raise ValueError(f'Expected a stripe table of dtype {CHUNK_STRIPE_DTYPE}, found {table.dtype}')
+
+        cache = cls()
+        cache._chunks = None
+        cache._table = table
+        cache._index()
+        return cache
+
+    @classmethod
+    def load(cls, path: str | os.PathLike, *, mmap: bool = True) -> ChunkTreeCache:
+        """Load a chunk map written by save()
+
+        :param mmap: whether to memory-map the file read-only, rather than read it. A
+            mapped file loads near-instantly, and every process mapping it shares the
+            same pages of the OS page cache.
+        """
+        table = np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+        return cls.from_table(table)
+
+    def to_table(self) -> np.ndarray:
+        """Return the stripe table of the cache, with dtype CHUNK_STRIPE_DTYPE"""
+        if self._log_starts is None:
+            self._build()
+        return self._table
+
+    def save(self, path: str | os.PathLike) -> None:
+        """Write the chunk map to a file, to be loaded by load()
+
+        The file is written under a temporary name and renamed into place, so a
+        process loading it concurrently never sees a partial file.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        try:
+            with tmp_path.open('wb') as fp:
+                np.save(fp, self.to_table(), allow_pickle=False)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        if self._chunks is None:
+            return len(self._log_starts)
+        return len(self._chunks)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        """Iterate over all chunks, ordered by logical address"""
+        return iter(sorted(self._get_chunks().values(), key=lambda chunk: chunk.log_start))
+
+    def __contains__(self, logical: int) -> bool:
+        return self._find(logical) is not None
+
     def insert(
         self,
         log_start: int,
@@ -22,75 +230,373 @@ class ChunkTreeCache(IntervalTree):
             | dict[DevId, PhysicalAddress]
             | Iterable[cs.Container | structure.Stripe]
         ),
-    ) -> Interval:
-        """Record a mapping of logical -> physical for a block of logical address space"""
+        flags: int = 0,
+        sub_stripes: int = 2,
+    ) -> Chunk:
+        """Record a mapping of logical -> physical for a block of logical address space
+
+        A chunk inserted at the same log_start as an earlier one replaces it.
+
+        :param flags: the chunk's BlockGroupFlags (ChunkItem.ty), deciding its profile
+        :param sub_stripes: the number of stripes mirroring each other, for RAID10
+        """
         from btrfs_recon import structure
 
-        if not isinstance(stripes, dict):
+        if isinstance(stripes, dict):
+            stripes = tuple(stripes.items())
+        else:
             stripes = tuple(stripes)
             assert stripes
 
             if isinstance(stripes[0], (cs.Container, structure.Stripe)):
-                stripes = [(stripe.devid, stripe.offset) for stripe in stripes]
+                stripes = tuple((stripe.devid, stripe.offset) for stripe in stripes)
+            else:
+                stripes = tuple((devid, physical) for devid, physical in stripes)
 
-        if matches := self[log_start:log_end]:
-            assert len(matches) == 1
-            ival, = matches
-            ival.data['stripe_len'] = stripe_len
-            ival.data['stripes'] = stripes
-        else:
-            ival = Interval(log_start, log_end, {
-                'stripe_len': stripe_len,
-                'stripes': stripes,
-            })
-            self.add(ival)
+        chunk = Chunk(log_start, log_end, stripe_len, stripes, int(flags), sub_stripes)
+        self._get_chunks()[log_start] = chunk
+        self._table = None
+        self._log_starts = None
+        self._reverse = None
+        return chunk
 
-        return ival
+    def _get_chunks(self) -> dict[int, Chunk]:
+        if self._chunks is None:
+            table = self._table
+            bounds = self._stripe_index.tolist() + [len(table)]
+            firsts = table[self._stripe_index]
+            log_ends = firsts['log_end'].tolist()
+            flags = firsts['flags'].tolist()
+            sub_stripes = firsts['sub_stripes'].tolist()
+            stripe_lens = self._stripe_lens.tolist()
+            devids = table['devid'].tolist()
+            offsets = table['offset'].tolist()
 
-    def offsets(self, logical: int, size: int = 1) -> Iterable[tuple[DevId, PhysicalAddress, int]]:
-        """Return the mapped physical addresses for the given logical address
+            self._chunks = {
+                log_start: Chunk(
+                    log_start,
+                    log_ends[i],
+                    stripe_lens[i],
+                    tuple(zip(devids[bounds[i]:bounds[i + 1]], offsets[bounds[i]:bounds[i + 1]])),
+                    flags[i],
+                    sub_stripes[i],
+                )
+                for i, log_start in enumerate(self._log_starts_list)
+            }
+        return self._chunks
 
-        This method will offset the physical address if the logical address is in the middle of a
-        mapped block.
-        """
-        blocks: set[Interval] = self.at(logical)
-        assert len(blocks) <= 1, \
-            f'Multiple logical blocks matched {logical}. This should never happen.'
+    def _build(self) -> None:
+        rows = [
+            (chunk.log_start, chunk.log_end, chunk.stripe_len, chunk.flags, chunk.sub_stripes, devid, physical)
+            for chunk in self
+            for devid, physical in chunk.stripes
+        ]
+        self._table = np.array(rows, dtype=CHUNK_STRIPE_DTYPE)
+        self._index()
+
+    def _index(self) -> None:
+        """Derive the per-chunk lookup arrays from the stripe table"""
+        table = self._table
+        log_starts = table['log_start']
+
+        # Index of each chunk's first stripe within the stripe table
+        is_first = np.ones(len(table), dtype=bool)
+        is_first[1:] = log_starts[1:] != log_starts[:-1]
+        first = np.flatnonzero(is_first)
 
-        if not blocks:
+        self._log_starts = np.ascontiguousarray(log_starts[first])
+        self._log_starts_list = self._log_starts.tolist()
+        self._lengths = table['log_end'][first] - self._log_starts
+        self._stripe_lens = np.ascontiguousarray(table['stripe_len'][first])
+        self._num_stripes = np.diff(first, append=len(table)).astype(np.uint64)
+        self._stripe_index = first.astype(np.uint64)
+        self._index_layouts(table['flags'][first], table['sub_stripes'][first])
+
+        self._stripe_devids = table['devid'].astype(np.int64)
+        self._stripe_offsets = np.ascontiguousarray(table['offset'])
+        self._reverse = None
+
+    def _index_layouts(self, flags: np.ndarray, sub_stripes: np.ndarray) -> None:
+        """Compute the stripe_layout() of every chunk at once"""
+        from btrfs_recon.structure import BlockGroupFlag
+
+        def has_flag(flag: int) -> np.ndarray:
+            return (flags & np.uint64(flag)) != 0
+
+        num_stripes = self._num_stripes
+        sub_stripes = np.where(sub_stripes == 0, 2, sub_stripes).astype(np.uint64)
+        is_mirrored = has_flag(MIRRORED_PROFILES)
+        is_raid10 = ~is_mirrored & has_flag(BlockGroupFlag.RAID10)
+        is_raid5 = ~is_mirrored & ~is_raid10 & has_flag(BlockGroupFlag.RAID5)
+        is_raid6 = ~is_mirrored & ~is_raid10 & ~is_raid5 & has_flag(BlockGroupFlag.RAID6)
+
+        self._copies = np.select([is_mirrored, is_raid10], [num_stripes, sub_stripes], 1).astype(np.uint64)
+        self._parity = np.select([is_raid5, is_raid6], [1, 2], 0).astype(np.uint64)
+        self._data_stripes = np.select(
+            [is_mirrored, is_raid10],
+            [np.ones_like(num_stripes), num_stripes // sub_stripes],
+            num_stripes - self._parity,
+        ).astype(np.uint64)
+
+    def _find(self, logical: int) -> Chunk | None:
+        """Return the chunk containing a logical address, if any"""
+        if self._log_starts is None:
+            self._build()
+
+        index = bisect.bisect_right(self._log_starts_list, logical) - 1
+        if index < 0:
+            return None
+
+        chunk = self._get_chunks()[self._log_starts_list[index]]
+        if logical >= chunk.log_end:
+            return None
+        return chunk
+
+    def find(self, logical: int) -> Chunk:
+        """Return the chunk containing a logical address, raising KeyError if none does"""
+        if (chunk := self._find(logical)) is None:
             raise KeyError(f'Unable to find physical address mapping for logical address {logical}')
+        return chunk
 
-        block = next(iter(blocks))
+    def mirrors(
+        self, logical: int, size: int = 1
+    ) -> Iterable[tuple[tuple[tuple[DevId, PhysicalAddress], ...], int]]:
+        """Return every copy of the physical addresses mapped to a logical range
+
+        The range is split where it crosses stripe units; for each piece, the
+        (devid, physical address) of each of its copies is yielded, along with its size.
+        Profiles without redundant copies of data (RAID0, RAID5/6, SINGLE) have only
+        one copy of each piece.
+        """
+        block = self.find(logical)
 
-        stripe_len = block.data['stripe_len']
-        stripes = block.data['stripes']
+        stripe_len = block.stripe_len
+        stripes = block.stripes
         num_stripes = len(stripes)
+        data_stripes, copies, parity = block.layout
 
-        log_offset = logical - block.begin
-        pre_stripe_units = log_offset // stripe_len
-        stripe_offset = log_offset % stripe_len
+        log_offset = logical - block.log_start
+        stripe_unit, stripe_offset = divmod(log_offset, stripe_len)
 
         while size > 0:
-            n_stripe_units = pre_stripe_units // num_stripes
-            stripe_idx = pre_stripe_units % num_stripes
-            (devid, chunk_phys) = stripes[stripe_idx]
+            row, column = divmod(stripe_unit, data_stripes)
+            if parity:
+                # RAID5/6 rotate the data stripes by one each row
+                stripe_idxs = ((row + column) % num_stripes,)
+            else:
+                stripe_idxs = range(column * copies, (column + 1) * copies)
 
-            num_bytes = min(size, stripe_len, stripe_len - stripe_offset)
-            phys = chunk_phys + n_stripe_units * stripe_len + stripe_offset
-            yield devid, phys, num_bytes
+            phys_offset = row * stripe_len + stripe_offset
+            num_bytes = min(size, stripe_len - stripe_offset)
+            yield tuple((stripes[idx][0], stripes[idx][1] + phys_offset) for idx in stripe_idxs), num_bytes
 
-            pre_stripe_units += 1
+            stripe_unit += 1
             stripe_offset = 0
             size -= num_bytes
 
-    def reverse_trees(self) -> dict[DevId, IntervalTree]:
-        """Return a tree mapping physical -> logical for each device in the cache"""
-        rtrees: dict[DevId, IntervalTree] = {}
+    def full_stripe(self, logical: int) -> FullStripe:
+        """Return the row of a RAID5/6 chunk holding a logical address"""
+        block = self.find(logical)
+        data_stripes, _, parity = block.layout
+        if not parity:
+            raise ValueError(f'Logical address {logical} is not within a RAID5/6 chunk')
+
+        stripe_len = block.stripe_len
+        stripes = block.stripes
+        num_stripes = len(stripes)
+
+        row = (logical - block.log_start) // stripe_len // data_stripes
+        phys_offset = row * stripe_len
+
+        # Data columns start at the row's rotation, followed by P, then Q
+        placements = tuple(
+            (stripes[(row + column) % num_stripes][0], stripes[(row + column) % num_stripes][1] + phys_offset)
+            for column in range(data_stripes + parity)
+        )
+        return FullStripe(
+            logical=block.log_start + row * data_stripes * stripe_len,
+            stripe_len=stripe_len,
+            data=placements[:data_stripes],
+            parity=placements[data_stripes:],
+        )
+
+    def offsets(
+        self, logical: int, size: int = 1, *, mirror: int = 0
+    ) -> Iterable[tuple[DevId, PhysicalAddress, int]]:
+        """Return the mapped physical addresses for the given logical address
+
+        This method will offset the physical address if the logical address is in the middle of a
+        mapped block.
+
+        :param mirror: which copy of the data to map to, for profiles keeping several
+            (wrapping around for those with fewer copies)
+        """
+        for copies, num_bytes in self.mirrors(logical, size):
+            devid, phys = copies[mirror % len(copies)]
+            yield devid, phys, num_bytes
+
+    def offset(self, logical: int, *, mirror: int = 0) -> tuple[DevId, PhysicalAddress]:
+        """Return the (devid, physical address) a logical address is mapped to"""
+        devid, phys, _ = next(iter(self.offsets(logical, mirror=mirror)))
+        return devid, phys
+
+    def translate(
+        self, logicals: Sequence[int] | np.ndarray, *, strict: bool = True, mirror: int = 0
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Map a whole array of logical addresses to (devid, physical address) at once
+
+        Each address is mapped as by offset(), but in a handful of vectorized operations.
+        Passing a different mirror for each copy (e.g. 0 and 1, for RAID1) spreads
+        reads of many addresses across devices.
+
+        :param strict: whether to raise KeyError if any address is not mapped. Otherwise,
+            unmapped addresses are given a devid of -1 (and a physical address of 0).
+        :return: arrays of the devids (int64) and physical addresses (uint64) of each
+            of the logical addresses
+        """
+        if self._log_starts is None:
+            self._build()
+
+        logicals = np.asarray(logicals, dtype=np.uint64)
+        index = np.searchsorted(self._log_starts, logicals, side='right').astype(np.int64) - 1
+
+        # Unmapped addresses are pointed at chunk 0 for the arithmetic, then masked
+        mapped = index >= 0
+        index[~mapped] = 0
+        if len(self._log_starts):
+            log_offset = logicals - self._log_starts[index]
+            mapped &= log_offset < self._lengths[index]
+        else:
+            mapped[:] = False
+
+        if strict and not mapped.all():
+            unmapped = int(logicals[~mapped][0])
+            raise KeyError(f'Unable to find physical address mapping for logical address {unmapped}')
+
+        devids = np.full(len(logicals), -1, dtype=np.int64)
+        physical = np.zeros(len(logicals), dtype=np.uint64)
+        if not mapped.any():
+            return devids, physical
+
+        index = index[mapped]
+        log_offset = log_offset[mapped]
+        stripe_len = self._stripe_lens[index]
+        num_stripes = self._num_stripes[index]
+        copies = self._copies[index]
+
+        stripe_units, stripe_offset = np.divmod(log_offset, stripe_len)
+        row, column = np.divmod(stripe_units, self._data_stripes[index])
+        stripe_idx = np.where(
+            self._parity[index] > 0,
+            (row + column) % num_stripes,
+            column * copies + np.uint64(mirror) % copies,
+        )
+        table_index = self._stripe_index[index] + stripe_idx
+
+        devids[mapped] = self._stripe_devids[table_index]
+        physical[mapped] = self._stripe_offsets[table_index] + row * stripe_len + stripe_offset
+        return devids, physical
+
+    def _build_reverse(self) -> None:
+        if self._log_starts is None:
+            self._build()
+
+        # Broadcast each chunk's fields to its stripes
+        chunk_index = np.repeat(np.arange(len(self._log_starts)), self._num_stripes.astype(np.intp))
+        num_stripes = self._num_stripes[chunk_index]
+        data_stripes = self._data_stripes[chunk_index]
+        stripe_lens = self._stripe_lens[chunk_index]
+        stripe_idxs = np.arange(len(self._table), dtype=np.uint64) - self._stripe_index[chunk_index]
+
+        # Every stripe holds one stripe unit of each row
+        units = (self._lengths[chunk_index] + stripe_lens - 1) // stripe_lens
+        extent_lens = (units + data_stripes - 1) // data_stripes * stripe_lens
+
+        phys_starts = self._stripe_offsets
+        order = np.lexsort((phys_starts, self._stripe_devids))
+        devids, dev_firsts = np.unique(self._stripe_devids[order], return_index=True)
+
+        self._reverse = {}
+        for devid, dev_order in zip(devids.tolist(), np.split(order, dev_firsts[1:])):
+            self._reverse[devid] = _DeviceExtents(
+                phys_starts=phys_starts[dev_order],
+                phys_ends=phys_starts[dev_order] + extent_lens[dev_order],
+                log_starts=self._log_starts[chunk_index[dev_order]],
+                log_ends=self._table['log_end'][dev_order],
+                stripe_lens=stripe_lens[dev_order],
+                num_stripes=num_stripes[dev_order],
+                data_stripes=data_stripes[dev_order],
+                copies=self._copies[chunk_index[dev_order]],
+                parity=self._parity[chunk_index[dev_order]],
+                stripe_idxs=stripe_idxs[dev_order],
+            )
+
+    def reverse(
+        self, devid: DevId, physicals: Sequence[int] | np.ndarray, *, strict: bool = True
+    ) -> np.ndarray:
+        """Map a whole array of physical addresses on a device back to logical addresses
+
+        This is the inverse of translate(): for every physical address within a chunk's
+        stripe on the device, the logical address mapped to it is returned. Every copy
+        of mirrored data maps back to the same logical address; RAID5/6 parity maps to
+        none.
+
+        :param strict: whether to raise KeyError if any address is not mapped. Otherwise,
+            unmapped addresses are given a logical address of -1.
+        :return: array of the logical addresses (int64) of each of the physical addresses
+        """
+        if self._reverse is None:
+            self._build_reverse()
+
+        physicals = np.asarray(physicals, dtype=np.uint64)
+        logicals = np.full(len(physicals), -1, dtype=np.int64)
+
+        mapped = np.zeros(len(physicals), dtype=bool)
+        if (extents := self._reverse.get(devid)) is not None:
+            index = np.searchsorted(extents.phys_starts, physicals, side='right').astype(np.int64) - 1
+            mapped = index >= 0
+            index[~mapped] = 0
+            mapped &= physicals < extents.phys_ends[index]
+
+        if mapped.any():
+            index = index[mapped]
+            stripe_len = extents.stripe_lens[index]
+            num_stripes = extents.num_stripes[index]
+            data_stripes = extents.data_stripes[index]
+            stripe_idx = extents.stripe_idxs[index]
+            row, stripe_offset = np.divmod(physicals[mapped] - extents.phys_starts[index], stripe_len)
+
+            # Undo the rotation of RAID5/6 rows, where columns past the data are parity
+            column = np.where(
+                extents.parity[index] > 0,
+                (stripe_idx + num_stripes - row % num_stripes) % num_stripes,
+                stripe_idx // extents.copies[index],
+            )
+            stripe_units = row * data_stripes + column
+            mapped_logicals = extents.log_starts[index] + stripe_units * stripe_len + stripe_offset
+
+            # The final stripe unit of a device extent may lie past the end of its chunk
+            in_chunk = (column < data_stripes) & (mapped_logicals < extents.log_ends[index])
+            logicals[np.flatnonzero(mapped)[in_chunk]] = mapped_logicals[in_chunk]
+            mapped[mapped] = in_chunk
+
+        if strict and not mapped.all():
+            unmapped = int(physicals[~mapped][0])
+            raise KeyError(f'Unable to find logical address mapping for physical address {unmapped} '
+                           f'of devid {devid}')
+
+        return logicals
 
-        for ival in self.all_intervals:
-            for devid, physical in ival.data.items():
-                if devid not in rtrees:
-                    rtrees[devid] = IntervalTree()
-                rtrees[devid].addi(physical, physical + ival.length(), ival.begin)
 
-        return rtrees
+class _DeviceExtents(NamedTuple):
+    """Sorted arrays describing the chunk stripes (device extents) of a single device"""
+    phys_starts: np.ndarray
+    phys_ends: np.ndarray
+    log_starts: np.ndarray
+    log_ends: np.ndarray
+    stripe_lens: np.ndarray
+    num_stripes: np.ndarray
+    data_stripes: np.ndarray
+    copies: np.ndarray
+    parity: np.ndarray
+    stripe_idxs: np.ndarray
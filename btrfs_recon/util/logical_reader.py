@@ -0,0 +1,271 @@
+"""Reads of logical address ranges, drawing on every copy of mirrored data
+
+For profiles keeping several copies of each stripe unit (DUP, RAID1*, RAID10), a
+read may be served by any of the copies. LogicalReader.read() spreads a range over
+the copies, so each device reads a contiguous share of it concurrently, and
+LogicalReader.read_verified() reads every copy at once, returning whichever copy
+first passes a check (e.g. a node's checksum) — so a slow or damaged device only
+delays a read if every other copy is bad, too.
+
+RAID5/6 data has a single copy, but may be rebuilt from the rest of its row and the
+row's parity (see util.raid). Stripe units on a device which is missing or fails to
+read are rebuilt this way, as are units whose rebuilding makes a read pass
+read_verified()'s check.
+
+Devices are read with os.pread(), which releases the GIL and shares no file
+position, so one handle per device serves every thread.
+"""
+from __future__ import annotations
+
+import errno
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import BinaryIO, Callable, Iterable, Iterator, Mapping, NamedTuple, TypeVar
+
+import numpy as np
+
+from btrfs_recon.types import DevId, PhysicalAddress
+from btrfs_recon.util.chunk_cache import ChunkTreeCache
+from btrfs_recon.util.raid import recover
+
+__all__ = [
+    'LogicalReader',
+    'NoValidCopyError',
+]
+
+#: A single read from a device: (devid, physical address, number of bytes)
+_Read = tuple[DevId, PhysicalAddress, int]
+
+T = TypeVar('T')
+
+
+class _Piece(NamedTuple):
+    """The part of a logical range within a single stripe unit"""
+    logical: int
+    #: (devid, physical address) of each copy
+    copies: tuple[tuple[DevId, PhysicalAddress], ...]
+    size: int
+
+
+class NoValidCopyError(ValueError):
+    """Raised when no copy of a logical range passes verification"""
+
+    def __init__(self, logical: int, size: int, copies: list[bytes]):
+        super().__init__(
+            f'None of the {len(copies)} copies of logical range '
+            f'[{logical:#x}, {logical + size:#x}) passed verification'
+        )
+        self.logical = logical
+        self.size = size
+        #: Bytes of every copy which could be read, in order of mirror number
+        self.copies = copies
+
+
+def _coalesce(reads: Iterable[tuple[_Read, T]]) -> list[tuple[_Read, list[T]]]:
+    """Merge consecutive reads of adjoining bytes on the same device
+
+    Each read is paired with an item (e.g. what it's reading), and each merged read
+    is returned with the items of all the reads it covers.
+    """
+    merged: list[tuple[_Read, list[T]]] = []
+    for (devid, phys, size), item in reads:
+        if merged:
+            (prev_devid, prev_phys, prev_size), items = merged[-1]
+            if prev_devid == devid and prev_phys + prev_size == phys:
+                merged[-1] = ((devid, prev_phys, prev_size + size), items + [item])
+                continue
+        merged.append(((devid, phys, size), [item]))
+    return merged
+
+
+class LogicalReader:
+    """Read logical address ranges from a filesystem's devices, through its chunk map
+
+    Use as a context manager, or call close(), to shut down the reader threads. The
+    device handles are left open.
+    """
+
+    def __init__(
+        self,
+        chunk_cache: ChunkTreeCache,
+        devices: Mapping[DevId, BinaryIO],
+        *,
+        max_workers: int | None = None,
+    ):
+        self.chunk_cache = chunk_cache
+        self.devices = dict(devices)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(4, 2 * len(self.devices)),
+            thread_name_prefix='LogicalReader',
+        )
+
+    def __enter__(self) -> LogicalReader:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _pread(self, devid: DevId, phys: PhysicalAddress, size: int) -> bytes:
+        if (fp := self.devices.get(devid)) is None:
+            raise OSError(errno.ENODEV, f'No device handle for devid {devid}')
+
+        fd = fp.fileno()
+        data = os.pread(fd, size, phys)
+        while len(data) < size:
+            more = os.pread(fd, size - len(data), phys + len(data))
+            if not more:
+                raise OSError(f'Unexpected end of devid {devid} reading {size} bytes at {phys:#x}')
+            data += more
+        return data
+
+    def _pieces(self, logical: int, size: int) -> list[_Piece]:
+        pieces = []
+        for copies, num_bytes in self.chunk_cache.mirrors(logical, size):
+            pieces.append(_Piece(logical, copies, num_bytes))
+            logical += num_bytes
+        return pieces
+
+    def _parity(self, logical: int) -> int:
+        """Return the number of parity units in each row of the chunk holding logical"""
+        return self.chunk_cache.find(logical).layout.parity
+
+    def _rebuild(self, logical: int, size: int, *, use_p: bool = True) -> bytes:
+        """Rebuild a piece of a RAID5/6 stripe unit from the rest of its row
+
+        :param use_p: whether to use P parity. Without it, RAID6 rebuilds from Q alone
+            (for when P may be as damaged as the unit being rebuilt).
+        """
+        row = self.chunk_cache.full_stripe(logical)
+        column, stripe_offset = divmod(logical - row.logical, row.stripe_len)
+
+        def read_unit(devid: DevId, phys: PhysicalAddress) -> np.ndarray | None:
+            try:
+                return np.frombuffer(self._pread(devid, phys + stripe_offset, size), dtype=np.uint8)
+            except OSError:
+                return None
+
+        data = [None if i == column else read_unit(*placement) for i, placement in enumerate(row.data)]
+        p, q, *_ = [read_unit(*placement) for placement in row.parity] + [None]
+        if not use_p:
+            p = None
+
+        try:
+            return recover(data, p, q)[column].tobytes()
+        except ValueError as e:
+            raise OSError(f'Unable to rebuild logical range [{logical:#x}, {logical + size:#x}): {e}') from e
+
+    def _read_piece(self, piece: _Piece, mirror: int = 0) -> bytes:
+        """Read a piece from any of its copies (starting from mirror), or rebuild it"""
+        num_copies = len(piece.copies)
+        error: OSError | None = None
+        for i in range(num_copies):
+            devid, phys = piece.copies[(mirror + i) % num_copies]
+            try:
+                return self._pread(devid, phys, piece.size)
+            except OSError as e:
+                error = e
+
+        if self._parity(piece.logical):
+            return self._rebuild(piece.logical, piece.size)
+        raise error
+
+    def _read_run(self, read: _Read, pieces: list[tuple[_Piece, int]]) -> bytes:
+        """Read a run of adjoining pieces at once, falling back to reading them one by one"""
+        try:
+            return self._pread(*read)
+        except OSError:
+            return b''.join(self._read_piece(piece, mirror) for piece, mirror in pieces)
+
+    def _read_mirror(self, pieces: list[_Piece], mirror: int) -> bytes:
+        """Read one copy of every piece, with no fallback to other copies"""
+        reads = [((*piece.copies[mirror % len(piece.copies)], piece.size), piece) for piece in pieces]
+        return b''.join(self._pread(*read) for read, _ in _coalesce(reads))
+
+    def read(self, logical: int, size: int) -> bytes:
+        """Read a logical range, spreading it across the copies of mirrored data
+
+        The stripe units of the range are divided into one contiguous share per copy,
+        and all shares are read concurrently. Data without redundant copies is read
+        as-is (its stripe units still being read concurrently, if on several devices).
+
+        Any stripe unit failing to read (e.g. its device is missing) is read from its
+        other copies, or, for RAID5/6, rebuilt from parity.
+
+        :raises OSError: if some part of the range could be neither read nor rebuilt
+        """
+        pieces = self._pieces(logical, size)
+
+        reads = []
+        for i, piece in enumerate(pieces):
+            mirror = i * len(piece.copies) // len(pieces)
+            reads.append(((*piece.copies[mirror], piece.size), (piece, mirror)))
+
+        futures = [self._executor.submit(self._read_run, *run) for run in _coalesce(reads)]
+        return b''.join(future.result() for future in futures)
+
+    def read_verified(self, logical: int, size: int, verify: Callable[[bytes], bool]) -> bytes:
+        """Read every copy of a logical range at once, returning the first verify() accepts
+
+        Copies are checked in the order their reads complete; once one is accepted, the
+        reads of any others yet to start are cancelled. If none is accepted and the
+        range is RAID5/6 data, each of its stripe units is rebuilt from parity in turn
+        (from P, then, for RAID6, from Q), until one makes the range pass.
+
+        :raises NoValidCopyError: if no copy could be read and verified
+        """
+        pieces = self._pieces(logical, size)
+        num_copies = max(len(piece.copies) for piece in pieces)
+
+        pending: dict[Future, int] = {
+            self._executor.submit(self._read_mirror, pieces, mirror): mirror
+            for mirror in range(num_copies)
+        }
+
+        copies_read: dict[int, bytes] = {}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    mirror = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except OSError:
+                        continue
+
+                    if verify(data):
+                        return data
+                    copies_read[mirror] = data
+        finally:
+            for future in pending:
+                future.cancel()
+
+        if self._parity(logical):
+            for data in self._rebuilt_candidates(pieces, copies_read.get(0)):
+                if verify(data):
+                    return data
+
+        raise NoValidCopyError(logical, size, [copies_read[mirror] for mirror in sorted(copies_read)])
+
+    def _rebuilt_candidates(self, pieces: list[_Piece], data: bytes | None) -> Iterator[bytes]:
+        """Yield the bytes of a RAID5/6 range, with each of its pieces rebuilt in turn"""
+        if data is None:
+            # Some piece couldn't be read at all; rebuild whichever couldn't
+            try:
+                yield b''.join(self._read_piece(piece) for piece in pieces)
+            except OSError:
+                pass
+            return
+
+        use_ps = (True, False) if self._parity(pieces[0].logical) > 1 else (True,)
+        offset = 0
+        for piece in pieces:
+            for use_p in use_ps:
+                try:
+                    rebuilt = self._rebuild(piece.logical, piece.size, use_p=use_p)
+                except OSError:
+                    continue
+                yield data[:offset] + rebuilt + data[offset + piece.size:]
+            offset += piece.size
@@ -0,0 +1,184 @@
+"""RAID5/6 parity, and reconstruction of lost data stripe units from it
+
+btrfs computes parity as Linux md does: P is the XOR of a row's data stripe units,
+and Q is their syndrome over GF(2^8) (polynomial 0x11d, generator 2):
+
+    Q = g^0·D_0 ⊕ g^1·D_1 ⊕ … ⊕ g^(n-1)·D_(n-1)
+
+where D_i is the data unit in column i of the row. All math is done on whole
+stripe units at once, as NumPy uint8 arrays. XOR is done directly; multiplication
+by 2 is done on 8 bytes at a time, viewed as uint64 words (the same trick as the
+kernel's generic raid6 code), and multiplication by any other constant is built
+from doubling. Blocks not a multiple of 8 bytes fall back to a 256×256 table.
+"""
+from __future__ import annotations
+
+from functools import reduce
+from typing import Sequence
+
+import numpy as np
+
+__all__ = [
+    'GF_EXP',
+    'GF_LOG',
+    'GF_MUL',
+    'gf_inv',
+    'gf_mul',
+    'p_parity',
+    'q_syndrome',
+    'recover',
+]
+
+#: Reducing polynomial of the RAID6 Galois field
+GF_POLY = 0x11d
+
+
+def _gf_tables() -> tuple[np.ndarray, np.ndarray]:
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int64)
+
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLY
+
+    # Doubled, so the sum of two logs may index it without wrapping
+    exp[255:510] = exp[:255]
+    return exp, log
+
+
+#: g^i, for 0 <= i < 510
+#: log_g(x), for 0 < x < 256
+GF_EXP, GF_LOG = _gf_tables()
+
+#: GF_MUL[a, b] is the product a·b; GF_MUL[a][block] multiplies a whole block by a
+GF_MUL = np.where(
+    (np.arange(256)[:, None] == 0) | (np.arange(256)[None, :] == 0),
+    0,
+    GF_EXP[GF_LOG[:, None] + GF_LOG[None, :]],
+).astype(np.uint8)
+
+
+def gf_inv(a: int) -> int:
+    """Return the multiplicative inverse of a nonzero field element"""
+    if not a:
+        raise ZeroDivisionError('0 has no inverse in GF(2^8)')
+    return int(GF_EXP[255 - GF_LOG[a]])
+
+
+_HIGH_BITS = np.uint64(0x8080_8080_8080_8080)
+_LOW_BITS = np.uint64(0xfefe_fefe_fefe_fefe)
+_POLY_BYTES = np.uint64((GF_POLY & 0xff) * 0x0101_0101_0101_0101)
+_ONE = np.uint64(1)
+_SEVEN = np.uint64(7)
+
+
+def _mul2_words(words: np.ndarray) -> np.ndarray:
+    """Multiply each of the 8 bytes packed into every uint64 word by g (2)"""
+    high = words & _HIGH_BITS
+    # 0xff in every byte whose high bit overflows, and must be reduced by the polynomial
+    overflow = (high << _ONE) - (high >> _SEVEN)
+    return ((words << _ONE) & _LOW_BITS) ^ (overflow & _POLY_BYTES)
+
+
+def _as_words(block: np.ndarray) -> np.ndarray | None:
+    if len(block) % 8 or not block.flags.c_contiguous:
+        return None
+    return block.view(np.uint64)
+
+
+def gf_mul(coefficient: int, block: np.ndarray) -> np.ndarray:
+    """Multiply every byte of a block by a field element"""
+    if (words := _as_words(block)) is None:
+        return GF_MUL[coefficient][block]
+
+    # Sum the doublings of the block for each bit set in the coefficient
+    product = np.zeros_like(words)
+    while coefficient:
+        if coefficient & 1:
+            product ^= words
+        coefficient >>= 1
+        if coefficient:
+            words = _mul2_words(words)
+    return product.view(np.uint8)
+
+
+def p_parity(blocks: Sequence[np.ndarray]) -> np.ndarray:
+    """Return the P parity (XOR) of a row's data blocks"""
+    return reduce(np.bitwise_xor, blocks[1:], blocks[0].copy())
+
+
+def q_syndrome(blocks: Sequence[np.ndarray]) -> np.ndarray:
+    """Return the Q syndrome of a row's data blocks, ordered by column"""
+    words = [_as_words(block) for block in blocks]
+    if any(block_words is None for block_words in words):
+        mul_g = GF_MUL[2].__getitem__
+        words = blocks
+    else:
+        mul_g = _mul2_words
+
+    # Horner's method: ((D_(n-1)·g ⊕ D_(n-2))·g ⊕ …)·g ⊕ D_0
+    q = words[-1].copy()
+    for block_words in reversed(words[:-1]):
+        q = mul_g(q)
+        q ^= block_words
+    return q.view(np.uint8)
+
+
+def recover(
+    data: Sequence[np.ndarray | None],
+    p: np.ndarray | None = None,
+    q: np.ndarray | None = None,
+) -> list[np.ndarray]:
+    """Rebuild the missing (None) data blocks of a row from the others and its parity
+
+    One missing block may be rebuilt from either P or Q; two need both.
+
+    :raises ValueError: if too much of the row is missing to rebuild it
+    :return: every data block of the row, in column order
+    """
+    missing = [column for column, block in enumerate(data) if block is None]
+    if not missing:
+        return list(data)
+
+    present = [block for block in data if block is not None]
+    size = len(next(block for block in (*present, p, q) if block is not None))
+
+    # Parity of the blocks we have, as though the missing blocks were all zeroes
+    def partial_q() -> np.ndarray:
+        zero = np.zeros(size, dtype=np.uint8)
+        return q_syndrome([zero if block is None else block for block in data])
+
+    rebuilt = list(data)
+    if len(missing) == 1 and p is not None:
+        x, = missing
+        rebuilt[x] = p_parity([p, *present])
+
+    elif len(missing) == 1 and q is not None:
+        x, = missing
+        # Q ⊕ Q' = g^x·D_x
+        rebuilt[x] = gf_mul(gf_inv(int(GF_EXP[x])), q ^ partial_q())
+
+    elif len(missing) == 2 and p is not None and q is not None:
+        x, y = missing
+        pxy = p_parity([p, *present])  # D_x ⊕ D_y
+        qxy = q ^ partial_q()  # g^x·D_x ⊕ g^y·D_y
+
+        # D_x = (g^(y-x)·Pxy ⊕ g^-x·Qxy) / (g^(y-x) ⊕ 1)
+        g_yx = int(GF_EXP[y - x])
+        denom_inv = gf_inv(g_yx ^ 1)
+        a = int(GF_MUL[g_yx, denom_inv])
+        b = int(GF_MUL[gf_inv(int(GF_EXP[x])), denom_inv])
+        rebuilt[x] = gf_mul(a, pxy) ^ gf_mul(b, qxy)
+        rebuilt[y] = pxy ^ rebuilt[x]
+
+    else:
+        raise ValueError(
+            f'Unable to rebuild {len(missing)} missing data block(s) with '
+            f'{"P" if p is not None else "no P"} and {"Q" if q is not None else "no Q"}'
+        )
+
+    return rebuilt
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from btrfs_recon.types import PhysicalRange
+
+__all__ = [
+    'merge_ranges',
+    'invert_ranges',
+    'clip_ranges',
+    'ranges_size',
+    'split_ranges',
+    'subtract_ranges',
+]
+
+
+def merge_ranges(ranges: Iterable[PhysicalRange]) -> list[PhysicalRange]:
+    """Sort half-open [start, end) ranges, coalescing any overlapping or adjacent ones
+
+    >>> merge_ranges([(10, 20), (0, 5), (5, 8), (15, 30)])
+    [(0, 8), (10, 30)]
+    """
+    merged: list[PhysicalRange] = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+
+        if merged and start <= merged[-1][1]:
+            prev_start, prev_end = merged[-1]
+            merged[-1] = (prev_start, max(prev_end, end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def invert_ranges(ranges: Iterable[PhysicalRange], start: int, end: int) -> list[PhysicalRange]:
+    """Return the gaps in [start, end) not covered by any of the ranges
+
+    >>> invert_ranges([(10, 20), (30, 40)], 0, 50)
+    [(0, 10), (20, 30), (40, 50)]
+    """
+    gaps: list[PhysicalRange] = []
+    pos = start
+    for range_start, range_end in clip_ranges(ranges, start, end):
+        if range_start > pos:
+            gaps.append((pos, range_start))
+        pos = max(pos, range_end)
+
+    if pos < end:
+        gaps.append((pos, end))
+
+    return gaps
+
+
+def clip_ranges(ranges: Iterable[PhysicalRange], start: int, end: int) -> list[PhysicalRange]:
+    """Merge the ranges, and trim them to fit within [start, end)
+
+    >>> clip_ranges([(0, 10), (20, 30), (40, 50)], 5, 45)
+    [(5, 10), (20, 30), (40, 45)]
+    """
+    return [
+        (max(range_start, start), min(range_end, end))
+        for range_start, range_end in merge_ranges(ranges)
+        if range_end > start and range_start < end
+    ]
+
+
+def subtract_ranges(
+    ranges: Iterable[PhysicalRange], removed: Iterable[PhysicalRange]
+) -> list[PhysicalRange]:
+    """Merge the ranges, and cut out any portions covered by the removed ranges
+
+    >>> subtract_ranges([(0, 100)], [(10, 20), (90, 200)])
+    [(0, 10), (20, 90)]
+    """
+    removed = merge_ranges(removed)
+    return [
+        piece
+        for start, end in merge_ranges(ranges)
+        for piece in invert_ranges(removed, start, end)
+    ]
+
+
+def ranges_size(ranges: Iterable[PhysicalRange]) -> int:
+    """Return the total number of bytes covered by the (non-overlapping) ranges"""
+    return sum(end - start for start, end in ranges)
+
+
+def split_ranges(ranges: Iterable[PhysicalRange], size: int) -> list[PhysicalRange]:
+    """Merge the ranges, and split them at every multiple of size
+
+    Splitting at absolute boundaries (rather than every `size` bytes from the start
+    of each range) keeps the pieces aligned to any alignment which evenly divides size.
+
+    >>> split_ranges([(0x500, 0x2800)], 0x1000)
+    [(1280, 4096), (4096, 8192), (8192, 10240)]
+    """
+    pieces: list[PhysicalRange] = []
+    for start, end in merge_ranges(ranges):
+        while start < end:
+            boundary = min(start - start % size + size, end)
+            pieces.append((start, boundary))
+            start = boundary
+
+    return pieces
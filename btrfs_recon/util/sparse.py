@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import errno
+import io
+import os
+from typing import BinaryIO
+
+from btrfs_recon.types import PhysicalRange
+
+__all__ = ['data_extents']
+
+
+def data_extents(fp: BinaryIO, start: int, end: int) -> list[PhysicalRange]:
+    """Return the [start, end) ranges within [start, end) which hold data, i.e. aren't holes
+
+    Sparse files (`dd conv=sparse`, thin-provisioned images) are asked for their data
+    extents with SEEK_DATA/SEEK_HOLE. Where that's unsupported (by the platform, the
+    filesystem, or because fp has no file descriptor), the whole range is returned.
+    """
+    whole = [(start, end)] if start < end else []
+
+    if not hasattr(os, 'SEEK_DATA'):
+        return whole
+
+    try:
+        fd = fp.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return whole
+
+    # NOTE: we seek the raw fd behind fp's back, so its position must be restored,
+    #       lest buffered readers read from the wrong place.
+    orig_pos = os.lseek(fd, 0, os.SEEK_CUR)
+    try:
+        extents: list[PhysicalRange] = []
+        pos = start
+        while pos < end:
+            try:
+                data_start = os.lseek(fd, pos, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # No data beyond pos
+                    break
+                return whole
+
+            if data_start >= end:
+                break
+
+            data_end = os.lseek(fd, data_start, os.SEEK_HOLE)
+            extents.append((data_start, min(data_end, end)))
+            pos = data_end
+
+        return extents
+    finally:
+        os.lseek(fd, orig_pos, os.SEEK_SET)
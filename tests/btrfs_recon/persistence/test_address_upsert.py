@@ -0,0 +1,21 @@
+import pytest
+import sqlalchemy.dialects.postgresql as pg
+
+try:
+    from btrfs_recon.persistence.serializers.base import _upsert_addresses
+except Exception as e:  # pragma: no cover
+    pytestmark = pytest.mark.skip(reason=f'persistence layer cannot be imported: {e!r}')
+
+
+def compile_upsert(rows: list[dict]) -> str:
+    return str(_upsert_addresses(rows).compile(dialect=pg.dialect()))
+
+
+def test_upsert_without_bytenr_keeps_stored_bytenr():
+    sql = compile_upsert([{'device_id': 1, 'phys': 0x1_0000, 'phys_size': 17, 'bytenr': None}])
+    assert 'bytenr = coalesce(excluded.bytenr, address.bytenr)' in sql
+
+
+def test_upsert_conflicts_on_location():
+    sql = compile_upsert([{'device_id': 1, 'phys': 0x1_0000, 'phys_size': 17, 'bytenr': 0x1d_4000}])
+    assert 'ON CONFLICT (device_id, phys, phys_size) DO UPDATE' in sql
@@ -0,0 +1,64 @@
+import enum
+import struct
+
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon import structure
+from btrfs_recon.structure.file_extent_item import CompressionType, ExtentDataType
+
+try:
+    from btrfs_recon.persistence import models
+    from btrfs_recon.persistence.serializers import get_row_serializer
+except Exception as e:  # pragma: no cover
+    pytestmark = pytest.mark.skip(reason=f'persistence layer cannot be imported: {e!r}')
+
+
+def _normalize(value):
+    # Enum columns are loaded by their names
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _key_bytes(objectid: int, ty: int, offset: int) -> bytes:
+    return struct.pack('<QBQ', objectid, ty, offset)
+
+
+def _file_extent_bytes(ty: ExtentDataType, payload: bytes) -> bytes:
+    return struct.pack('<QQBBHB', 42, len(payload) if ty == ExtentDataType.INLINE else 4096,
+                       CompressionType.NONE, 0, 0, ty) + payload
+
+
+STRUCTS = {
+    'key': ('Key', structure.Key, _key_bytes(256, structure.KeyType.InodeItem, 0)),
+    'file-extent-inline': (
+        'FileExtentItem', structure.FileExtentItem,
+        _file_extent_bytes(ExtentDataType.INLINE, b'hello'),
+    ),
+    'file-extent-regular': (
+        'FileExtentItem', structure.FileExtentItem,
+        _file_extent_bytes(ExtentDataType.REGULAR, struct.pack('<QQQQ', 1 << 20, 4096, 0, 4096)),
+    ),
+}
+
+
+@pytest.mark.parametrize(
+    'model_name,struct_cls,raw', STRUCTS.values(), ids=list(STRUCTS),
+)
+class TestRowSerializerMatchesSchema:
+    model = lambda_fixture(lambda model_name: getattr(models, model_name))
+    parsed = lambda_fixture(lambda struct_cls, raw: struct_cls.parse(raw))
+    expected = lambda_fixture(lambda parsed: parsed.to_model(context={'device': 1}))
+    actual = lambda_fixture(lambda model, parsed: get_row_serializer(model)(parsed))
+
+    def test_columns(self, expected, actual):
+        _, struct_values = actual
+        expected_values = {name: _normalize(getattr(expected, name)) for name in struct_values}
+        actual_values = {name: _normalize(value) for name, value in struct_values.items()}
+        assert expected_values == actual_values
+
+    def test_address(self, expected, actual):
+        address_values, _ = actual
+        expected_values = {name: getattr(expected.address, name) for name in address_values}
+        assert expected_values == address_values
@@ -0,0 +1,149 @@
+"""Raw bytes of sample structs, packed by hand"""
+import struct
+import uuid
+
+from btrfs_recon.structure import (
+    ChunkItem,
+    DirItem,
+    FileExtentItem,
+    Header,
+    InodeItem,
+    InodeRef,
+    Key,
+    KeyPtr,
+    KeyType,
+    RootItem,
+    Stripe,
+    TreeNode,
+)
+from btrfs_recon.structure.file_extent_item import ExtentDataType
+
+__all__ = [
+    'SAMPLES',
+    'NODESIZE',
+    'pack_key',
+    'pack_header',
+    'pack_leaf',
+    'pack_internal',
+]
+
+NODESIZE = 0x4000
+
+FSID = uuid.UUID('bba692f7-5be7-4173-bc27-bb3e21644739')
+CHUNK_TREE_UUID = uuid.UUID('0b8e3a4e-0b7f-4a5e-9d3c-2c1f5e6a7b8c')
+TIMESPEC = struct.pack('<QI', 1_650_000_000, 123_456_000)
+
+
+def pack_key(objectid: int, ty: int, offset: int) -> bytes:
+    return struct.pack('<QBQ', objectid, ty, offset)
+
+
+def pack_header(nritems: int, level: int, bytenr: int = 0x1d_4000) -> bytes:
+    return struct.pack(
+        '<32s16sQQ16sQQIB',
+        b'\x5a' * 4, FSID.bytes, bytenr, 1, CHUNK_TREE_UUID.bytes, 2907003, 5, nritems, level,
+    )
+
+
+def pack_inode_item(size: int = 4096) -> bytes:
+    return (
+        struct.pack('<QQQQQIIIIQQQ', 7, 2907003, size, size, 0, 1, 1000, 1000, 0o100644, 0, 0b11, 12)
+        + struct.pack('<4Q', 0, 0, 0, 0)
+        + TIMESPEC * 4
+    )
+
+
+def pack_inode_ref(name: bytes) -> bytes:
+    return struct.pack('<QH', 3, len(name)) + name
+
+
+def pack_dir_item(name: bytes) -> bytes:
+    return pack_key(257, KeyType.InodeItem, 0) + struct.pack('<QHHB', 2907003, 0, len(name), 1) + name
+
+
+def pack_file_extent_inline(payload: bytes) -> bytes:
+    return struct.pack('<QQBBHB', 2907003, len(payload), 0, 0, 0, ExtentDataType.INLINE) + payload
+
+
+def pack_file_extent_regular() -> bytes:
+    return (
+        struct.pack('<QQBBHB', 2907003, 8192, 0, 0, 0, ExtentDataType.REGULAR)
+        + struct.pack('<QQQQ', 0x3_0000_0000, 8192, 0, 8192)
+    )
+
+
+def pack_stripe(devid: int) -> bytes:
+    return struct.pack('<QQ16s', devid, 0x10_0000 * devid, uuid.UUID(int=devid).bytes)
+
+
+def pack_chunk_item(num_stripes: int = 2) -> bytes:
+    return (
+        struct.pack('<QQQQIIIHH', 1 << 30, 2, 0x10000, 0b1001, 4096, 4096, 4096, num_stripes, 0)
+        + b''.join(pack_stripe(devid) for devid in range(1, num_stripes + 1))
+    )
+
+
+def pack_root_item() -> bytes:
+    return (
+        pack_inode_item()
+        + struct.pack('<QQQQQQQI', 2907003, 256, 0x1d_8000, 0, 16384, 0, 0, 1)
+        + pack_key(0, 0, 0)
+        + struct.pack('<BBQ', 0, 0, 2907003)
+        + uuid.UUID(int=1).bytes + uuid.UUID(int=0).bytes + uuid.UUID(int=0).bytes
+        + struct.pack('<QQQQ', 2907003, 10, 0, 0)
+        + TIMESPEC * 4
+        + struct.pack('<8Q', *[0] * 8)
+    )
+
+
+def pack_leaf(items: list[tuple[bytes, bytes]], nodesize: int = NODESIZE) -> bytes:
+    """Pack a leaf node from (packed key, item data), placing item data at the end of the node"""
+    header = pack_header(len(items), level=0)
+    item_headers = b''
+    data_end = nodesize - len(header)
+    data = b''
+    for key, item_data in items:
+        data_end -= len(item_data)
+        item_headers += key + struct.pack('<II', data_end, len(item_data))
+        data = item_data + data
+
+    free_space = nodesize - len(header) - len(item_headers) - len(data)
+    return header + item_headers + b'\0' * free_space + data
+
+
+def pack_internal(key_ptrs: list[tuple[bytes, int]], nodesize: int = NODESIZE) -> bytes:
+    """Pack an internal node from (packed key, blockptr)"""
+    header = pack_header(len(key_ptrs), level=1)
+    body = b''.join(key + struct.pack('<QQ', blockptr, 2907003) for key, blockptr in key_ptrs)
+    return (header + body).ljust(nodesize, b'\0')
+
+
+#: Sample struct classes, and the bytes to parse them from
+SAMPLES = {
+    'header': (Header, pack_header(3, level=0)),
+    'key': (Key, pack_key(256, KeyType.InodeItem, 0)),
+    'key-ptr': (KeyPtr, pack_key(256, KeyType.InodeItem, 0) + struct.pack('<QQ', 0x1d_8000, 2907003)),
+    'stripe': (Stripe, pack_stripe(1)),
+    'chunk-item': (ChunkItem, pack_chunk_item()),
+    'inode-item': (InodeItem, pack_inode_item()),
+    'inode-ref': (InodeRef, pack_inode_ref(b'hello.txt')),
+    'dir-item': (DirItem, pack_dir_item(b'hello.txt')),
+    'file-extent-inline': (FileExtentItem, pack_file_extent_inline(b'hello, world\n')),
+    'file-extent-regular': (FileExtentItem, pack_file_extent_regular()),
+    'root-item': (RootItem, pack_root_item()),
+    # NOTE: items are sorted by key, as in any real leaf
+    'leaf': (TreeNode, pack_leaf([
+        (pack_key(5, KeyType.RootItem, 0), pack_root_item()),
+        (pack_key(256, KeyType.InodeItem, 0), pack_inode_item()),
+        (pack_key(256, KeyType.InodeRef, 256), pack_inode_ref(b'..')),
+        (pack_key(256, KeyType.DirItem, 0x1234), pack_dir_item(b'hello.txt')),
+        (pack_key(256, KeyType.ChunkItem, 1 << 30), pack_chunk_item()),
+        (pack_key(257, KeyType.ExtentData, 0), pack_file_extent_inline(b'hello, world\n')),
+        (pack_key(258, KeyType.ExtentData, 0), pack_file_extent_regular()),
+        (pack_key(259, KeyType.ExtentCsum, 0), b'\0' * 16),
+    ])),
+    'internal': (TreeNode, pack_internal([
+        (pack_key(256, KeyType.InodeItem, 0), 0x1d_8000),
+        (pack_key(300, KeyType.InodeItem, 0), 0x1d_c000),
+    ])),
+}
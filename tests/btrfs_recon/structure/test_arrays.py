@@ -0,0 +1,88 @@
+import io
+
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.scanner import read_node_items
+from btrfs_recon.structure import TreeNode, concat_node_items, key_ptrs, leaf_items, node_items
+
+from .samples import NODESIZE, SAMPLES
+
+BASE = 0x1d_4000
+
+leaf = lambda_fixture(lambda: SAMPLES['leaf'][1])
+internal = lambda_fixture(lambda: SAMPLES['internal'][1])
+
+
+def keys_of(node: TreeNode) -> list[tuple[int, int, int]]:
+    return [(item.key.objectid, item.key.ty, item.key.offset) for item in node.items]
+
+
+def test_leaf_items(leaf):
+    node = parse_bytes_at(leaf, BASE, BASE, TreeNode)
+    items = leaf_items(leaf)
+
+    expected = (keys_of(node), [item.offset for item in node.items], [item.size for item in node.items])
+    actual = (
+        list(zip(items['objectid'].tolist(), items['type'].tolist(), items['offset'].tolist())),
+        items['data_offset'].tolist(),
+        items['data_size'].tolist(),
+    )
+    assert expected == actual
+
+
+def test_key_ptrs(internal):
+    node = parse_bytes_at(internal, BASE, BASE, TreeNode)
+    ptrs = key_ptrs(internal)
+
+    expected = (keys_of(node), [ptr.blockptr for ptr in node.items], [ptr.generation for ptr in node.items])
+    actual = (
+        list(zip(ptrs['objectid'].tolist(), ptrs['type'].tolist(), ptrs['offset'].tolist())),
+        ptrs['blockptr'].tolist(),
+        ptrs['generation'].tolist(),
+    )
+    assert expected == actual
+
+
+def test_node_items_at_offset(leaf, internal):
+    data = b'\xff' * 0x100 + leaf + internal
+    assert node_items(data, 0x100).tolist() == leaf_items(leaf).tolist()
+    assert node_items(data, 0x100 + NODESIZE).tolist() == key_ptrs(internal).tolist()
+
+
+def test_items_are_views(leaf):
+    buffer = bytearray(leaf)
+    items = leaf_items(buffer)
+    buffer[0x65:0x6d] = (1234).to_bytes(8, 'little')
+    assert items[0]['objectid'] == 1234
+
+
+@pytest.mark.parametrize('func,sample', [
+    pytest.param(leaf_items, 'internal', id='leaf-items-of-internal'),
+    pytest.param(key_ptrs, 'leaf', id='key-ptrs-of-leaf'),
+])
+def test_wrong_level_raises(func, sample):
+    with pytest.raises(ValueError):
+        func(SAMPLES[sample][1])
+
+
+def test_truncated_raises(leaf):
+    with pytest.raises(ValueError):
+        leaf_items(leaf[:0x100])
+
+
+def test_concat_node_items(leaf, internal):
+    items = concat_node_items([(0x1000, leaf), (0x2000, internal), (0x3000, leaf)])
+
+    num_items = len(leaf_items(leaf))
+    assert items['loc'].tolist() == [0x1000] * num_items + [0x3000] * num_items
+    assert items['objectid'].tolist() == leaf_items(leaf)['objectid'].tolist() * 2
+
+
+def test_read_node_items(leaf, internal):
+    fp = io.BytesIO(internal + leaf)
+    ptrs = read_node_items(fp, [0, NODESIZE], NODESIZE, leaves=False)
+
+    assert ptrs['loc'].tolist() == [0] * len(key_ptrs(internal))
+    assert ptrs['blockptr'].tolist() == key_ptrs(internal)['blockptr'].tolist()
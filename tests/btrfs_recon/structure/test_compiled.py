@@ -0,0 +1,64 @@
+import io
+
+import construct as cs
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.parsing import parse_at, parse_bytes_at
+from btrfs_recon.structure import CompileError, LeafItem, Superblock, TreeNode, compile_parser
+
+from .samples import NODESIZE, SAMPLES
+from .test_superblock import RAW_SUPERBLOCK_PATH
+
+BASE = 0x1d_4000
+
+
+@pytest.mark.parametrize('struct_cls,data', SAMPLES.values(), ids=list(SAMPLES))
+class TestCompiledParserMatchesConstruct:
+    expected = lambda_fixture(lambda struct_cls, data: parse_bytes_at(data, BASE, BASE, struct_cls))
+    actual = lambda_fixture(lambda struct_cls, data: compile_parser(struct_cls).parse(data, BASE, BASE))
+
+    def test_equal(self, expected, actual):
+        assert expected == actual
+
+    def test_same_repr(self, expected, actual):
+        # Catches differences in the types of values, e.g. HexDisplayedBytes vs bytes
+        assert repr(expected) == repr(actual)
+
+    def test_same_phys(self, expected, actual):
+        expected_phys = (expected.phys_start, expected.phys_end, expected.phys_size)
+        actual_phys = (actual.phys_start, actual.phys_end, actual.phys_size)
+        assert expected_phys == actual_phys
+
+
+def test_truncated_raises_stream_error():
+    _, data = SAMPLES['leaf']
+    with pytest.raises(cs.StreamError):
+        compile_parser(TreeNode).parse(data[:NODESIZE // 2], BASE, BASE)
+
+
+def test_parent_referencing_struct_cannot_be_parsed_alone():
+    with pytest.raises(ValueError):
+        compile_parser(LeafItem).parse(b'\0' * 25)
+
+
+def test_uncompilable_struct_raises():
+    with pytest.raises(CompileError):
+        compile_parser(Superblock)
+
+
+def test_parse_at_falls_back_to_construct():
+    raw = RAW_SUPERBLOCK_PATH.read_bytes()
+    expected = parse_at(io.BytesIO(raw), 0, Superblock)
+    actual = parse_at(io.BytesIO(raw), 0, Superblock, compiled=True)
+    assert expected == actual
+
+
+def test_parse_at_reads_variable_size_structs():
+    _, data = SAMPLES['leaf']
+    fp = io.BytesIO(b'\xff' * BASE + data)
+
+    expected = parse_at(fp, BASE, TreeNode)
+    actual = parse_at(fp, BASE, TreeNode, compiled=True, size=NODESIZE)
+    assert expected == actual
+    assert fp.tell() == 0
@@ -0,0 +1,50 @@
+import pytest
+from pytest_lambda import lambda_fixture, static_fixture
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.structure import KeyType, LazyTreeNode, TreeNode
+
+from .samples import SAMPLES
+
+BASE = 0x1d_4000
+
+
+class TestLazyTreeNode:
+    data = lambda_fixture(lambda sample: SAMPLES[sample][1])
+    eager = lambda_fixture(lambda data: parse_bytes_at(data, BASE, BASE, TreeNode))
+    lazy = lambda_fixture(lambda data: LazyTreeNode(data, BASE, BASE))
+
+    @pytest.mark.parametrize('sample', ['leaf', 'internal'])
+    def test_matches_eager_parse(self, eager, lazy):
+        assert eager == lazy.to_tree_node()
+
+    @pytest.mark.parametrize('sample', ['leaf', 'internal'])
+    def test_keys(self, eager, lazy):
+        expected = [(item.key.objectid, item.key.ty, item.key.offset) for item in eager.items]
+        actual = lazy.keys()
+        assert expected == actual
+
+    class TestLeaf:
+        sample = static_fixture('leaf')
+
+        def test_decodes_nothing_up_front(self, lazy):
+            assert not lazy._items
+
+        def test_item_data(self, eager, lazy):
+            expected = [item.data for item in eager.items]
+            actual = [lazy.item_data(index) for index in range(len(lazy))]
+            assert expected == actual
+            assert not lazy._items
+
+        def test_negative_index(self, eager, lazy):
+            assert eager.items[-1] == lazy[-1]
+
+        def test_key_range(self, lazy):
+            expected = [index for index, key in enumerate(lazy.keys()) if key[0] == 256]
+            actual = list(lazy.key_range((256, 0, 0), (256, 0xff, 0xffff_ffff_ffff_ffff)))
+            assert expected == actual
+
+        def test_indices_of(self, lazy):
+            expected = [5, 6]
+            actual = lazy.indices_of(KeyType.ExtentData).tolist()
+            assert expected == actual
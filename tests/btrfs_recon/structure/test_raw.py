@@ -0,0 +1,50 @@
+import pytest
+from construct_typed import DataclassMixin
+from pytest_lambda import lambda_fixture, static_fixture
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.structure import InodeItem, KeyType, compile_parser
+from btrfs_recon.structure.fields import HexAndDecDisplayedInteger
+
+from .samples import SAMPLES
+
+BASE = 0x1d_4000
+
+
+@pytest.mark.parametrize('struct_cls,data', SAMPLES.values(), ids=list(SAMPLES))
+class TestRawParse:
+    expected = lambda_fixture(lambda struct_cls, data: parse_bytes_at(data, BASE, BASE, struct_cls))
+    raw = lambda_fixture(lambda struct_cls, data: parse_bytes_at(data, BASE, BASE, struct_cls, raw=True))
+    raw_compiled = lambda_fixture(lambda struct_cls, data: compile_parser(struct_cls, raw=True).parse(data, BASE, BASE))
+
+    def test_compiled_matches_construct(self, raw, raw_compiled):
+        assert repr(raw) == repr(raw_compiled)
+
+    def test_cooked_matches_regular(self, expected, raw):
+        assert repr(expected) == repr(raw.cooked())
+
+    def test_str_matches_regular(self, expected, raw):
+        assert DataclassMixin.__str__(expected) == str(raw)
+
+
+class TestRawInodeItem:
+    compiled = static_fixture(False)
+    item = lambda_fixture(
+        lambda compiled: parse_bytes_at(SAMPLES['inode-item'][1], BASE, BASE, InodeItem, raw=True, compiled=compiled))
+
+    @pytest.mark.parametrize('compiled', [False, True], ids=['construct', 'compiled'])
+    def test_plain_values(self, item):
+        assert type(item.phys_start) is int
+        assert type(item.flags) is int
+        assert item.atime == (1_650_000_000, 123_456_000)
+
+    def test_cooked_does_not_modify(self, item):
+        cooked = item.cooked()
+        assert isinstance(cooked.phys_start, HexAndDecDisplayedInteger)
+        assert type(item.phys_start) is int
+
+
+def test_raw_enum_compares_to_member():
+    key = parse_bytes_at(SAMPLES['key'][1], BASE, BASE, SAMPLES['key'][0], raw=True, compiled=True)
+    assert key.ty == KeyType.InodeItem
+    assert type(key.ty) is int
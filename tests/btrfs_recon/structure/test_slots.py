@@ -0,0 +1,53 @@
+import copy
+import dataclasses
+import pickle
+
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.structure import Key, Struct
+
+from .samples import SAMPLES
+
+BASE = 0x1d_4000
+
+
+def iter_structs(obj):
+    if isinstance(obj, Struct):
+        yield obj
+        for f in dataclasses.fields(obj):
+            yield from iter_structs(getattr(obj, f.name))
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from iter_structs(item)
+
+
+@pytest.mark.parametrize('struct_cls,data', SAMPLES.values(), ids=list(SAMPLES))
+class TestSlottedStructs:
+    parsed = lambda_fixture(lambda struct_cls, data: parse_bytes_at(data, BASE, BASE, struct_cls))
+
+    def test_no_instance_dict(self, parsed):
+        for struct in iter_structs(parsed):
+            assert not hasattr(struct, '__dict__'), type(struct).__name__
+
+    def test_copy(self, parsed):
+        assert copy.copy(parsed) == parsed
+        assert copy.deepcopy(parsed) == parsed
+
+
+def test_pickle_raw():
+    data = SAMPLES['leaf'][1]
+    parsed = parse_bytes_at(data, BASE, BASE, SAMPLES['leaf'][0], raw=True)
+    assert pickle.loads(pickle.dumps(parsed)) == parsed
+
+
+def test_item_access():
+    key = parse_bytes_at(SAMPLES['key'][1], BASE, BASE, Key)
+    key['offset'] = 1234
+    assert key['offset'] == key.offset == 1234
+
+
+def test_build_roundtrip():
+    struct_cls, data = SAMPLES['chunk-item']
+    assert struct_cls.build(parse_bytes_at(data, BASE, BASE, struct_cls)) == data
@@ -0,0 +1,86 @@
+import gc
+import mmap
+
+import pytest
+from pytest_lambda import lambda_fixture, static_fixture
+
+from btrfs_recon.parsing import map_device, parse_bytes_at
+from btrfs_recon.structure import FileExtentItem, Header, Superblock
+
+from .samples import SAMPLES
+from .test_superblock import RAW_SUPERBLOCK_PATH, SUPERBLOCK_VALUES
+
+BASE = 0x1d_4000
+
+
+@pytest.mark.parametrize('compiled', [
+    pytest.param(False, id='construct'),
+    pytest.param(True, id='compiled'),
+])
+@pytest.mark.parametrize('struct_cls,data', SAMPLES.values(), ids=list(SAMPLES))
+class TestParseFromMemoryview:
+    expected = lambda_fixture(
+        lambda struct_cls, data, compiled: parse_bytes_at(data, BASE, BASE, struct_cls, compiled=compiled))
+    actual = lambda_fixture(
+        lambda struct_cls, data, compiled: parse_bytes_at(memoryview(bytearray(data)), BASE, BASE, struct_cls, compiled=compiled))
+
+    def test_equal(self, expected, actual):
+        assert expected == actual
+
+    def test_materialized_same_repr(self, expected, actual):
+        assert repr(actual.materialize()) == repr(expected)
+
+
+class TestByteFieldsAreViews:
+    compiled = static_fixture(True)
+
+    buffer = lambda_fixture(lambda: bytearray(SAMPLES['file-extent-inline'][1]))
+    item = lambda_fixture(
+        lambda buffer, compiled: parse_bytes_at(memoryview(buffer), 0, 0, FileExtentItem, compiled=compiled))
+
+    @pytest.mark.parametrize('compiled', [False, True], ids=['construct', 'compiled'])
+    def test_data_is_view_of_buffer(self, buffer, item):
+        assert isinstance(item.data, memoryview)
+
+        buffer[-1:] = b'!'
+        assert bytes(item.data) == b'hello, world!'
+
+    def test_materialize_copies(self, buffer, item):
+        item.materialize()
+        buffer[-1:] = b'!'
+        assert item.data == b'hello, world\n'
+
+    def test_header_csum_is_view(self):
+        data = memoryview(SAMPLES['header'][1])
+        header = parse_bytes_at(data, BASE, BASE, Header, compiled=True)
+        assert isinstance(header.csum, memoryview)
+        assert header.csum.obj is data.obj
+
+
+class TestSuperblockFromMap:
+    superblock_file = lambda_fixture(lambda: RAW_SUPERBLOCK_PATH.open('rb'))
+    view = lambda_fixture(lambda superblock_file: map_device(superblock_file))
+    superblock = lambda_fixture(lambda view: parse_bytes_at(view, 0, 0, Superblock))
+
+    def test_values(self, superblock):
+        for name, value in SUPERBLOCK_VALUES.items():
+            assert getattr(superblock, name) == value
+
+    def test_unparsed_data_is_view(self, superblock):
+        assert isinstance(superblock._unparsed_data, memoryview)
+
+    def test_materialize_releases_map(self, view, superblock):
+        superblock.materialize()
+        assert isinstance(superblock._unparsed_data, bytes)
+
+        # Construct's parsing contexts are reference cycles, holding views until collected
+        gc.collect()
+
+        mapping = view.obj
+        view.release()
+        mapping.close()
+        assert mapping.closed
+
+    def test_map_is_read_only(self, view):
+        assert isinstance(view.obj, mmap.mmap)
+        assert view.readonly
@@ -0,0 +1,85 @@
+import struct
+from pathlib import Path
+
+import pytest
+from crc32c import crc32c
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.parsing import parse_fs
+from btrfs_recon.structure import KeyType
+from btrfs_recon.util.logical_reader import LogicalReader
+
+from .structure.samples import pack_chunk_item, pack_key, pack_leaf
+
+RAW_SUPERBLOCK_PATH = Path(__file__).parent / 'structure' / 'superblock.bin'
+SUPERBLOCK_POS = 0x1_0000
+
+#: Logical start of the sample superblock's system chunk, and the device it's on
+SYS_CHUNK_LOGICAL = 4585107226624
+SYS_CHUNK_DEVID = 2
+SYS_CHUNK_PHYSICAL = 0x20_0000
+
+#: Logical start of the chunk described by the chunk tree's only leaf
+CHUNK_LOGICAL = 0x1_0000_0000
+
+
+def pack_superblock(node_size: int, csum_type: int = 0) -> bytes:
+    raw = bytearray(RAW_SUPERBLOCK_PATH.read_bytes())
+    struct.pack_into('<Q', raw, 0x58, SYS_CHUNK_LOGICAL)  # chunk_root
+    struct.pack_into('<I', raw, 0x94, node_size)
+    struct.pack_into('<H', raw, 0xc4, csum_type)
+    struct.pack_into('<Q', raw, 0x374, SYS_CHUNK_PHYSICAL)  # the system chunk's stripe offset
+    return bytes(raw)
+
+
+def pack_chunk_leaf(nodesize: int) -> bytes:
+    leaf = pack_leaf([(pack_key(256, KeyType.ChunkItem, CHUNK_LOGICAL), pack_chunk_item())], nodesize)
+    return struct.pack('<I', crc32c(leaf[32:])) + leaf[4:]
+
+
+node_size = lambda_fixture(lambda nodesize: nodesize)
+csum_type = lambda_fixture(lambda: 0)
+
+
+@pytest.fixture
+def image(tmp_path, node_size, nodesize, csum_type):
+    path = tmp_path / 'dev.img'
+    with path.open('wb') as fp:
+        fp.seek(SUPERBLOCK_POS)
+        fp.write(pack_superblock(node_size, csum_type))
+        fp.seek(SYS_CHUNK_PHYSICAL)
+        fp.write(pack_chunk_leaf(nodesize))
+
+    with path.open('rb') as fp:
+        yield fp
+
+
+@pytest.mark.parametrize('nodesize', [
+    pytest.param(0x4000, id='16k'),
+    pytest.param(0x1_0000, id='64k'),
+])
+def test_parse_fs_uses_superblock_nodesize(image):
+    _, tree = parse_fs(image)
+    assert tree.offset(CHUNK_LOGICAL) == (1, 0x10_0000)
+
+
+class TestUnsupportedNodeSize:
+    node_size = lambda_fixture(lambda: 0x3c65_8000)
+
+    @pytest.mark.parametrize('nodesize', [pytest.param(0x4000, id='16k')])
+    def test_defaults_to_16k(self, image):
+        _, tree = parse_fs(image)
+        assert tree.offset(CHUNK_LOGICAL) == (1, 0x10_0000)
+
+
+class TestUnverifiableChecksum:
+    csum_type = lambda_fixture(lambda: 2)  # sha256
+
+    @pytest.mark.parametrize('nodesize', [pytest.param(0x4000, id='16k')])
+    def test_reads_without_verifying(self, image, monkeypatch):
+        def read_verified(*args, **kwargs):
+            raise AssertionError('only crc32c checksums may be verified')
+
+        monkeypatch.setattr(LogicalReader, 'read_verified', read_verified)
+        _, tree = parse_fs(image)
+        assert tree.offset(CHUNK_LOGICAL) == (1, 0x10_0000)
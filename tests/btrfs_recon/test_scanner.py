@@ -0,0 +1,186 @@
+import io
+import struct
+from uuid import UUID
+
+import pytest
+from crc32c import crc32c
+from pytest_lambda import lambda_fixture, static_fixture
+
+from btrfs_recon.parsing import parse_bytes_at
+from btrfs_recon.scanner import (
+    HeaderScanner,
+    KnownLocations,
+    node_checksum_valid,
+    nodesize_or_default,
+    read_nodes,
+)
+from btrfs_recon.structure import Header
+
+FSID = UUID('bba692f7-5be7-4173-bc27-bb3e21644739')
+OTHER_FSID = UUID('00000000-0000-0000-0000-000000000001')
+ALIGNMENT = 0x1000
+IMAGE_SIZE = 0x100000
+
+
+def raw_header(*, fsid: UUID = FSID, bytenr: int = 0, nritems: int = 1, level: int = 0) -> bytes:
+    return struct.pack(
+        '<32s16sQQ16sQQIB',
+        b'\x00' * 32,
+        fsid.bytes,
+        bytenr,
+        0,
+        b'\x00' * 16,
+        1,
+        5,
+        nritems,
+        level,
+    )
+
+
+valid_locs = static_fixture([0x0, 0x3000, 0x41000, IMAGE_SIZE - ALIGNMENT])
+
+
+@pytest.fixture
+def image(valid_locs) -> io.BytesIO:
+    buf = bytearray(IMAGE_SIZE)
+
+    for loc in valid_locs:
+        buf[loc:loc + 101] = raw_header(bytenr=loc)
+
+    # Decoys which must be rejected
+    buf[0x5000:0x5000 + 101] = raw_header(fsid=OTHER_FSID)
+    buf[0x6000:0x6000 + 101] = raw_header(level=200)
+    buf[0x7000:0x7000 + 101] = raw_header(nritems=0xFFFFFF)
+    # Not aligned
+    buf[0x8010:0x8010 + 101] = raw_header()
+    # Straddling a window boundary, but not aligned
+    buf[0x1FFF0:0x1FFF0 + 101] = raw_header()
+
+    return io.BytesIO(bytes(buf))
+
+
+method = lambda_fixture(params=['stride', 'search'])
+scanner = lambda_fixture(lambda image, method: HeaderScanner(
+    image, alignment=ALIGNMENT, fsid=FSID, window_size=0x10000, method=method,
+))
+
+
+def test_scan_finds_only_valid_headers(scanner, valid_locs):
+    found = [
+        (loc, header.bytenr)
+        for batch in scanner.scan(0, IMAGE_SIZE)
+        for loc, header in batch.nodes
+    ]
+    expected = [(loc, loc) for loc in valid_locs]
+    assert expected == found
+
+
+def test_scan_reversed(scanner, valid_locs):
+    found = [
+        loc
+        for batch in scanner.scan(0, IMAGE_SIZE, reversed=True)
+        for loc, header in batch.nodes
+    ]
+    expected = sorted(valid_locs, reverse=True)
+    assert expected == found
+
+
+def test_scan_covers_every_location_once(scanner):
+    batches = list(scanner.scan(0, IMAGE_SIZE))
+    assert sum(batch.num_locs for batch in batches) == IMAGE_SIZE // ALIGNMENT
+
+
+def test_scan_range(scanner):
+    found = [
+        loc
+        for batch in scanner.scan(0x3000, 0x41000)
+        for loc, header in batch.nodes
+    ]
+    expected = [0x3000, 0x41000]
+    assert expected == found
+
+
+def test_search_requires_fsid(image):
+    with pytest.raises(ValueError):
+        HeaderScanner(image, alignment=ALIGNMENT, fsid=None, method='search')
+
+
+def test_scan_ranges(scanner):
+    found = [
+        loc
+        for batch in scanner.scan_ranges([(0x40001, 0x50000), (0x2000, 0x4000)])
+        for loc, header in batch.nodes
+    ]
+    expected = [0x3000, 0x41000]
+    assert expected == found
+
+
+def test_scan_skips_known_locations(image, method, valid_locs):
+    known = KnownLocations([0x3000, IMAGE_SIZE - ALIGNMENT, 0x8010], ALIGNMENT)
+    scanner = HeaderScanner(
+        image, alignment=ALIGNMENT, fsid=FSID, window_size=0x10000, method=method, known=known,
+    )
+    batches = list(scanner.scan(0, IMAGE_SIZE))
+
+    found = [loc for batch in batches for loc, header in batch.nodes]
+    expected = [0x0, 0x41000]
+    assert expected == found
+    assert sum(batch.num_known for batch in batches) == 2
+
+
+def test_known_locations_restrict():
+    known = KnownLocations([0x0, 0x3000, 0x41000], ALIGNMENT)
+    restricted = known.restrict(0x1, 0x41000)
+    assert 0x3000 in restricted
+    assert 0x0 not in restricted
+    assert 0x41000 not in restricted
+
+
+def test_read_nodes(image, valid_locs):
+    locs = valid_locs[::-1]
+    nodes = read_nodes(image, locs, 0x1000)
+
+    for loc, data in zip(locs, nodes):
+        header = parse_bytes_at(data, loc, loc, Header)
+        assert header.bytenr == loc
+        assert header.phys_start == loc
+
+
+def test_scan_skips_holes(tmp_path, valid_locs):
+    path = tmp_path / 'sparse.img'
+    with path.open('wb') as fp:
+        for loc in valid_locs:
+            fp.seek(loc)
+            fp.write(raw_header(bytenr=loc))
+        fp.truncate(IMAGE_SIZE)
+
+    with path.open('rb') as fp:
+        scanner = HeaderScanner(fp, alignment=ALIGNMENT, fsid=FSID, window_size=0x10000)
+        batches = list(scanner.scan_ranges([(0, IMAGE_SIZE)]))
+
+    found = [loc for batch in batches for loc, header in batch.nodes]
+    assert valid_locs == found
+    assert sum(batch.num_locs for batch in batches) == IMAGE_SIZE // ALIGNMENT
+
+    if not any(batch.num_skipped_bytes for batch in batches):
+        pytest.skip('Filesystem does not report holes with SEEK_DATA/SEEK_HOLE')
+
+
+def test_node_checksum_valid():
+    body = bytes(range(256)) * 16
+    node = struct.pack('<L', crc32c(body)) + bytes(28) + body
+    assert node_checksum_valid(node)
+    assert not node_checksum_valid(node[:-1] + b'\x00')
+
+
+@pytest.mark.parametrize('nodesize, expected', [
+    pytest.param(0x1000, 0x1000, id='4k'),
+    pytest.param(0x1_0000, 0x1_0000, id='64k'),
+    pytest.param(None, 0x4000, id='none'),
+    pytest.param(0x800, 0x4000, id='too-small'),
+    pytest.param(0x2_0000, 0x4000, id='too-large'),
+    pytest.param(0x3c65_8000, 0x4000, id='garbage'),
+    pytest.param(0x6000, 0x4000, id='not-power-of-two'),
+])
+def test_nodesize_or_default(nodesize, expected):
+    assert nodesize_or_default(nodesize) == expected
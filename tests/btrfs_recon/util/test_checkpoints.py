@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.util.checkpoints import Checkpointer
+
+
+@pytest.fixture
+def writes() -> list:
+    return []
+
+
+max_ms = lambda_fixture(lambda: None)
+
+
+@pytest.fixture
+def checkpointer(writes, max_ms) -> Checkpointer[str]:
+    async def write(scanned):
+        writes.append(scanned)
+
+    return Checkpointer(write, max_ms)
+
+
+def test_flush_writes_merged_ranges(checkpointer, writes):
+    async def scan():
+        await checkpointer.complete('dev1', (0x1000, 0x2000))
+        await checkpointer.complete('dev1', (0, 0x1000))
+        await checkpointer.complete('dev2', (0, 0x1000))
+        await checkpointer.complete('dev1', (0x3000, 0x4000))
+        assert writes == []
+        await checkpointer.flush()
+
+    asyncio.run(scan())
+    assert writes == [{'dev1': [(0, 0x2000), (0x3000, 0x4000)], 'dev2': [(0, 0x1000)]}]
+
+
+def test_flush_without_ranges_writes_nothing(checkpointer, writes):
+    asyncio.run(checkpointer.flush())
+    assert writes == []
+
+
+def test_failed_range_not_recorded(checkpointer, writes):
+    async def scan():
+        checkpointer.fail('dev1')
+        checkpointer.fail('dev1')
+        num_failures = await checkpointer.complete('dev1', (0, 0x1000))
+        await checkpointer.flush()
+        return num_failures
+
+    assert asyncio.run(scan()) == 2
+    assert writes == []
+
+
+def test_failures_only_hold_back_their_own_range(checkpointer, writes):
+    async def scan():
+        checkpointer.fail('dev1')
+        await checkpointer.complete('dev2', (0, 0x1000))
+        await checkpointer.complete('dev1', (0, 0x1000))
+        await checkpointer.complete('dev1', (0x1000, 0x2000))
+        await checkpointer.flush()
+
+    asyncio.run(scan())
+    assert writes == [{'dev2': [(0, 0x1000)], 'dev1': [(0x1000, 0x2000)]}]
+
+
+class TestTimeBudget:
+    max_ms = lambda_fixture(lambda: 20)
+
+    def test_writes_once_due(self, checkpointer, writes):
+        async def scan():
+            await checkpointer.complete('dev1', (0, 0x1000))
+            assert writes == []
+            await asyncio.sleep(0.03)
+            await checkpointer.complete('dev1', (0x1000, 0x2000))
+
+        asyncio.run(scan())
+        assert writes == [{'dev1': [(0, 0x2000)]}]
@@ -0,0 +1,283 @@
+import construct as cs
+import numpy as np
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.structure import BlockGroupFlag
+from btrfs_recon.util.chunk_cache import ChunkTreeCache
+
+STRIPE_LEN = 0x10000
+
+
+@pytest.fixture
+def cache() -> ChunkTreeCache:
+    cache = ChunkTreeCache()
+    # Single stripe
+    cache.insert(0x10_0000, 0x50_0000, STRIPE_LEN, [(1, 0x100_0000)])
+    # Two stripes (RAID0-style), inserted out of order
+    cache.insert(0x100_0000, 0x140_0000, STRIPE_LEN, {1: 0x200_0000, 2: 0x300_0000})
+    cache.insert(0x80_0000, 0x90_0000, STRIPE_LEN, [cs.Container(devid=3, offset=0x400_0000)])
+    return cache
+
+
+mapped_logicals = lambda_fixture(lambda: np.array([
+    0x10_0000, 0x10_1234, 0x4f_ffff,
+    0x80_0000, 0x8f_0000,
+    0x100_0000, 0x100_ffff, 0x101_0000, 0x102_0010, 0x13f_ffff,
+], dtype=np.uint64))
+
+
+@pytest.mark.parametrize('logical, expected', [
+    pytest.param(0x10_1234, (1, 0x100_1234), id='single-stripe'),
+    pytest.param(0x100_0010, (1, 0x200_0010), id='first-stripe'),
+    pytest.param(0x101_0010, (2, 0x300_0010), id='second-stripe'),
+    pytest.param(0x102_0010, (1, 0x201_0010), id='wrapped-stripe'),
+    pytest.param(0x80_0000, (3, 0x400_0000), id='from-container'),
+])
+def test_offset(cache, logical, expected):
+    assert expected == cache.offset(logical)
+
+
+def test_offsets_spanning_stripes(cache):
+    expected = [(1, 0x200_fff0, 0x10), (2, 0x300_0000, 0x10)]
+    actual = list(cache.offsets(0x100_fff0, 0x20))
+    assert expected == actual
+
+
+@pytest.mark.parametrize('logical', [
+    pytest.param(0, id='before-all'),
+    pytest.param(0x50_0000, id='just-past-chunk'),
+    pytest.param(0x60_0000, id='gap'),
+    pytest.param(0x140_0000, id='past-all'),
+])
+def test_unmapped_raises(cache, logical):
+    assert logical not in cache
+    with pytest.raises(KeyError):
+        cache.offset(logical)
+
+
+def test_translate_matches_offset(cache, mapped_logicals):
+    expected = [cache.offset(logical) for logical in mapped_logicals.tolist()]
+    devids, physical = cache.translate(mapped_logicals)
+    actual = list(zip(devids.tolist(), physical.tolist()))
+    assert expected == actual
+
+
+def test_translate_strict_raises(cache):
+    with pytest.raises(KeyError):
+        cache.translate([0x10_0000, 0x60_0000])
+
+
+def test_translate_unmapped(cache):
+    devids, physical = cache.translate([0, 0x10_0000, 0x60_0000, 0x200_0000], strict=False)
+    assert devids.tolist() == [-1, 1, -1, -1]
+    assert physical.tolist() == [0, 0x100_0000, 0, 0]
+
+
+def test_translate_empty_cache():
+    devids, _ = ChunkTreeCache().translate([0x1000], strict=False)
+    assert devids.tolist() == [-1]
+
+
+def test_insert_replaces(cache):
+    cache.insert(0x10_0000, 0x50_0000, STRIPE_LEN, [(4, 0x500_0000)])
+    assert len(cache) == 3
+    assert cache.offset(0x10_0000) == (4, 0x500_0000)
+
+
+def test_insert_after_lookup(cache):
+    cache.offset(0x10_0000)
+    cache.insert(0x200_0000, 0x210_0000, STRIPE_LEN, [(1, 0x600_0000)])
+    assert cache.translate([0x200_0001])[1].tolist() == [0x600_0001]
+
+
+def test_iter_sorted(cache):
+    assert [chunk.log_start for chunk in cache] == [0x10_0000, 0x80_0000, 0x100_0000]
+
+
+class TestReverse:
+    def test_roundtrip(self, cache, mapped_logicals):
+        devids, physical = cache.translate(mapped_logicals)
+
+        actual = np.full(len(mapped_logicals), -1, dtype=np.int64)
+        for devid in np.unique(devids).tolist():
+            on_device = devids == devid
+            actual[on_device] = cache.reverse(devid, physical[on_device])
+
+        assert actual.tolist() == mapped_logicals.tolist()
+
+    @pytest.mark.parametrize('devid, physical, expected', [
+        pytest.param(3, 0x400_1000, 0x80_1000, id='single-stripe'),
+        pytest.param(2, 0x300_0010, 0x101_0010, id='second-stripe'),
+        pytest.param(1, 0x201_0010, 0x102_0010, id='wrapped-stripe'),
+    ])
+    def test_reverse(self, cache, devid, physical, expected):
+        assert cache.reverse(devid, [physical]).tolist() == [expected]
+
+    def test_strict_raises(self, cache):
+        with pytest.raises(KeyError):
+            cache.reverse(1, [0x100_0000, 0x150_0000])
+
+    def test_unmapped(self, cache):
+        logicals = cache.reverse(1, [0xff_ffff, 0x100_0000, 0x140_0000, 0x220_0000], strict=False)
+        assert logicals.tolist() == [-1, 0x10_0000, -1, -1]
+
+    def test_unknown_device(self, cache):
+        assert cache.reverse(9, [0x100_0000], strict=False).tolist() == [-1]
+
+    def test_insert_after_lookup(self, cache):
+        cache.reverse(1, [0x100_0000])
+        cache.insert(0x200_0000, 0x210_0000, STRIPE_LEN, [(1, 0x600_0000)])
+        assert cache.reverse(1, [0x600_0001]).tolist() == [0x200_0001]
+
+
+class TestSaveLoad:
+    path = lambda_fixture(lambda tmp_path: tmp_path / 'chunk-map.npy')
+
+    @pytest.fixture
+    def loaded(self, cache, path) -> ChunkTreeCache:
+        cache.save(path)
+        return ChunkTreeCache.load(path)
+
+    def test_memory_mapped(self, loaded):
+        assert isinstance(loaded.to_table(), np.memmap)
+
+    def test_translate(self, cache, loaded, mapped_logicals):
+        expected = [array.tolist() for array in cache.translate(mapped_logicals)]
+        actual = [array.tolist() for array in loaded.translate(mapped_logicals)]
+        assert expected == actual
+
+    def test_reverse(self, cache, loaded):
+        physicals = [0x200_0000, 0x201_0010, 0x21f_ffff]
+        assert loaded.reverse(1, physicals).tolist() == cache.reverse(1, physicals).tolist()
+
+    def test_chunks(self, cache, loaded):
+        assert len(loaded) == len(cache)
+        assert list(loaded) == list(cache)
+        assert loaded.offset(0x102_0010) == cache.offset(0x102_0010)
+
+    def test_insert(self, loaded):
+        loaded.insert(0x200_0000, 0x210_0000, STRIPE_LEN, [(1, 0x600_0000)])
+        assert len(loaded) == 4
+        assert loaded.translate([0x10_0000, 0x200_0001])[1].tolist() == [0x100_0000, 0x600_0001]
+
+    def test_empty(self, path):
+        ChunkTreeCache().save(path)
+        assert len(ChunkTreeCache.load(path)) == 0
+
+    def test_wrong_dtype_raises(self):
+        with pytest.raises(ValueError):
+            ChunkTreeCache.from_table(np.zeros(3, dtype=np.uint64))
+
+
+RAID1_START = 0x1000_0000
+DUP_START = 0x2000_0000
+RAID10_START = 0x3000_0000
+RAID5_START = 0x4000_0000
+RAID6_START = 0x5000_0000
+PROFILE_CHUNK_LEN = 0x40_0000
+
+
+@pytest.fixture
+def profile_cache() -> ChunkTreeCache:
+    cache = ChunkTreeCache()
+    cache.insert(RAID1_START, RAID1_START + PROFILE_CHUNK_LEN, STRIPE_LEN,
+                 [(1, 0xa00_0000), (2, 0xb00_0000)],
+                 flags=BlockGroupFlag.METADATA | BlockGroupFlag.RAID1)
+    cache.insert(DUP_START, DUP_START + PROFILE_CHUNK_LEN, STRIPE_LEN,
+                 [(1, 0xc00_0000), (1, 0xd00_0000)],
+                 flags=BlockGroupFlag.SYSTEM | BlockGroupFlag.DUP)
+    cache.insert(RAID10_START, RAID10_START + PROFILE_CHUNK_LEN, STRIPE_LEN,
+                 [(1, 0x1000_0000), (2, 0x1000_0000), (3, 0x1000_0000), (4, 0x1000_0000)],
+                 flags=BlockGroupFlag.DATA | BlockGroupFlag.RAID10, sub_stripes=2)
+    cache.insert(RAID5_START, RAID5_START + PROFILE_CHUNK_LEN, STRIPE_LEN,
+                 [(1, 0x2000_0000), (2, 0x2000_0000), (3, 0x2000_0000)],
+                 flags=BlockGroupFlag.DATA | BlockGroupFlag.RAID5)
+    cache.insert(RAID6_START, RAID6_START + PROFILE_CHUNK_LEN, STRIPE_LEN,
+                 [(1, 0x3000_0000), (2, 0x3000_0000), (3, 0x3000_0000), (4, 0x3000_0000)],
+                 flags=BlockGroupFlag.DATA | BlockGroupFlag.RAID6)
+    return cache
+
+
+class TestProfiles:
+    @pytest.mark.parametrize('logical, mirror, expected', [
+        pytest.param(RAID1_START + 0x1_0010, 0, (1, 0xa01_0010), id='raid1-first-copy'),
+        pytest.param(RAID1_START + 0x1_0010, 1, (2, 0xb01_0010), id='raid1-second-copy'),
+        pytest.param(DUP_START + 0x2_0000, 1, (1, 0xd02_0000), id='dup-second-copy'),
+        pytest.param(RAID10_START + 0x1_0010, 0, (3, 0x1000_0010), id='raid10-second-set'),
+        pytest.param(RAID10_START + 0x1_0010, 1, (4, 0x1000_0010), id='raid10-second-set-mirror'),
+        pytest.param(RAID10_START + 0x2_0010, 1, (2, 0x1001_0010), id='raid10-second-row'),
+        pytest.param(RAID5_START + 0x1_0000, 0, (2, 0x2000_0000), id='raid5-first-row'),
+        pytest.param(RAID5_START + 0x2_0000, 0, (2, 0x2001_0000), id='raid5-rotated-row'),
+        pytest.param(RAID5_START + 0x3_0000, 1, (3, 0x2001_0000), id='raid5-single-copy'),
+        pytest.param(RAID6_START + 0x2_0000, 0, (2, 0x3001_0000), id='raid6-rotated-row'),
+    ])
+    def test_offset(self, profile_cache, logical, mirror, expected):
+        assert expected == profile_cache.offset(logical, mirror=mirror)
+
+    @pytest.mark.parametrize('logical, expected', [
+        pytest.param(RAID1_START, ((1, 0xa00_0000), (2, 0xb00_0000)), id='raid1'),
+        pytest.param(RAID10_START + 0x3_0000, ((3, 0x1001_0000), (4, 0x1001_0000)), id='raid10'),
+        pytest.param(RAID6_START, ((1, 0x3000_0000),), id='raid6'),
+    ])
+    def test_mirrors(self, profile_cache, logical, expected):
+        (copies, _), = profile_cache.mirrors(logical)
+        assert expected == copies
+
+    @pytest.mark.parametrize('mirror', [0, 1], ids=['first-copy', 'second-copy'])
+    def test_translate_matches_offset(self, profile_cache, mirror):
+        logicals = [chunk.log_start + offset for chunk in profile_cache for offset in range(0, 0x10_0000, 0x8010)]
+        expected = [profile_cache.offset(logical, mirror=mirror) for logical in logicals]
+
+        devids, physical = profile_cache.translate(logicals, mirror=mirror)
+        assert expected == list(zip(devids.tolist(), physical.tolist()))
+
+    @pytest.mark.parametrize('mirror', [0, 1], ids=['first-copy', 'second-copy'])
+    def test_reverse_roundtrip(self, profile_cache, mirror):
+        logicals = np.array(
+            [chunk.log_start + offset for chunk in profile_cache for offset in range(0, chunk.length, 0x8010)],
+            dtype=np.uint64,
+        )
+        devids, physical = profile_cache.translate(logicals, mirror=mirror)
+
+        actual = np.full(len(logicals), -1, dtype=np.int64)
+        for devid in np.unique(devids).tolist():
+            on_device = devids == devid
+            actual[on_device] = profile_cache.reverse(devid, physical[on_device])
+
+        assert actual.tolist() == logicals.tolist()
+
+    @pytest.mark.parametrize('devid, physical', [
+        pytest.param(3, 0x2000_0000, id='raid5-first-row'),
+        pytest.param(1, 0x2001_0000, id='raid5-rotated-row'),
+        pytest.param(4, 0x3000_0010, id='raid6-q'),
+    ])
+    def test_reverse_parity_unmapped(self, profile_cache, devid, physical):
+        assert profile_cache.reverse(devid, [physical], strict=False).tolist() == [-1]
+
+    def test_saved_layouts(self, profile_cache, tmp_path):
+        profile_cache.save(tmp_path / 'chunk-map.npy')
+        loaded = ChunkTreeCache.load(tmp_path / 'chunk-map.npy')
+        assert list(loaded) == list(profile_cache)
+        assert loaded.offset(RAID10_START + 0x2_0010, mirror=1) == (2, 0x1001_0010)
+
+    @pytest.mark.parametrize('logical, expected', [
+        pytest.param(RAID5_START + 0x1_0010, (
+            RAID5_START, ((1, 0x2000_0000), (2, 0x2000_0000)), ((3, 0x2000_0000),),
+        ), id='raid5-first-row'),
+        pytest.param(RAID5_START + 0x2_0000, (
+            RAID5_START + 0x2_0000, ((2, 0x2001_0000), (3, 0x2001_0000)), ((1, 0x2001_0000),),
+        ), id='raid5-rotated-row'),
+        pytest.param(RAID6_START + 0x2_0000, (
+            RAID6_START + 0x2_0000,
+            ((2, 0x3001_0000), (3, 0x3001_0000)),
+            ((4, 0x3001_0000), (1, 0x3001_0000)),
+        ), id='raid6-rotated-row'),
+    ])
+    def test_full_stripe(self, profile_cache, logical, expected):
+        row = profile_cache.full_stripe(logical)
+        assert expected == (row.logical, row.data, row.parity)
+
+    def test_full_stripe_without_parity_raises(self, profile_cache):
+        with pytest.raises(ValueError):
+            profile_cache.full_stripe(RAID1_START)
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.structure import BlockGroupFlag
+from btrfs_recon.util.chunk_cache import ChunkTreeCache
+from btrfs_recon.util.logical_reader import LogicalReader, NoValidCopyError
+from btrfs_recon.util.raid import p_parity, q_syndrome
+
+STRIPE_LEN = 0x1_0000
+LOG_START = 0x100_0000
+CHUNK_LEN = 4 * STRIPE_LEN
+PHYS_START = 0x1000
+
+
+@pytest.fixture
+def chunk_cache() -> ChunkTreeCache:
+    cache = ChunkTreeCache()
+    cache.insert(LOG_START, LOG_START + CHUNK_LEN, STRIPE_LEN, [(1, PHYS_START), (2, PHYS_START)],
+                 flags=BlockGroupFlag.METADATA | BlockGroupFlag.RAID1)
+    return cache
+
+
+copy_1 = lambda_fixture(lambda: bytes(range(256)) * (CHUNK_LEN // 256))
+copy_2 = lambda_fixture(lambda copy_1: copy_1)
+
+
+@pytest.fixture
+def reader(tmp_path, chunk_cache, copy_1, copy_2):
+    fps = {}
+    for devid, copy in ((1, copy_1), (2, copy_2)):
+        path = tmp_path / f'dev{devid}.img'
+        path.write_bytes(b'\0' * PHYS_START + copy)
+        fps[devid] = path.open('rb')
+
+    with LogicalReader(chunk_cache, fps) as reader:
+        yield reader
+
+    for fp in fps.values():
+        fp.close()
+
+
+def test_read(reader, copy_1):
+    assert reader.read(LOG_START + 0x10, 3 * STRIPE_LEN) == copy_1[0x10:0x10 + 3 * STRIPE_LEN]
+
+
+class TestSpread:
+    copy_1 = lambda_fixture(lambda: b'A' * CHUNK_LEN)
+    copy_2 = lambda_fixture(lambda: b'B' * CHUNK_LEN)
+
+    def test_shares_read_from_each_copy(self, reader):
+        assert reader.read(LOG_START, 2 * STRIPE_LEN) == b'A' * STRIPE_LEN + b'B' * STRIPE_LEN
+
+
+class TestReadVerified:
+    copy_1 = lambda_fixture(lambda: b'bad!' * (CHUNK_LEN // 4))
+    copy_2 = lambda_fixture(lambda: b'good' * (CHUNK_LEN // 4))
+
+    def test_first_valid_copy_wins(self, reader):
+        data = reader.read_verified(LOG_START, STRIPE_LEN, lambda data: data.startswith(b'good'))
+        assert data == b'good' * (STRIPE_LEN // 4)
+
+    def test_no_valid_copy_raises(self, reader):
+        with pytest.raises(NoValidCopyError) as excinfo:
+            reader.read_verified(LOG_START, 8, lambda data: False)
+        assert excinfo.value.copies == [b'bad!bad!', b'goodgood']
+
+
+class TestParity:
+    profile = lambda_fixture(params=[
+        pytest.param((BlockGroupFlag.RAID5, 3), id='raid5'),
+        pytest.param((BlockGroupFlag.RAID6, 4), id='raid6'),
+    ])
+    devids = lambda_fixture(lambda profile: list(range(1, profile[1] + 1)))
+    missing_devids = lambda_fixture(lambda: [])
+
+    @pytest.fixture
+    def chunk_cache(self, profile, devids) -> ChunkTreeCache:
+        cache = ChunkTreeCache()
+        cache.insert(LOG_START, LOG_START + CHUNK_LEN, STRIPE_LEN, [(devid, PHYS_START) for devid in devids],
+                     flags=BlockGroupFlag.DATA | profile[0])
+        return cache
+
+    contents = lambda_fixture(lambda: np.random.default_rng(0).integers(0, 256, CHUNK_LEN, dtype=np.uint8).tobytes())
+
+    @pytest.fixture
+    def images(self, chunk_cache, devids, contents) -> dict[int, bytearray]:
+        images = {devid: bytearray(PHYS_START + CHUNK_LEN) for devid in devids}
+
+        def write(placement, block):
+            devid, phys = placement
+            images[devid][phys:phys + len(block)] = block.tobytes()
+
+        logical = LOG_START
+        while logical < LOG_START + CHUNK_LEN:
+            row = chunk_cache.full_stripe(logical)
+            data = []
+            for placement in row.data:
+                offset = logical - LOG_START
+                data.append(np.frombuffer(contents[offset:offset + STRIPE_LEN], dtype=np.uint8))
+                write(placement, data[-1])
+                logical += STRIPE_LEN
+
+            for placement, block in zip(row.parity, (p_parity(data), q_syndrome(data))):
+                write(placement, block)
+
+        return images
+
+    @pytest.fixture
+    def reader(self, tmp_path, chunk_cache, images, missing_devids):
+        fps = {}
+        for devid, image in images.items():
+            if devid not in missing_devids:
+                path = tmp_path / f'dev{devid}.img'
+                path.write_bytes(image)
+                fps[devid] = path.open('rb')
+
+        with LogicalReader(chunk_cache, fps) as reader:
+            yield reader
+
+        for fp in fps.values():
+            fp.close()
+
+    def test_read(self, reader, contents):
+        assert reader.read(LOG_START + 0x10, CHUNK_LEN - 0x20) == contents[0x10:-0x10]
+
+    class TestMissingDevice:
+        missing_devids = lambda_fixture(lambda: [2])
+
+        def test_rebuilt_from_parity(self, reader, contents):
+            assert reader.read(LOG_START + 0x10, CHUNK_LEN - 0x20) == contents[0x10:-0x10]
+
+        def test_read_verified(self, reader, contents):
+            expected = contents[STRIPE_LEN:2 * STRIPE_LEN]
+            assert reader.read_verified(LOG_START + STRIPE_LEN, STRIPE_LEN, expected.__eq__) == expected
+
+    class TestCorrupted:
+        corrupted_units = lambda_fixture(lambda: [(2, PHYS_START)])  # column 1 of the first row
+
+        @pytest.fixture
+        def images(self, images, corrupted_units):
+            for devid, phys in corrupted_units:
+                images[devid][phys:phys + 8] = b'corrupt!'
+            return images
+
+        def test_read_verified_rebuilds(self, reader, contents):
+            expected = contents[:2 * STRIPE_LEN]
+            assert reader.read_verified(LOG_START, 2 * STRIPE_LEN, expected.__eq__) == expected
+
+        def test_unrecoverable_raises(self, reader, contents):
+            with pytest.raises(NoValidCopyError):
+                reader.read_verified(LOG_START, 2 * STRIPE_LEN, lambda data: False)
+
+    class TestCorruptedWithP:
+        profile = lambda_fixture(lambda: (BlockGroupFlag.RAID6, 4))
+
+        @pytest.fixture
+        def images(self, images):
+            # Column 0 and P of the first row
+            for devid in (1, 3):
+                images[devid][PHYS_START:PHYS_START + 8] = b'corrupt!'
+            return images
+
+        def test_read_verified_rebuilds_from_q(self, reader, contents):
+            expected = contents[:STRIPE_LEN]
+            assert reader.read_verified(LOG_START, STRIPE_LEN, expected.__eq__) == expected
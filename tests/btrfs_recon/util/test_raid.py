@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from pytest_lambda import lambda_fixture
+
+from btrfs_recon.util.raid import GF_MUL, gf_inv, gf_mul, p_parity, q_syndrome, recover
+
+NUM_DATA = 4
+
+
+def reference_q(blocks: list[np.ndarray]) -> np.ndarray:
+    q = np.zeros_like(blocks[0])
+    coefficient = 1
+    for block in blocks:
+        q ^= GF_MUL[coefficient][block]
+        coefficient = int(GF_MUL[coefficient, 2])
+    return q
+
+
+block_size = lambda_fixture(params=[
+    pytest.param(64, id='words'),
+    pytest.param(61, id='odd-length'),
+])
+data = lambda_fixture(lambda block_size: [
+    np.random.default_rng(column).integers(0, 256, block_size, dtype=np.uint8)
+    for column in range(NUM_DATA)
+])
+p = lambda_fixture(lambda data: p_parity(data))
+q = lambda_fixture(lambda data: q_syndrome(data))
+
+
+def test_q_syndrome(data, q):
+    assert q.tolist() == reference_q(data).tolist()
+
+
+@pytest.mark.parametrize('coefficient', [0, 1, 2, 0x1d, 0x80, 0xff])
+def test_gf_mul(coefficient, data):
+    assert gf_mul(coefficient, data[0]).tolist() == GF_MUL[coefficient][data[0]].tolist()
+
+
+def test_gf_inv():
+    assert all(GF_MUL[a, gf_inv(a)] == 1 for a in range(1, 256))
+
+
+@pytest.mark.parametrize('missing, use_p, use_q', [
+    pytest.param((0,), True, False, id='one-from-p'),
+    pytest.param((2,), False, True, id='one-from-q'),
+    pytest.param((0, 3), True, True, id='two-from-p-and-q'),
+    pytest.param((1, 2), True, True, id='two-adjacent-from-p-and-q'),
+])
+def test_recover(data, p, q, missing, use_p, use_q):
+    degraded = [None if column in missing else block for column, block in enumerate(data)]
+    rebuilt = recover(degraded, p if use_p else None, q if use_q else None)
+    assert [block.tolist() for block in rebuilt] == [block.tolist() for block in data]
+
+
+@pytest.mark.parametrize('missing, use_p, use_q', [
+    pytest.param((0,), False, False, id='one-without-parity'),
+    pytest.param((0, 1), True, False, id='two-from-p'),
+    pytest.param((0, 1, 2), True, True, id='three'),
+])
+def test_recover_too_much_missing_raises(data, p, q, missing, use_p, use_q):
+    degraded = [None if column in missing else block for column, block in enumerate(data)]
+    with pytest.raises(ValueError):
+        recover(degraded, p if use_p else None, q if use_q else None)
@@ -0,0 +1,50 @@
+import pytest
+
+from btrfs_recon.util.ranges import clip_ranges, invert_ranges, merge_ranges, split_ranges, subtract_ranges
+
+
+@pytest.mark.parametrize('ranges, expected', [
+    pytest.param([], [], id='empty'),
+    pytest.param([(10, 20), (0, 5)], [(0, 5), (10, 20)], id='sorted'),
+    pytest.param([(0, 10), (5, 15)], [(0, 15)], id='overlapping'),
+    pytest.param([(0, 10), (10, 15)], [(0, 15)], id='adjacent'),
+    pytest.param([(0, 20), (5, 10)], [(0, 20)], id='contained'),
+    pytest.param([(5, 5), (0, 1)], [(0, 1)], id='empty-range'),
+])
+def test_merge_ranges(ranges, expected):
+    assert expected == merge_ranges(ranges)
+
+
+@pytest.mark.parametrize('ranges, expected', [
+    pytest.param([], [(0, 100)], id='empty'),
+    pytest.param([(0, 100)], [], id='full'),
+    pytest.param([(10, 20), (50, 150)], [(0, 10), (20, 50)], id='overhanging'),
+])
+def test_invert_ranges(ranges, expected):
+    assert expected == invert_ranges(ranges, 0, 100)
+
+
+def test_clip_ranges():
+    expected = [(5, 10), (20, 25)]
+    actual = clip_ranges([(0, 10), (20, 30), (40, 50)], 5, 25)
+    assert expected == actual
+
+
+@pytest.mark.parametrize('ranges, expected', [
+    pytest.param([], [], id='empty'),
+    pytest.param([(0, 100)], [(0, 100)], id='exact'),
+    pytest.param([(0, 250)], [(0, 100), (100, 200), (200, 250)], id='multiple'),
+    pytest.param([(50, 150), (180, 220)], [(50, 100), (100, 150), (180, 200), (200, 220)], id='unaligned'),
+])
+def test_split_ranges(ranges, expected):
+    assert expected == split_ranges(ranges, 100)
+
+
+@pytest.mark.parametrize('removed, expected', [
+    pytest.param([], [(0, 50), (60, 100)], id='nothing'),
+    pytest.param([(0, 100)], [], id='everything'),
+    pytest.param([(40, 70)], [(0, 40), (70, 100)], id='spanning-gap'),
+    pytest.param([(10, 20), (80, 90)], [(0, 10), (20, 50), (60, 80), (90, 100)], id='inner'),
+])
+def test_subtract_ranges(removed, expected):
+    assert expected == subtract_ranges([(0, 50), (60, 100)], removed)